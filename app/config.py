@@ -1,28 +1,162 @@
 from functools import lru_cache
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List, Optional
+
+
+class EndpointConfig(BaseModel):
+    """One OpenAI-compatible upstream (OpenRouter, secondary provider, on-prem server)"""
+
+    name: str
+    base_url: str
+    api_keys: List[str]
+    tiers: List[str] = ["medium", "strong", "format"]
+    models: Dict[str, str] = {}  # per-tier model name overrides
 
 
 class Settings(BaseSettings):
     """Application settings"""
 
     # 🔐 Multiple OpenRouter keys
-    openrouter_api_keys: List[str]
+    openrouter_api_keys: List[str] = []
+
+    # 🌐 Extra upstream endpoints (JSON list of EndpointConfig)
+    llm_endpoints: List[EndpointConfig] = []
 
     # 🧠 Supabase
-    supabase_url: str
-    supabase_key: str
+    supabase_url: Optional[str] = None
+    supabase_key: Optional[str] = None
+
+    # 💾 Analysis store
+    storage_backend: str = "sqlite"  # "sqlite", "supabase" or "none"
+    storage_path: str = "data/analyses.db"
+    storage_batch_size: int = 50
+    storage_flush_interval_seconds: float = 1.0
+    storage_max_queue: int = 10000
 
     # 🤖 Models
     medium_model: str = "meta-llama/llama-4-scout"
     strong_model: str = "meta-llama/llama-4-scout"
     format_model: str = "meta-llama/llama-4-scout"
 
+    # 🔌 LLM backend and connection pool
+    llm_backend: str = "httpx"  # "httpx" (direct), "langchain" or "fake" (canned, in-process)
+    llm_http2: bool = True
+    llm_timeout_seconds: float = 120.0
+    llm_max_connections: int = 100
+    llm_max_keepalive_connections: int = 20
+    llm_keepalive_expiry_seconds: float = 60.0
+    fake_llm_outputs: Dict[str, str] = {}  # stage -> canned reply for the "fake" backend
+    fake_llm_latency_seconds: Dict[str, float] = {}  # stage (or "default") -> fixed delay
+
+    # 🤝 State shared by all workers on the host
+    shared_state_path: str = "data/shared_state.db"  # "" = in memory, per process
+    llm_key_rpm: float = 0  # requests per minute per API key across workers, 0 = unlimited
+    llm_key_cooldown_seconds: float = 30.0  # key rest after a 429 without Retry-After
+    dedup_wait_seconds: float = 300.0  # how long a duplicate study waits for the worker running it
+    result_cache_ttl_seconds: float = 0.0  # reuse results of identical studies, 0 = only while in flight
+
+    # 🚦 Endpoint health and failover
+    llm_max_attempts: int = 3  # endpoints tried per call
+    llm_latency_ewma_alpha: float = 0.2
+    llm_health_window: int = 20  # recent calls used for error rate
+    llm_failure_threshold: int = 3  # consecutive failures before cooldown
+    llm_cooldown_seconds: float = 30.0
+    llm_probe_ratio: float = 0.05  # share of calls sent to a non-fastest endpoint
+
     # ⚙️ App config
     environment: str = "development"
     debug: bool = False
     log_level: str = "INFO"    
     
+    # 🏥 Tenants (diagnostic centres)
+    pipeline_concurrency: int = 16  # studies running at once, shared fairly across tenants
+    tenant_rate_per_minute: float = 30.0  # 0 = tenant disabled (every request gets a 429)
+    tenant_burst: float = 10.0
+    tenant_daily_spend_limit: float = 0.0  # USD, 0 = unlimited
+    tenant_overrides: Dict[str, Dict[str, float]] = {}  # tenant -> rate_per_minute/burst/daily_spend_limit/weight
+
+    # 📴 Client disconnects
+    cancel_on_disconnect: bool = True  # stop the pipeline when the client goes away
+    disconnect_poll_seconds: float = 0.5
+
+    # 🚦 Readiness (/ready returns 503 past any of these)
+    ready_max_queue_depth: int = 64  # studies waiting for a pipeline slot
+    ready_max_error_rate: float = 0.5  # per tier, once routing_min_samples calls are recorded
+    ready_max_rate_limited_rate: float = 0.5  # share of a tier's recent attempts answered with 429
+    ready_max_p95_latency_seconds: float = 0.0  # per tier, 0 = not checked
+    ready_require_available_key: bool = True  # not ready while every API key is cooling down
+
+    # 🔂 Idempotency keys
+    idempotency_path: str = "data/idempotency.db"
+    idempotency_ttl_seconds: float = 86400.0  # how long results are replayable
+    idempotency_lease_seconds: float = 30.0  # pending key lease, renewed while the request runs; lapses if a worker dies
+    idempotency_wait_seconds: float = 60.0  # wait for a retry's original running in another worker
+
+    # 🗄️ Per-stage LLM response cache (on disk, survives restarts)
+    llm_cache_stages: List[str] = []  # stages to cache, e.g. ["triage", "findings", "report"]
+    llm_cache_path: str = "data/llm_cache.db"
+    llm_cache_max_mb: float = 512.0  # least recently used entries are evicted beyond this
+
+    # 🔭 Tracing (OTLP/JSON)
+    tracing_export_path: Optional[str] = None  # e.g. "data/traces.jsonl"
+    tracing_otlp_endpoint: Optional[str] = None  # e.g. "http://localhost:4318/v1/traces"
+    tracing_service_name: str = "xray-api"
+
+    # 🐢 Event-loop monitor
+    loop_monitor_enabled: bool = True
+    loop_monitor_interval_seconds: float = 0.05  # heartbeat period; lag is how late each beat wakes
+    loop_block_threshold_seconds: float = 0.25  # log the loop thread's stack past this stall
+
+    # 🌗 Shadow evaluation of candidate models
+    shadow_models: Dict[str, str] = {}  # tier -> candidate model, e.g. {"medium": "google/gemini-2.0-flash-001"}
+    shadow_sample_rate: float = 0.0  # share of a tier's calls replayed against its candidate
+    shadow_concurrency: int = 2  # replays running at once (and their own connection pool size)
+    shadow_max_queue: int = 100  # pending replays; more are dropped
+    shadow_rpm: float = 10.0  # replays per minute per worker; each also counts against LLM_KEY_RPM
+    shadow_results_path: str = "data/shadow.jsonl"
+
+    # 🔬 Profiling (off unless a token or sample rate is set)
+    profiling_token: Optional[str] = None  # requests with a matching X-Profile header are profiled
+    profiling_sample_rate: float = 0.0  # share of requests profiled without the header
+    profiling_dir: str = "data/profiles"
+    profiling_lag_interval_seconds: float = 0.01  # event-loop lag sampling period while profiling
+
+    # 🧱 Partial results
+    stage_timeout_seconds: Dict[str, float] = {"triage": 60.0, "findings": 180.0, "report": 90.0}
+    study_blob_path: str = "data/studies"  # inputs of partial studies, for resuming
+    study_blob_ttl_seconds: float = 7 * 86400.0
+
+    # 🧬 Pipeline stage graph
+    pipeline_stages: Dict[str, List[str]] = {}  # image_type -> stages, e.g. {"limb": ["triage", "findings"]}
+    stage_concurrency: Dict[str, int] = {}  # stage -> studies running it at once, e.g. {"findings": 8}
+    stage_cache_ttl_seconds: float = 0.0  # reuse cacheable stage results for identical inputs, 0 = off
+
+    # 🖼️ Studies
+    max_images_per_study: int = 4
+
+    # 🧭 Findings model routing
+    routing_policy: str = "slo"  # "static" (triage rule only) or "slo" (also live tier health)
+    routing_window: int = 50  # recent calls per tier used for p95 latency and error rate
+    routing_min_samples: int = 10  # calls needed before the strong tier can be judged unhealthy
+    routing_max_sample_age_seconds: float = 300.0  # older calls are forgotten (0 = never), so idle tiers recover
+    strong_latency_slo_seconds: float = 30.0  # p95 target for the strong tier
+    strong_max_error_rate: float = 0.25
+    strong_max_in_flight: int = 32  # strong-tier calls running at once
+    routing_breach_action: str = "downgrade"  # "downgrade" to medium or "defer" until strong recovers
+    routing_defer_seconds: float = 10.0  # longest a deferred case waits before downgrading
+    routing_probe_ratio: float = 0.05  # shed cases still sent to strong during a breach, to see it recover
+
+    # 🧩 Prompts
+    prompt_cache_control: bool = False  # add cache_control breakpoints after static prompt parts
+    prompt_variants: Dict[str, str] = {}  # tier -> "full" | "compact", e.g. {"medium": "compact"}
+
+    # 🩻 Triage
+    triage_json_mode: bool = True  # request provider JSON output for triage
+    triage_batch_size: int = 8  # images per batched call on /api/v1/triage
+    triage_batch_max_wait_seconds: float = 0.05  # how long a batch waits to fill
+    triage_max_images_per_request: int = 100
+
     # 🎯 Thresholds
     confidence_threshold: float = 0.85
     max_cost_per_xray: float = 0.10
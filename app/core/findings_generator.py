@@ -1,23 +1,36 @@
 """X-ray report generation"""
-from typing import Dict
-from langchain.schema import HumanMessage
-from app.services.llm_provider import llm_provider
+import asyncio
+import time
+from functools import lru_cache
+from typing import Dict, List
+from app.core.routing_policy import MODEL_NAMES, get_routing_policy
+from app.services.llm_provider import get_llm_provider
 from app.prompts.findings_prompt import XrayFindingsPrompts
+from app.utils.messages import image_parts, text_part
 from app.utils.logger import logger
+from app.utils.metrics import metrics
+from app.utils.tracing import current_span
 from app.config import get_settings
 
-settings = get_settings()
+# How often a deferred case re-checks the strong tier
+DEFER_POLL_SECONDS = 1.0
+
+# Rough per-study findings cost (USD) by model
+FINDINGS_COST = {"haiku": 0.02, "sonnet": 0.06}
 
 class FindingsGenerator:
     """Generates X-ray reports using appropriate model"""
     
     def __init__(self):
-        self.medium = llm_provider.medium
-        self.strong = llm_provider.strong
+        self.settings = get_settings()
+        self.llm_provider = get_llm_provider()
+        self.medium = self.llm_provider.medium
+        self.strong = self.llm_provider.strong
+        self.routing_policy = get_routing_policy()
     
     async def generate_findings(
         self,
-        image_base64: str,
+        images: List[str],
         image_type: str,
         triage_info: Dict,
         patient_age: int = None,
@@ -27,7 +40,7 @@ class FindingsGenerator:
         Generate X-ray findings using appropriate model
         
         Args:
-            image_base64: Base64 encoded image
+            images: Base64 data URLs, one per view (e.g. PA + lateral)
             image_type: "chest", "limb", etc.
             triage_info: Triage assessment from TriageEngine
         
@@ -35,25 +48,35 @@ class FindingsGenerator:
             {
                 "report": str (full formatted report),
                 "model_used": "haiku" | "sonnet",
+                "routing": {"tier", "action", "reason", "deferred_seconds"},
                 "cost": float,
+                "usage": dict,
                 "triage_info": dict
             }
         """
         try:
             # Decide which model to use
-            model, model_name = self._select_model(triage_info)
+            model, model_name, routing = await self._select_model(triage_info)
             
             # Get prompt
             xray_prompts = XrayFindingsPrompts(patient_age, clinical_indications, triage_info=triage_info)
             
             
+            prompt_variant = self.settings.prompt_variants.get(model.model_type, "full")
             prompts = xray_prompts.get_findings_prompt(
-            image_type=image_type
+            image_type=image_type,
+            variant=prompt_variant
             )
 
             system = prompts["system"]
             user = prompts["user"]
-            print(f"system prompt: {system}  \n\nuser prompt: {user}  \n\nimage_type: {image_type}  \n\ntriage_info: {triage_info}")
+            # Lazy arguments: the prompts are only rendered when DEBUG is on
+            logger.debug(
+                "system prompt: %s  \n\nuser prompt: %s  \n\nimage_type: %s  \n\ntriage_info: %s",
+                system, user, image_type, triage_info,
+            )
+            # Static instructions, then the images, then per-patient details:
+            # the shared prefix is what provider prompt caching can reuse
             # Build messages
             messages = [
                 {
@@ -63,22 +86,15 @@ class FindingsGenerator:
                 {
                     "role": "user",
                     "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_base64}"
-                            }
-                        },
-                        {
-                            "type": "text",
-                            "text": user
-                        }
+                        text_part(prompts["user_static"], cacheable=True),
+                        *image_parts(images),
+                        text_part(prompts["user_dynamic"])
                     ]
                 }
             ]
             
             # Generate report
-            response = await model.ainvoke(messages)
+            response = await model.ainvoke(messages, cache_stage="findings", cache_if=str.strip)
             
             # Calculate cost
             cost = self._calculate_cost(model_name, response)
@@ -88,7 +104,10 @@ class FindingsGenerator:
             return {
                 "findings": response.content,
                 "model_used": model_name,
+                "routing": routing,
                 "cost": cost,
+                "usage": response.token_usage(),
+                "prompt_variant": prompt_variant,
                 "triage_info": triage_info
             }
             
@@ -96,31 +115,37 @@ class FindingsGenerator:
             logger.error(f"Report generation error: {e}")
             raise
     
-    def _select_model(self, triage_info: Dict) -> tuple:
-        """Select appropriate model based on triage"""
+    async def _select_model(self, triage_info: Dict) -> tuple:
+        """Select appropriate model based on triage and live tier health"""
         
-        confidence = triage_info.get("confidence", 0)
-        complexity = triage_info.get("complexity", "complex")
-        urgency = triage_info.get("urgency", "urgent")
+        start = time.monotonic()
+        decision = self.routing_policy.decide(triage_info, self.llm_provider.tier_health())
+        
+        # Deferred: wait for the strong tier to recover (the policy
+        # downgrades once the case has waited long enough)
+        while decision["action"] == "defer":
+            await asyncio.sleep(DEFER_POLL_SECONDS)
+            decision = self.routing_policy.decide(
+                triage_info, self.llm_provider.tier_health(), deferred_for=time.monotonic() - start
+            )
+        decision["deferred_seconds"] = round(time.monotonic() - start, 3)
         
-        # Use Haiku for simple, high-confidence cases
-        if (confidence >= settings.confidence_threshold and 
-            complexity == "simple" and 
-            urgency == "normal"):
-            logger.info("Using Haiku for routine case")
-            return self.medium, "haiku"
+        metrics.increment("routing_decisions", tier=decision["tier"], action=decision["action"], reason=decision["reason"])
+        span = current_span()
+        if span is not None:
+            span.set_attributes(routing_tier=decision["tier"], routing_action=decision["action"], routing_reason=decision["reason"])
         
-        # Use Sonnet for everything else
-        logger.info("Using Sonnet for complex/urgent case")
-        return self.strong, "sonnet"
+        model_name = MODEL_NAMES[decision["tier"]]
+        logger.info(f"Using {model_name} ({decision['action']}: {decision['reason']})")
+        model = self.strong if decision["tier"] == "strong" else self.medium
+        return model, model_name, decision
     
     def _calculate_cost(self, model_name: str, response) -> float:
         """Estimate API cost"""
         # Rough estimates based on token usage
-        if model_name == "haiku":
-            return 0.02
-        else:  # sonnet
-            return 0.06
+        return FINDINGS_COST[model_name]
 
-# Global instance
-findings_generator = FindingsGenerator()
\ No newline at end of file
+@lru_cache(maxsize=1)
+def get_findings_generator() -> FindingsGenerator:
+    """Lazily constructed global instance"""
+    return FindingsGenerator()
\ No newline at end of file
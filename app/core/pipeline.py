@@ -0,0 +1,208 @@
+"""Declarative stage graph for the analysis pipeline
+
+Each ``Stage`` names the study fields and stage outputs it reads and the
+output it writes. A ``Pipeline`` starts every stage as soon as its inputs
+exist, so independent stages run concurrently, and skips stages whose
+inputs failed. Which stages run is chosen per image type (PIPELINE_STAGES).
+"""
+import asyncio
+import hashlib
+import json
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from app.config import get_settings
+from app.services.shared_state import get_shared_state
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+from app.utils.tracing import span
+
+# Study fields every stage may read
+STUDY_INPUTS = ("images", "image_type", "patient_age", "clinical_indications")
+
+FAILED = ("failed", "timeout", "skipped")
+
+# Per-call bookkeeping in stage results, left out of stage cache keys
+ACCOUNTING_FIELDS = ("cost", "usage")
+
+
+class RequiredStageFailed(Exception):
+    """A stage the study cannot do without (e.g. triage) failed"""
+
+
+class Stage:
+    """
+    One step of the pipeline
+
+    Args:
+        name: Stage name, used for status, timings, spans and settings
+        run: ``async run(inputs) -> result``; ``inputs`` maps each declared
+            input to its value. A result of None counts as a failure
+        inputs: Study fields and outputs of other stages this stage reads
+        output: Key the result is stored under (defaults to ``name``)
+        required: Abort the study when this stage fails
+        timeout: Seconds, None for no limit
+        concurrency: Studies running this stage at once, 0 = unlimited
+        cacheable: Results may be reused for identical inputs (shared
+            across workers for STAGE_CACHE_TTL_SECONDS, when set)
+        describe: Span attributes to record from a result
+    """
+
+    def __init__(
+        self,
+        name: str,
+        run: Callable[[Dict], Awaitable],
+        inputs: Iterable[str] = (),
+        output: str = None,
+        required: bool = False,
+        timeout: Optional[float] = None,
+        concurrency: int = 0,
+        cacheable: bool = False,
+        describe: Callable[[Dict], Dict] = None,
+    ):
+        self.name = name
+        self.run = run
+        self.inputs = tuple(inputs)
+        self.output = output or name
+        self.required = required
+        self.timeout = timeout
+        self.cacheable = cacheable
+        self.describe = describe
+        self._slots = asyncio.Semaphore(concurrency) if concurrency else None
+
+
+class Pipeline:
+    """Stages of one image type, validated as a graph"""
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = stages
+        self.producers = {stage.output: stage for stage in stages}
+        self._validate()
+
+    @property
+    def names(self) -> List[str]:
+        return [stage.name for stage in self.stages]
+
+    def _validate(self) -> None:
+        """Raise ValueError on unknown inputs, duplicate outputs or cycles"""
+        if len(self.producers) != len(self.stages):
+            raise ValueError(f"Two stages write the same output: {self.names}")
+        for stage in self.stages:
+            for name in stage.inputs:
+                if name not in STUDY_INPUTS and name not in self.producers:
+                    raise ValueError(f"Stage {stage.name} reads {name!r}, which no stage in {self.names} produces")
+
+        resolved = set(STUDY_INPUTS)
+        pending = list(self.stages)
+        while pending:
+            ready = [stage for stage in pending if all(name in resolved for name in stage.inputs)]
+            if not ready:
+                raise ValueError(f"Stage inputs form a cycle: {[stage.name for stage in pending]}")
+            for stage in ready:
+                resolved.add(stage.output)
+                pending.remove(stage)
+
+    async def run(self, study: Dict, state: Dict) -> None:
+        """
+        Run every stage whose output is missing from ``state``
+
+        ``study`` holds the STUDY_INPUTS. Results, statuses and timings are
+        written to ``state[output]``, ``state["stages"]`` and
+        ``state["timings"]``.
+
+        Raises:
+            RequiredStageFailed: a required stage failed (others are cancelled)
+        """
+        pending = [stage for stage in self.stages if state.get(stage.output) is None]
+        running: Dict[asyncio.Task, Stage] = {}
+        try:
+            while pending or running:
+                progressed = False
+                for stage in list(pending):
+                    upstream = [self.producers[name] for name in stage.inputs if name in self.producers]
+                    if any(state["stages"].get(s.name) in FAILED for s in upstream):
+                        pending.remove(stage)
+                        state["stages"][stage.name] = "skipped"
+                        progressed = True
+                    elif all(state.get(s.output) is not None for s in upstream):
+                        pending.remove(stage)
+                        inputs = {name: study[name] if name in STUDY_INPUTS else state[name] for name in stage.inputs}
+                        running[asyncio.create_task(self._run_stage(stage, inputs, state))] = stage
+                        progressed = True
+                if not running:
+                    if progressed:
+                        continue  # only skips happened; re-check what they unblock
+                    break
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    stage = running.pop(task)
+                    state[stage.output] = task.result()
+                    if state[stage.output] is None and stage.required:
+                        raise RequiredStageFailed(f"Stage {stage.name} {state['stages'][stage.name]}")
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+    async def _run_stage(self, stage: Stage, inputs: Dict, state: Dict):
+        """Run one stage under its timeout and concurrency limit; its result, or None if it failed"""
+        result = None
+        with span(stage.name, stage=stage.name) as stage_span:
+            try:
+                cache_key = _stage_cache_key(stage, inputs) if stage.cacheable else None
+                result = await _cached(cache_key) if cache_key else None
+                if result is None:
+                    logger.info(f"Running stage {stage.name}")
+                    result = await self._call(stage, inputs)
+                    if cache_key and result is not None:
+                        await _store(cache_key, result)
+                else:
+                    stage_span.set_attribute("cached", True)
+                state["stages"][stage.name] = "ok" if result is not None else "failed"
+            except asyncio.TimeoutError:
+                state["stages"][stage.name] = "timeout"
+                stage_span.error = "timeout"
+            except Exception as e:
+                state["stages"][stage.name] = "failed"
+                stage_span.error = f"{type(e).__name__}: {e}"
+            if result is not None and stage.describe:
+                stage_span.set_attributes(**stage.describe(result))
+
+        state["timings"][stage.name] = stage_span.duration
+        if result is None:
+            metrics.increment("stage_failures", stage=stage.name, status=state["stages"][stage.name])
+            logger.warning(f"Stage {stage.name} {state['stages'][stage.name]}: {stage_span.error}")
+        return result
+
+    @staticmethod
+    async def _call(stage: Stage, inputs: Dict):
+        """The timeout starts once a concurrency slot is free"""
+        if stage._slots is None:
+            return await asyncio.wait_for(stage.run(inputs), stage.timeout)
+        async with stage._slots:
+            return await asyncio.wait_for(stage.run(inputs), stage.timeout)
+
+
+def _stage_cache_key(stage: Stage, inputs: Dict) -> Optional[str]:
+    if get_settings().stage_cache_ttl_seconds <= 0:
+        return None
+    content = {
+        name: {k: v for k, v in value.items() if k not in ACCOUNTING_FIELDS} if isinstance(value, dict) else value
+        for name, value in inputs.items()
+    }
+    digest = hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+    return f"stage:{stage.name}:{digest}"
+
+
+async def _cached(key: str):
+    result = await asyncio.to_thread(get_shared_state().get, key)
+    metrics.increment("stage_cache", stage=key.split(":")[1], outcome="hit" if result is not None else "miss")
+    if isinstance(result, dict):
+        # Nothing was spent this time; usage totals must not count the original call again
+        result = {**result, **{field: 0.0 if field == "cost" else {} for field in ACCOUNTING_FIELDS if field in result}}
+    return result
+
+
+async def _store(key: str, result) -> None:
+    await asyncio.to_thread(get_shared_state().put, key, result, get_settings().stage_cache_ttl_seconds)
@@ -1,16 +1,22 @@
 """X-ray report drafting logic"""
 
+from functools import lru_cache
 from typing import Dict
-from app.services.llm_provider import llm_provider
+from app.services.llm_provider import get_llm_provider
 from app.prompts.report_prompts import report_prompts
 from app.utils.logger import logger
+from app.config import get_settings
+
+# Approximate report-generation cost (USD)
+REPORT_COST = 0.02
 
 
 class ReportEngine:
     """Handles drafting of radiology reports from structured findings"""
 
     def __init__(self):
-        self.llm = llm_provider.format
+        self.settings = get_settings()
+        self.llm = get_llm_provider().format
 
     async def generate_report(
         self,
@@ -36,7 +42,10 @@ class ReportEngine:
             }
         """
         try:
-            prompt = report_prompts.get_report_prompt(image_type=image_type)
+            prompt = report_prompts.get_report_prompt(
+                image_type=image_type,
+                variant=self.settings.prompt_variants.get("format", "full")
+            )
 
             messages = [
                 {
@@ -49,7 +58,7 @@ class ReportEngine:
                 }
             ]
 
-            response = await self.llm.ainvoke(messages)
+            response = await self.llm.ainvoke(messages, cache_stage="report", cache_if=str.strip)
 
             report_text = response.content.strip()
 
@@ -58,24 +67,17 @@ class ReportEngine:
             return {
                 "report": report_text,
                 "triage": triage_info,
-                "cost": 0.02          # approx report-generation cost
+                "cost": REPORT_COST,
+                "usage": response.token_usage()
             }
 
         except Exception as e:
+            # The router reports the stage as failed and keeps earlier results
             logger.error(f"Report generation error: {e}")
-
-            return {
-                "report": (
-                    "EXAMINATION:\n"
-                    "Unable to generate report\n\n"
-                    "IMPRESSION:\n"
-                    "Automated report generation failed. "
-                    "Immediate radiologist review advised."
-                ),
-                "triage": triage_info,
-                "cost": 0.02
-            }
+            raise
 
 
-# Global instance
-report_engine = ReportEngine()
+@lru_cache(maxsize=1)
+def get_report_engine() -> ReportEngine:
+    """Lazily constructed global instance"""
+    return ReportEngine()
@@ -1,89 +1,318 @@
 """Main orchestration logic"""
-from typing import Dict
-from app.core import findings_generator
-from app.core.triage import triage_engine
-from app.core.findings_generator import findings_generator
-from app.core.report_generator import report_engine
+import time
+import uuid
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, List
+from app.config import get_settings
+from app.core.pipeline import Pipeline, Stage
+from app.core.triage import get_triage_engine
+from app.core.findings_generator import FINDINGS_COST, get_findings_generator
+from app.core.report_generator import REPORT_COST, get_report_engine
+from app.services.storage import get_analysis_writer, get_study_blob_store
+from app.utils.images import study_digest
 from app.utils.logger import logger
+from app.utils.metrics import metrics
+from app.utils.tracing import span
+
+# Stages of image types without a PIPELINE_STAGES entry
+STAGES = ("triage", "findings", "report")
+
+# Study fields kept unchanged when a resumed study is stored again
+STUDY_FIELDS = ("study_id", "created_at", "centre_id", "image_type", "image_count", "inputs_digest")
+
+
+class StudyNotResumable(Exception):
+    """Stored study cannot be resumed (storage disabled or its images are gone)"""
+
 
 class XRayRouter:
     """Orchestrates X-ray analysis pipeline"""
-    
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.triage_engine = get_triage_engine()
+        self.findings_generator = get_findings_generator()
+        self.report_engine = get_report_engine()
+        self.analysis_writer = get_analysis_writer()
+        self.blob_store = get_study_blob_store()
+
+        self.stages: Dict[str, Stage] = {}
+        self._pipelines: Dict[str, Pipeline] = {}
+        for stage in self._default_stages():
+            self.register_stage(stage)
+        # Fail on startup, not on the first study, if a configured graph is invalid
+        for image_type in self.settings.pipeline_stages:
+            self.pipeline_for(image_type)
+
+    def _default_stages(self) -> List[Stage]:
+        timeouts = self.settings.stage_timeout_seconds
+        concurrency = self.settings.stage_concurrency
+        return [
+            # Falls back to urgent/complex on model errors, so a study only
+            # stops here on a timeout. Not cacheable: fallbacks must not stick
+            Stage(
+                "triage",
+                lambda s: self.triage_engine.triage_xray(s["images"], s["image_type"]),
+                inputs=("images", "image_type"),
+                required=True,
+                timeout=timeouts.get("triage"),
+                concurrency=concurrency.get("triage", 0),
+                describe=lambda r: {"urgency": r["urgency"]},
+            ),
+            Stage(
+                "findings",
+                lambda s: self.findings_generator.generate_findings(
+                    s["images"], s["image_type"], s["triage"], s["patient_age"], s["clinical_indications"]
+                ),
+                inputs=("images", "image_type", "triage", "patient_age", "clinical_indications"),
+                timeout=timeouts.get("findings"),
+                concurrency=concurrency.get("findings", 0),
+                cacheable=True,
+                describe=lambda r: {"model_used": r["model_used"]},
+            ),
+            Stage(
+                "report",
+                lambda s: self.report_engine.generate_report(
+                    findings_payload=s["findings"]["findings"],
+                    image_type=s["image_type"],
+                    triage_info=s["triage"]
+                ),
+                inputs=("findings", "image_type", "triage"),
+                timeout=timeouts.get("report"),
+                concurrency=concurrency.get("report", 0),
+                cacheable=True,
+            ),
+        ]
+
+    def register_stage(self, stage: Stage) -> None:
+        """Add (or replace) a stage that PIPELINE_STAGES can refer to"""
+        self.stages[stage.name] = stage
+        self._pipelines.clear()
+
+    def pipeline_for(self, image_type: str) -> Pipeline:
+        """
+        Stage graph for a (resolved) image type
+
+        Raises:
+            ValueError: unknown stage names or an invalid graph
+        """
+        pipeline = self._pipelines.get(image_type)
+        if pipeline is None:
+            names = self.settings.pipeline_stages.get(image_type, STAGES)
+            unknown = [name for name in names if name not in self.stages]
+            if unknown:
+                raise ValueError(f"Unknown stages for {image_type}: {unknown}")
+            pipeline = Pipeline([self.stages[name] for name in names])
+            self._pipelines[image_type] = pipeline
+        return pipeline
+
     async def analyze_xray(
         self,
-        image_base64: str,
+        images: List[str],
         image_type: str = "chest_single",
         patient_age: int = None,
         clinical_indications: str = None,
+        centre_id: str = None,
+        inputs_digest: str = None,
     ) -> Dict:
         """
         Complete X-ray analysis pipeline
-        
-        Pipeline:
+
+        All views of a study (``images``, base64 data URLs) go through a
+        single triage call and a single findings call.
+
+        Pipeline (the default graph; see PIPELINE_STAGES):
         1. Triage (Haiku - fast, cheap)
         2. Route to appropriate model
         3. Generate report (Haiku or Sonnet)
         4. Return structured result
-        
+
+        If a stage after triage fails or times out, the stages that did
+        complete are returned with ``status`` "partial", and the study can be
+        finished later with ``resume``.
+
+        ``inputs_digest`` is the ``study_digest`` of the inputs when the
+        caller already has it (the API computes it for dedup); it is not
+        computed twice.
+
         Returns:
             {
+                "study_id": str,
+                "status": "complete" | "partial",
+                "stages": {"triage": "ok", "findings": "ok" | "failed" | "timeout" | "skipped", ...},
                 "triage": {...},
-                "report": str,
-                "model_used": str,
+                "findings": str | None,
+                "report": str | None,
+                "model_used": str | None,
+                "routing": {...},
                 "total_cost": float,
+                "usage": {"triage": {...}, "findings": {...}, "report": {...}},
                 "processing_time": float
             }
         """
-        import time
         start_time = time.time()
-        
+        # Over the requested image type, as the API computes it
+        inputs_digest = inputs_digest or study_digest(images, image_type, patient_age, clinical_indications)
+        image_type = self._resolve_image_type(image_type, len(images))
+        pipeline = self.pipeline_for(image_type)
+        study = {
+            "study_id": uuid.uuid4().hex,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "centre_id": centre_id,
+            "image_type": image_type,
+            "image_count": len(images),
+            "inputs_digest": inputs_digest,
+        }
+        state = {"stages": {}, "timings": {}}
+
         try:
-            # Step 1: Triage
-            logger.info("Step 1: Triaging X-ray...")
-            triage_result = await triage_engine.triage_xray(
-                image_base64, 
-                image_type
-            )
-            
-            # Step 2: Generate findings
-            logger.info(f"Step 2: Generating findings (urgency: {triage_result['urgency']})...")
-            findings_result = await findings_generator.generate_findings(
-                image_base64,
-                image_type,
-                triage_result,
-                patient_age,
-                clinical_indications
-            )
-            
-            # Step 3: Generate full report
-            logger.info("Step 3: Generating full report...")
-            report_result = await report_engine.generate_report(
-                findings_payload=findings_result["findings"],
-                image_type=image_type,
-                triage_info=triage_result
-            )
-            
-            # Calculate totals
-            total_cost = triage_result["cost"] + findings_result["cost"] + report_result["cost"]
+            with span("pipeline", study_id=study["study_id"], image_type=image_type, image_count=len(images)) as pipeline_span:
+                await pipeline.run({
+                    "images": images,
+                    "image_type": image_type,
+                    "patient_age": patient_age,
+                    "clinical_indications": clinical_indications,
+                }, state)
+
             processing_time = time.time() - start_time
-            
+            state["timings"]["total"] = processing_time
+            result = self._build_result(study, state, pipeline, processing_time)
+            pipeline_span.set_attributes(total_cost=result["total_cost"], status=result["status"])
+
             logger.info(
-                f"Analysis complete: {findings_result['model_used']}, "
-                f"${total_cost:.4f}, {processing_time:.2f}s"
+                f"Analysis {result['status']}: {result['model_used']}, "
+                f"${result['total_cost']:.4f}, {processing_time:.2f}s"
             )
-            
-            return {
-                "triage": triage_result,
-                "findings": findings_result["findings"],
-                "report": report_result["report"],
-                "model_used": findings_result["model_used"],
-                "total_cost": total_cost,
-                "processing_time": processing_time
-            }
-            
+
+            if result["status"] == "partial" and self.analysis_writer.repository is not None:
+                await self.blob_store.save(study["study_id"], images, {
+                    "patient_age": patient_age,
+                    "clinical_indications": clinical_indications,
+                })
+            self._persist(study, state, result)
+
+            return result
+
         except Exception as e:
             logger.error(f"Analysis pipeline error: {e}")
             raise
 
-# Global instance
-xray_router = XRayRouter()
\ No newline at end of file
+    async def resume(self, study_id: str) -> Dict:
+        """
+        Run the stages a partial study is missing, from its stored results
+
+        Raises:
+            LookupError: no stored study with this id
+            StudyNotResumable: storage is disabled or the study's images are gone
+        """
+        repository = self.analysis_writer.repository
+        if repository is None:
+            raise StudyNotResumable("Analysis storage is disabled")
+
+        await self.analysis_writer.flush()
+        record = await repository.get(study_id)
+        if record is None:
+            raise LookupError(f"Unknown study {study_id}")
+
+        pipeline = self.pipeline_for(record["image_type"])
+        state = self._state_from_record(record, pipeline)
+        if self._complete(state, pipeline):
+            return self._build_result(record, state, pipeline, state["timings"].get("total", 0.0))
+
+        inputs = await self.blob_store.load(study_id)
+        if inputs is None:
+            raise StudyNotResumable(f"Stored images for study {study_id} have expired")
+
+        start_time = time.time()
+        with span("resume", study_id=study_id):
+            await pipeline.run({
+                "images": inputs["images"],
+                "image_type": record["image_type"],
+                "patient_age": inputs["patient_age"],
+                "clinical_indications": inputs["clinical_indications"],
+            }, state)
+        processing_time = time.time() - start_time
+        state["timings"]["total"] = state["timings"].get("total", 0.0) + processing_time
+
+        result = self._build_result(record, state, pipeline, processing_time)
+        metrics.increment("study_resumes", status=result["status"])
+        logger.info(f"Resumed study {study_id}: {result['status']}")
+
+        if result["status"] == "complete":
+            await self.blob_store.delete(study_id)
+        self._persist(record, state, result)
+        return result
+
+    @staticmethod
+    def _complete(state: Dict, pipeline: Pipeline) -> bool:
+        return all(state["stages"].get(name) == "ok" for name in pipeline.names)
+
+    @classmethod
+    def _build_result(cls, study: Dict, state: Dict, pipeline: Pipeline, processing_time: float) -> Dict:
+        outputs = {stage.name: state.get(stage.output) for stage in pipeline.stages}
+        triage, findings, report = outputs.get("triage"), outputs.get("findings"), outputs.get("report")
+        return {
+            "study_id": study["study_id"],
+            "status": "complete" if cls._complete(state, pipeline) else "partial",
+            "stages": state["stages"],
+            "triage": triage,
+            "findings": findings["findings"] if findings else None,
+            "report": report["report"] if report else None,
+            "model_used": findings["model_used"] if findings else None,
+            "routing": findings.get("routing") if findings else None,
+            "total_cost": sum(
+                output.get("cost", 0.0) for output in outputs.values() if isinstance(output, dict)
+            ),
+            "usage": {
+                name: output.get("usage", {}) if isinstance(output, dict) else {}
+                for name, output in outputs.items()
+            },
+            "processing_time": processing_time
+        }
+
+    @staticmethod
+    def _state_from_record(record: Dict, pipeline: Pipeline) -> Dict:
+        """Stage results of a stored study, as ``Pipeline.run`` expects them"""
+        stages = record.get("stages") or dict.fromkeys(STAGES, "ok")  # stored before stages existed
+        usage = record.get("usage") or {}
+        state = {"stages": {}, "timings": dict(record.get("timings") or {}), "triage": record["triage"]}
+        if stages.get("findings") == "ok":
+            state["findings"] = {
+                "findings": record["findings"],
+                "model_used": record["model_used"],
+                "cost": FINDINGS_COST.get(record["model_used"], 0.0),
+                "usage": usage.get("findings", {}),
+            }
+        if stages.get("report") == "ok":
+            state["report"] = {"report": record["report"], "cost": REPORT_COST, "usage": usage.get("report", {})}
+        # Outputs of other stages are not stored, so those stages run again
+        for stage in pipeline.stages:
+            if state.get(stage.output) is not None:
+                state["stages"][stage.name] = "ok"
+        return state
+
+    def _persist(self, study: Dict, state: Dict, result: Dict) -> None:
+        """Persist in the background; never delays the response"""
+        if result["status"] == "complete":
+            metrics.observe("study_tokens", sum(
+                u.get("prompt_tokens", 0) + u.get("completion_tokens", 0) for u in result["usage"].values()
+            ))
+        self.analysis_writer.submit({
+            **result,
+            **{field: study[field] for field in STUDY_FIELDS},
+            "urgency": (state.get("triage") or {}).get("urgency"),
+            "timings": state["timings"],
+        })
+
+    @staticmethod
+    def _resolve_image_type(image_type: str, image_count: int) -> str:
+        """Two chest views are analysed together as a PA + lateral study"""
+        if image_type in ("chest", "chest_single") and image_count == 2:
+            return "chest_pa_lateral"
+        return image_type
+
+@lru_cache(maxsize=1)
+def get_xray_router() -> XRayRouter:
+    """Lazily constructed global instance"""
+    return XRayRouter()
\ No newline at end of file
@@ -0,0 +1,110 @@
+"""Choosing the findings model tier from triage and live tier health"""
+import random
+from functools import lru_cache
+from typing import Dict
+
+from app.config import Settings, get_settings
+
+# Findings tier -> model name reported in results
+MODEL_NAMES = {"medium": "haiku", "strong": "sonnet"}
+
+
+class StaticRoutingPolicy:
+    """Triage-only rule: routine, simple, confident cases go to the medium tier"""
+
+    name = "static"
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+
+    def baseline(self, triage_info: Dict) -> Dict:
+        confidence = triage_info.get("confidence", 0)
+        complexity = triage_info.get("complexity", "complex")
+        urgency = triage_info.get("urgency", "urgent")
+
+        if (confidence >= self.settings.confidence_threshold and
+            complexity == "simple" and
+            urgency == "normal"):
+            return {"tier": "medium", "action": "route", "reason": "routine"}
+        return {"tier": "strong", "action": "route", "reason": "urgent" if urgency == "urgent" else "complex"}
+
+    def decide(self, triage_info: Dict, tier_health: Dict[str, Dict], deferred_for: float = 0.0) -> Dict:
+        """
+        Pick the findings tier
+
+        Args:
+            triage_info: Triage assessment (urgency, complexity, confidence)
+            tier_health: LLMProvider.tier_health() snapshot
+            deferred_for: Seconds this case has already been deferred
+
+        Returns:
+            {"tier": "medium" | "strong", "action": "route" | "downgrade" | "defer", "reason": str}
+        """
+        return self.baseline(triage_info)
+
+
+class SLORoutingPolicy(StaticRoutingPolicy):
+    """
+    Static rule, plus load shedding off the strong tier while it misses its SLO
+
+    When the strong tier's p95 latency, error rate or in-flight calls are over
+    their limits, non-urgent cases bound for it are downgraded to the medium
+    tier, or deferred (up to ``routing_defer_seconds``) if the breach action
+    is "defer". Urgent cases always stay on the strong tier.
+
+    Latency and error breaches are judged on recent calls only, so a share
+    (``routing_probe_ratio``) of the shed cases still goes to the strong tier
+    as probes; without them its health would never be measured again and
+    the breach would outlive the outage.
+    """
+
+    name = "slo"
+
+    def __init__(self, settings: Settings):
+        super().__init__(settings)
+        self.rng = random.Random()
+
+    def breach(self, health: Dict) -> str:
+        """Why the strong tier is over its limits, or "" if it is not"""
+        if health.get("samples", 0) < self.settings.routing_min_samples:
+            return ""
+        if health["p95_latency"] > self.settings.strong_latency_slo_seconds:
+            return "strong_latency_slo"
+        if health["error_rate"] > self.settings.strong_max_error_rate:
+            return "strong_error_rate"
+        if health["in_flight"] >= self.settings.strong_max_in_flight:
+            return "strong_queue_depth"
+        return ""
+
+    def decide(self, triage_info: Dict, tier_health: Dict[str, Dict], deferred_for: float = 0.0) -> Dict:
+        decision = self.baseline(triage_info)
+        if decision["tier"] != "strong" or decision["reason"] == "urgent":
+            return decision
+
+        reason = self.breach(tier_health.get("strong", {}))
+        if not reason:
+            return decision
+        if reason != "strong_queue_depth" and self.rng.random() < self.settings.routing_probe_ratio:
+            return {"tier": "strong", "action": "route", "reason": "probe"}
+        if (self.settings.routing_breach_action == "defer" and
+            deferred_for < self.settings.routing_defer_seconds):
+            return {"tier": "strong", "action": "defer", "reason": reason}
+        return {"tier": "medium", "action": "downgrade", "reason": reason}
+
+
+POLICIES = {
+    StaticRoutingPolicy.name: StaticRoutingPolicy,
+    SLORoutingPolicy.name: SLORoutingPolicy,
+}
+
+
+def make_routing_policy(settings: Settings):
+    if settings.routing_policy not in POLICIES:
+        raise ValueError(f"Unknown routing policy: {settings.routing_policy}")
+    return POLICIES[settings.routing_policy](settings)
+
+
+@lru_cache(maxsize=1)
+def get_routing_policy():
+    """Lazily constructed global instance"""
+    return make_routing_policy(get_settings())
@@ -1,24 +1,86 @@
 """X-ray triage logic"""
+import asyncio
 import json
-from typing import Dict
-from langchain.schema import HumanMessage
-from app.services.llm_provider import llm_provider
-from app.prompts.triage_prompt import get_triage_prompt
+import re
+from functools import lru_cache
+from typing import Dict, List, Literal, Optional, Tuple
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from app.services.llm_provider import get_llm_provider
+from app.prompts.triage_prompt import get_batch_triage_prompt, get_triage_prompt
+from app.utils.messages import image_parts, text_part
 from app.utils.logger import logger
+from app.utils.metrics import metrics
+from app.config import get_settings
+
+# Conservative result used whenever the model output cannot be trusted
+TRIAGE_FALLBACK = {
+    "urgency": "urgent",
+    "complexity": "complex",
+    "confidence": 0.3,
+    "preliminary_findings": ["Could not parse triage"],
+    "reasoning": "Defaulting to safe triage",
+    "cost": 0.01,
+    "quality_issues": "Unknown",
+    "recommended_action": "immediate radiologist review"
+}
+
+
+class TriageResult(BaseModel):
+    """Schema the triage model output must satisfy"""
+
+    urgency: Literal["urgent", "routine", "normal"]
+    complexity: Literal["simple", "complex"]
+    confidence: float = Field(ge=0.0, le=1.0)
+    preliminary_findings: List[str] = Field(default_factory=list)
+    reasoning: str = ""
+    quality_issues: Optional[str] = None
+    recommended_action: Optional[str] = None
+
+    @field_validator("urgency", "complexity", mode="before")
+    @classmethod
+    def _normalise_label(cls, value):
+        """Accept "URGENT", " Routine " etc."""
+        return value.strip().lower() if isinstance(value, str) else value
+
+    @field_validator("confidence", mode="before")
+    @classmethod
+    def _normalise_confidence(cls, value):
+        """Accept percentages (e.g. 85) as well as fractions"""
+        # bool is an int; null, lists etc. must fail validation, not raise TypeError
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise ValueError(f"confidence must be a number, got {type(value).__name__}")
+        if isinstance(value, str):
+            value = value.strip().rstrip("%")
+        value = float(value)
+        return value / 100 if 1 < value <= 100 else value
+
+    @field_validator("preliminary_findings", mode="before")
+    @classmethod
+    def _normalise_findings(cls, value):
+        """Accept null or a single string"""
+        if value is None:
+            return []
+        return [value] if isinstance(value, str) else value
+
 
 class TriageEngine:
     """Handles rapid X-ray triage"""
     
     def __init__(self):
-        self.llm = llm_provider.medium
+        settings = get_settings()
+        self.llm = get_llm_provider().get_model("medium", json_mode=settings.triage_json_mode)
     
     async def triage_xray(
         self, 
-        image_base64: str,
+        images: List[str],
         image_type: str = "chest"
     ) -> Dict:
         """
-        Perform rapid triage of X-ray
+        Perform rapid triage of an X-ray study
+        
+        Args:
+            images: Base64 data URLs, one per view
+            image_type: "chest", "limb", etc.
         
         Returns:
             {
@@ -27,11 +89,12 @@ class TriageEngine:
                 "confidence": float,
                 "preliminary_findings": list,
                 "reasoning": str,
-                "cost": float
+                "cost": float,
+                "usage": dict
             }
         """
         try:
-            prompt = get_triage_prompt(image_type)
+            prompt = get_triage_prompt(image_type, image_count=len(images))
             
             messages = [
                 {
@@ -41,26 +104,21 @@ class TriageEngine:
                 {
                     "role": "user",
                     "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_base64}"
-                            }
-                        },
-                        {
-                            "type": "text",
-                            "text": prompt["user"]
-                        }
+                        # Static instructions first so the prefix is cacheable
+                        text_part(prompt["user"], cacheable=True),
+                        *image_parts(images),
+                        text_part(prompt["image_context"])
                     ]
                 }
             ]
             
             # Call Haiku for fast triage
-            response = await self.llm.ainvoke(messages)
+            response = await self.llm.ainvoke(messages, cache_stage="triage", cache_if=self._parses)
             
             # Parse JSON response
             result = self._parse_triage_response(response.content)
             result["cost"] = 0.01  # Approximate cost for triage
+            result["usage"] = response.token_usage()
             
             logger.info(f"Triage completed: {result['urgency']} / {result['complexity']}")
             
@@ -68,6 +126,7 @@ class TriageEngine:
             
         except Exception as e:
             logger.error(f"Triage error: {e}")
+            metrics.increment("triage_errors")
             # Safe fallback: mark as complex/urgent
             return {
                 "urgency": "urgent",
@@ -82,30 +141,166 @@ class TriageEngine:
 
                     
     
-    def _parse_triage_response(self, response: str) -> Dict:
-        """Parse LLM response into structured triage data"""
+    async def triage_batch(
+        self,
+        images: List[str],
+        image_type: str = "chest"
+    ) -> List[Dict]:
+        """
+        Triage several single-image studies with one model call
+        
+        Images are labelled "Image 1".."Image N" and the model returns one
+        result per index. Images whose entry is missing or invalid (or all of
+        them, if the call fails) are re-triaged with single-image calls.
+        
+        Args:
+            images: Base64 data URLs, one per study
+            image_type: "chest", "limb", etc.
+        
+        Returns:
+            One triage result (as from ``triage_xray``) per image, in order
+        """
+        if len(images) == 1:
+            return [await self.triage_xray(images, image_type)]
+        
+        prompt = get_batch_triage_prompt(image_type, count=len(images))
+        content = [text_part(prompt["user"], cacheable=True)]
+        for index, image in enumerate(images, start=1):
+            content.append(text_part(f"Image {index}:"))
+            content += image_parts([image])
+        content.append(text_part(prompt["image_context"]))
+        messages = [
+            {"role": "system", "content": prompt["system"]},
+            {"role": "user", "content": content}
+        ]
+        
         try:
-            # Try to extract JSON from response
-            if "```json" in response:
-                json_str = response.split("```json")[1].split("```")[0]
-            else:
-                json_str = response
-            
-            return json.loads(json_str.strip())
-            
+            response = await self.llm.ainvoke(messages)
+            results = self._parse_batch_response(response.content, len(images))
+            usage = response.token_usage()
         except Exception as e:
+            logger.warning(f"Batched triage of {len(images)} images failed: {e}")
+            results, usage = [None] * len(images), {}
+        
+        # Each batched result carries its share of the call
+        for result in results:
+            if result is not None:
+                result["cost"] = 0.01 / len(images)
+                result["usage"] = {kind: count // len(images) for kind, count in usage.items()}
+                result["batch_size"] = len(images)
+        
+        missing = [index for index, result in enumerate(results) if result is None]
+        metrics.increment("triage_batch_images", len(images) - len(missing), outcome="batched")
+        if missing:
+            metrics.increment("triage_batch_images", len(missing), outcome="fallback")
+            singles = await asyncio.gather(*(self.triage_xray([images[i]], image_type) for i in missing))
+            for index, result in zip(missing, singles):
+                results[index] = result
+        
+        return results
+
+    def _parse_batch_response(self, response: str, count: int) -> List[Optional[Dict]]:
+        """
+        Valid results by image index; None where an entry is missing or invalid
+
+        Counted per call in ``triage_batch_parse_events`` (not the
+        single-image ``triage_parse_events``): "valid" / "repaired" when every
+        image got a result, "incomplete" when some did, else "fallback".
+        """
+        results = [None] * count
+        try:
+            data, outcome = self._load_json(response)
+        except ValueError as e:
+            logger.warning(f"Failed to parse batched triage JSON: {e}")
+            metrics.increment("triage_batch_parse_events", outcome="fallback")
+            return results
+        
+        entries = data.get("results") if isinstance(data, dict) else data
+        if not isinstance(entries, list):
+            metrics.increment("triage_batch_parse_events", outcome="fallback")
+            return results
+        
+        for position, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                continue
+            try:
+                index = int(entry.get("image", position + 1)) - 1
+            except (TypeError, ValueError):
+                continue
+            if 0 <= index < count and results[index] is None:
+                # One bad entry only sends its own image back for a single-image call
+                try:
+                    results[index] = TriageResult.model_validate(entry).model_dump()
+                except (TypeError, ValueError):  # ValidationError is a ValueError
+                    pass
+
+        parsed = count - results.count(None)
+        if parsed < count:
+            outcome = "incomplete" if parsed else "fallback"
+        metrics.increment("triage_batch_parse_events", outcome=outcome)
+        return results
+
+    def _parses(self, response: str) -> bool:
+        """Whether a response yields a valid triage result (no metrics recorded)"""
+        try:
+            TriageResult.model_validate(json.loads(self._repair_json(response)))
+            return True
+        except (ValueError, ValidationError):
+            return False
+
+    def _parse_triage_response(self, response: str) -> Dict:
+        """
+        Parse LLM response into structured triage data
+
+        Strict JSON is tried first, then a cheap local repair of near-valid
+        output. Anything that still fails schema validation gets the
+        conservative fallback.
+        """
+        try:
+            data, outcome = self._load_json(response)
+            result = TriageResult.model_validate(data).model_dump()
+
+        except (ValueError, ValidationError) as e:
             logger.warning(f"Failed to parse triage JSON: {e}")
-            # Return conservative fallback
-            return {
-                "urgency": "urgent",
-                "complexity": "complex",
-                "confidence": 0.3,
-                "preliminary_findings": ["Could not parse triage"],
-                "reasoning": "Defaulting to safe triage",
-                "cost": 0.01,
-                "quality_issues": "Unknown",
-                "recommended_action": "immediate radiologist review"
-            }
+            metrics.increment("triage_parse_events", outcome="fallback")
+            return dict(TRIAGE_FALLBACK)
+
+        # Counted once, after validation: "valid" / "repaired" / "fallback"
+        metrics.increment("triage_parse_events", outcome=outcome)
+        return result
+
+    def _load_json(self, response: str) -> Tuple[object, str]:
+        """Load JSON from the response, repairing it if necessary; returns (data, "valid" | "repaired")"""
+        try:
+            return json.loads(response.strip()), "valid"
+        except json.JSONDecodeError:
+            pass
+
+        return json.loads(self._repair_json(response)), "repaired"
+
+    @staticmethod
+    def _repair_json(response: str) -> str:
+        """Fix the common ways a model breaks otherwise valid JSON"""
+        text = response.strip()
+
+        # Markdown code fences and surrounding prose
+        if "```" in text:
+            text = re.sub(r"```(?:json)?", "", text)
+        start, end = text.find("{"), text.rfind("}")
+        if start == -1 or end <= start:
+            raise ValueError("No JSON object in triage response")
+        text = text[start:end + 1]
+
+        # Smart quotes, trailing commas and Python literals
+        text = text.replace("\u201c", '"').replace("\u201d", '"')
+        text = re.sub(r",\s*([}\]])", r"\1", text)
+        text = re.sub(r"\bTrue\b", "true", text)
+        text = re.sub(r"\bFalse\b", "false", text)
+        text = re.sub(r"\bNone\b", "null", text)
+
+        return text
 
-# Global instance
-triage_engine = TriageEngine()
\ No newline at end of file
+@lru_cache(maxsize=1)
+def get_triage_engine() -> TriageEngine:
+    """Lazily constructed global instance"""
+    return TriageEngine()
\ No newline at end of file
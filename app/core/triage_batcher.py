@@ -0,0 +1,79 @@
+"""Dynamic micro-batching of single-image triage requests"""
+import asyncio
+import contextvars
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from app.config import get_settings
+from app.core.triage import TriageEngine, get_triage_engine
+from app.utils.metrics import metrics
+
+
+class TriageBatcher:
+    """
+    Groups concurrent single-image triage requests into multi-image calls
+
+    Requests for the same image type are collected until ``batch_size`` are
+    waiting or the first has waited ``max_wait`` seconds, then sent as one
+    batch through ``TriageEngine.triage_batch``.
+    """
+
+    def __init__(self, engine: TriageEngine, batch_size: int, max_wait: float):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._pending: Dict[str, List[Tuple[str, asyncio.Future]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._tasks = set()
+
+    async def triage(self, image: str, image_type: str = "chest") -> Dict:
+        """Triage one image, sharing a model call with concurrent requests"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(image_type, [])
+        pending.append((image, future))
+
+        if len(pending) >= self.batch_size:
+            self._flush(image_type)
+        elif len(pending) == 1:
+            self._timers[image_type] = loop.call_later(self.max_wait, self._flush, image_type)
+
+        return await future
+
+    def _flush(self, image_type: str) -> None:
+        timer = self._timers.pop(image_type, None)
+        if timer is not None:
+            timer.cancel()
+        batch = [(image, future) for image, future in self._pending.pop(image_type, []) if not future.done()]
+        if not batch:
+            return
+
+        # Own context: the batch serves many requests, so it is traced on its own
+        task = asyncio.get_running_loop().create_task(self._run(image_type, batch), context=contextvars.Context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, image_type: str, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        metrics.observe("triage_batch_size", len(batch))
+        try:
+            results = await self.engine.triage_batch([image for image, _ in batch], image_type)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+@lru_cache(maxsize=1)
+def get_triage_batcher() -> TriageBatcher:
+    """Lazily constructed global instance"""
+    settings = get_settings()
+    return TriageBatcher(
+        get_triage_engine(),
+        batch_size=settings.triage_batch_size,
+        max_wait=settings.triage_batch_max_wait_seconds,
+    )
@@ -1,17 +1,63 @@
 """FastAPI application"""
-from fastapi import FastAPI, File, UploadFile, HTTPException
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List
+from fastapi import BackgroundTasks, FastAPI, File, Header, Request, UploadFile, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-import base64
-from app.core.router import xray_router
 from app.config import get_settings
+from app.services.idempotency import IdempotencyConflict
+from app.services.shadow import defer_shadow_jobs, get_shadow_evaluator
+from app.services.tenancy import QuotaExceeded
+from app.utils.images import ALLOWED_CONTENT_TYPES, study_digest, to_data_url_async
 from app.utils.logger import logger
+from app.utils.loop_monitor import get_loop_monitor
+from app.utils.metrics import metrics
+from app.utils.profiling import RequestProfile, profiling_requested
+from app.utils.tracing import Span, get_exporter, span
+
+
+class ClientDisconnected(Exception):
+    """The client went away before the pipeline finished"""
+
+    def __init__(self, cancelled: bool = True):
+        super().__init__("client disconnected")
+        self.cancelled = cancelled  # False: the pipeline keeps running (shielded)
+
+
+# Shielded pipelines still running for a client that went away
+_detached: set = set()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build the pipeline singletons on worker start, not on import"""
+    # Deferred: pulls in LangChain and validates config
+    from app.core.router import get_xray_router
+    from app.prompts.findings_prompt import compile_prompts
+    from app.services.llm_provider import get_llm_provider
+    from app.services.storage import get_analysis_writer
+
+    compile_prompts()
+    get_xray_router()
+    await get_llm_provider().warm_up()
+    if get_settings().loop_monitor_enabled:
+        get_loop_monitor().start()
+
+    yield
+
+    await get_loop_monitor().stop()
+    await get_shadow_evaluator().aclose()
+    await get_analysis_writer().close()
+    await get_llm_provider().aclose()
+    get_exporter().shutdown()
 
-settings = get_settings()
 
 app = FastAPI(
     title="Radiology AI API",
     description="AI-powered X-ray report generation for Nigerian diagnostic centers",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS
@@ -35,50 +81,343 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check(response: Response):
+    """Upstream capacity and queue health; 503 once past the READY_* thresholds"""
+    from app.services.llm_provider import get_llm_provider
+    from app.services.readiness import check_readiness
+    from app.services.shared_state import get_shared_state
+    from app.services.tenancy import get_tenant_manager
+
+    provider = get_llm_provider()
+    tiers = provider.tier_health()
+    keys = await asyncio.to_thread(get_shared_state().key_stats)
+    scheduler = get_tenant_manager().stats()
+    report = check_readiness(get_settings(), tiers, keys, scheduler, provider.endpoints.configured_keys())
+    if not report["ready"]:
+        response.status_code = 503
+
+    return {
+        **report,
+        "queue": {"active": scheduler["active"], "queue_depth": scheduler["queue_depth"]},
+        "tiers": tiers,
+        "endpoints": provider.endpoints.stats(),
+        "keys": keys,
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """In-process counters and summaries"""
+    from app.services.llm_provider import get_llm_provider
+    from app.services.shared_state import get_shared_state
+    from app.services.tenancy import get_tenant_manager
+
+    snapshot = metrics.snapshot()
+    snapshot["scheduler"] = get_tenant_manager().stats()
+    snapshot["tiers"] = get_llm_provider().tier_health()
+    snapshot["keys"] = await asyncio.to_thread(get_shared_state().key_stats)
+    snapshot["event_loop"] = get_loop_monitor().stats()
+    if get_settings().llm_cache_stages:
+        from app.services.llm_cache import get_llm_cache
+
+        snapshot["llm_cache"] = await asyncio.to_thread(get_llm_cache().stats)
+    return snapshot
+
 @app.post("/api/v1/analyze-xray")
 async def analyze_xray(
-    file: UploadFile = File(...),
+    request: Request,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(None),
+    file: List[UploadFile] = File(None),
     image_type: str = "chest",
     patient_age: int = None,
     clinical_indications: str = None,
+    centre_id: str = None,
+    x_tenant_id: str = Header(None),
+    idempotency_key: str = Header(None),
+    x_profile: str = Header(None),
+    include_timings: bool = False,
 ):
     """
-    Analyze X-ray image and generate report
+    Analyze an X-ray study (one or more views) and generate report
     
     Args:
-        file: X-ray image (JPEG/PNG)
+        files: X-ray images (JPEG/PNG), e.g. PA + lateral
+        file: Same as ``files``; the original single-image field name, still accepted
         image_type: "chest" or "limb"
+        centre_id: Diagnostic centre the study comes from
+        x_tenant_id: Tenant for quotas and fair scheduling (defaults to centre_id)
+        idempotency_key: Client-chosen key; retries with the same key get
+            the stored (or in-progress) result instead of a new run
+        x_profile: PROFILING_TOKEN, to profile this request (dump path in
+            the X-Profile-Path response header)
+        include_timings: Add a per-stage ``timings`` breakdown (seconds)
     
     Returns:
         Triage info + draft report
     """
-    try:
-        # Validate file type
-        if file.content_type not in ["image/jpeg", "image/png"]:
-            raise HTTPException(400, "Only JPEG/PNG images allowed")
+    files = (files or []) + (file or [])
+    if not files:
+        raise HTTPException(422, "No image uploaded (form field 'files' or 'file')")
+    with span("analyze_xray", image_type=image_type, image_count=len(files)) as request_span:
+        response.headers["X-Trace-Id"] = request_span.trace_id
+        profile = None
+        if profiling_requested(x_profile):
+            profile = RequestProfile(request_span.trace_id)
+            if not profile.start():
+                profile = None
+        # Shadow replays of this request's LLM calls wait until the response is sent
+        shadow_jobs = defer_shadow_jobs()
+        try:
+            # Validate study
+            if len(files) > get_settings().max_images_per_study:
+                raise HTTPException(400, f"At most {get_settings().max_images_per_study} images per study")
+            for file in files:
+                if file.content_type not in ALLOWED_CONTENT_TYPES:
+                    raise HTTPException(400, "Only JPEG/PNG images allowed")
         
-        # Read and encode image
-        contents = await file.read()
-        image_base64 = base64.b64encode(contents).decode()
+            # Read and encode all views concurrently
+            with span("read_images"):
+                images = await asyncio.gather(*(_read_image(file) for file in files))
         
-        logger.info(f"Analyzing {image_type} X-ray: {file.filename}")
+            logger.info(f"Analyzing {image_type} X-ray: {', '.join(f.filename or '' for f in files)}")
         
-        # Process through pipeline
-        result = await xray_router.analyze_xray(
-            image_base64=image_base64,
-            image_type=image_type,
-            patient_age=patient_age,
-            clinical_indications=clinical_indications
-        )
+            # Process through pipeline, fairly shared between tenants
+            from app.core.router import get_xray_router
+            from app.services.idempotency import get_idempotency_manager
+            from app.services.shared_state import get_shared_state
+            from app.services.tenancy import get_tenant_manager
+
+            tenant_id = x_tenant_id or centre_id or "default"
+            request_span.set_attribute("tenant", tenant_id)
+            digest = study_digest(images, image_type, patient_age, clinical_indications)
+            run_tenant_pipeline = lambda: get_tenant_manager().run(
+                tenant_id,
+                lambda: get_xray_router().analyze_xray(
+                    images=images,
+                    image_type=image_type,
+                    patient_age=patient_age,
+                    clinical_indications=clinical_indications,
+                    centre_id=centre_id or tenant_id,
+                    inputs_digest=digest,
+                )
+            )
+            
+            async def run_pipeline():
+                # Identical studies share one run across all workers
+                settings = get_settings()
+                result, outcome = await get_shared_state().run_once(
+                    f"study:{tenant_id}:{digest}",
+                    run_tenant_pipeline,
+                    ttl_seconds=settings.result_cache_ttl_seconds,
+                    wait_seconds=settings.dedup_wait_seconds,
+                    should_cache=lambda r: r.get("status") == "complete",
+                )
+                metrics.increment("study_dedup", outcome=outcome)
+                return result
         
-        return {
-            "success": True,
-            "data": result
-        }
+            if idempotency_key:
+                # Shielded: the client will retry with this key, so finish and store the result
+                result, replayed = await _until_disconnected(request, get_idempotency_manager().run(
+                    f"{tenant_id}:{idempotency_key}",
+                    digest,
+                    run_pipeline
+                ), shield=True)
+                response.headers["Idempotent-Replayed"] = str(replayed).lower()
+            else:
+                result = await _until_disconnected(request, run_pipeline())
+        
+            if include_timings:
+                result = {**result, "timings": request_span.timings()}
+            if shadow_jobs:
+                background_tasks.add_task(get_shadow_evaluator().submit_all, shadow_jobs)
+        
+            return {
+                "success": True,
+                "data": result
+            }
         
-    except Exception as e:
-        logger.error(f"API error: {e}")
-        raise HTTPException(500, str(e))
+        except HTTPException:
+            raise
+        except ClientDisconnected as e:
+            if e.cancelled:
+                _record_cancellation(request_span)
+            else:
+                metrics.increment("detached_studies")
+                logger.info("Client disconnected; finishing the pipeline for a retry with the same Idempotency-Key")
+            return Response(status_code=499)  # nginx's "client closed request"; nobody reads it
+        except IdempotencyConflict as e:
+            raise HTTPException(e.status_code, str(e))
+        except QuotaExceeded as e:
+            raise HTTPException(429, str(e), headers=e.headers)
+        except Exception as e:
+            logger.error(f"API error: {e}")
+            raise HTTPException(500, str(e))
+        finally:
+            if profile is not None:
+                response.headers["X-Profile-Path"] = await profile.stop()
+
+@app.post("/api/v1/triage")
+async def triage_worklist(
+    files: List[UploadFile] = File(...),
+    image_type: str = "chest",
+    centre_id: str = None,
+    x_tenant_id: str = Header(None),
+):
+    """
+    Triage-only worklist prioritisation: one film per study, no report
+    
+    Films from this and concurrent requests are packed into multi-image
+    triage calls (see TRIAGE_BATCH_SIZE / TRIAGE_BATCH_MAX_WAIT_SECONDS).
+    
+    Returns:
+        One triage result per uploaded file, in upload order
+    """
+    settings = get_settings()
+    if len(files) > settings.triage_max_images_per_request:
+        raise HTTPException(400, f"At most {settings.triage_max_images_per_request} images per request")
+    for file in files:
+        if file.content_type not in ALLOWED_CONTENT_TYPES:
+            raise HTTPException(400, "Only JPEG/PNG images allowed")
+
+    from app.core.triage_batcher import get_triage_batcher
+    from app.services.tenancy import get_tenant_manager
+
+    with span("triage_worklist", image_type=image_type, image_count=len(files)):
+        images = await asyncio.gather(*(_read_image(file) for file in files))
+
+        async def triage_all() -> dict:
+            batcher = get_triage_batcher()
+            results = await asyncio.gather(*(batcher.triage(image, image_type) for image in images))
+            return {"results": results, "total_cost": sum(r.get("cost", 0.0) for r in results)}
+
+        try:
+            outcome = await get_tenant_manager().run(
+                x_tenant_id or centre_id or "default", triage_all, cost=len(images)
+            )
+        except QuotaExceeded as e:
+            raise HTTPException(429, str(e), headers=e.headers)
+
+    return {
+        "success": True,
+        "data": {
+            "results": [
+                {"filename": file.filename, "triage": result}
+                for file, result in zip(files, outcome["results"])
+            ],
+            "total_cost": outcome["total_cost"],
+        }
+    }
+
+@app.get("/api/v1/analyses")
+async def list_analyses(
+    start: datetime = None,
+    end: datetime = None,
+    urgency: str = None,
+    centre_id: str = None,
+    limit: int = 100,
+):
+    """Stored analyses, newest first, filtered by date range, urgency and centre"""
+    from app.services.storage import get_analysis_writer
+
+    repository = get_analysis_writer().repository
+    if repository is None:
+        raise HTTPException(404, "Analysis storage is disabled")
+
+    records = await repository.query(start, end, urgency, centre_id, min(limit, 1000))
+    return {"success": True, "data": records}
+
+@app.post("/api/v1/analyses/{study_id}/resume")
+async def resume_analysis(study_id: str):
+    """Finish a partial study's missing stages from its stored results"""
+    from app.core.router import StudyNotResumable, get_xray_router
+
+    try:
+        result = await get_xray_router().resume(study_id)
+    except LookupError as e:
+        raise HTTPException(404, str(e))
+    except StudyNotResumable as e:
+        raise HTTPException(409, str(e))
+    return {"success": True, "data": result}
+
+async def _until_disconnected(request: Request, work, shield: bool = False):
+    """
+    Await ``work``, cancelling it if the client disconnects first
+
+    Cancellation reaches the in-flight LLM calls, closing their streams and
+    freeing the tenant slot. With ``shield``, ``work`` is left running to
+    completion instead (its result is stored for a retry).
+
+    Raises:
+        ClientDisconnected: the client went away (``cancelled`` says whether
+            ``work`` was cancelled)
+    """
+    settings = get_settings()
+    if not settings.cancel_on_disconnect:
+        return await work
+
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=settings.disconnect_poll_seconds)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                break
+    except asyncio.CancelledError:
+        if shield:
+            _detach(task)
+        else:
+            task.cancel()
+        raise
+
+    if shield:
+        _detach(task)
+        raise ClientDisconnected(cancelled=False)
+
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    raise ClientDisconnected()
+
+
+def _detach(task: asyncio.Task) -> None:
+    """Keep a reference until ``task`` finishes; its outcome is logged, not raised"""
+    _detached.add(task)
+
+    def finished(task: asyncio.Task) -> None:
+        _detached.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Detached pipeline failed: {task.exception()}")
+
+    task.add_done_callback(finished)
+
+def _record_cancellation(request_span: Span) -> None:
+    """Count cancelled work and estimate the tokens not spent"""
+    # Queue wait or a pipeline stage (stage spans carry a "stage" attribute)
+    cancelled = [
+        s.name for s in request_span.trace.spans
+        if (s.name == "queue" or "stage" in s.attributes) and s.error
+    ]
+    stage = cancelled[-1] if cancelled else "pending"
+    spent = sum(
+        s.attributes.get("prompt_tokens", 0) + s.attributes.get("completion_tokens", 0)
+        for s in request_span.trace.spans
+        if s.name.startswith("llm.")
+    )
+    saved = max(0.0, metrics.average("study_tokens") - spent)
+    metrics.increment("cancelled_studies", stage=stage)
+    metrics.increment("cancelled_tokens_saved_estimate", saved)
+    request_span.set_attributes(cancelled_stage=stage, tokens_saved_estimate=saved)
+    logger.info(f"Client disconnected during {stage}; cancelled pipeline (~{saved:.0f} tokens saved)")
+
+async def _read_image(file: UploadFile) -> str:
+    """Read an upload and encode it as a data URL"""
+    contents = await file.read()
+    return await to_data_url_async(contents, file.content_type)
 
 if __name__ == "__main__":
     import uvicorn
@@ -86,5 +425,5 @@ if __name__ == "__main__":
         "app.main:app",
         host="0.0.0.0",
         port=8000,
-        reload=settings.debug
+        reload=get_settings().debug
     )
\ No newline at end of file
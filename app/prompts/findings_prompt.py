@@ -1,5 +1,15 @@
+from functools import lru_cache
+
+
 class XrayFindingsPrompts:
-    """Class for generating X-ray analysis prompts for radiology AI assistant"""
+    """
+    Class for generating X-ray analysis prompts for radiology AI assistant
+
+    Each prompt is split into a static part (system prompt and the long
+    instructions), compiled once per view type and shared by every request,
+    and a small dynamic part with the per-patient study information. Sending
+    the static part first lets provider-side prompt caching reuse it.
+    """
     
     def __init__(self, patient_age: str = None, clinical_indication: str = None, triage_info: dict = None):
         self.patient_age = patient_age
@@ -7,19 +17,57 @@ class XrayFindingsPrompts:
         self.triage_info = triage_info
         self.triage_alerts = triage_info.get("preliminary_findings", []) if triage_info else []
 
-    def generate_single_chest_prompt(self, view_type: str) -> tuple:
+    def generate_single_chest_prompt(self, view_type: str, variant: str = "full") -> tuple:
         """
         Generate prompt for single chest X-ray view analysis
         
         Args:
             view_type: 'PA', 'AP', or 'AP Portable'
-            patient_age: Patient age in years
-            clinical_indication: Clinical reason for the X-ray
-            triage_info: Dictionary of preliminary findings from triage system (optional)
+            variant: 'full' or 'compact'
             
         Returns:
-            tuple: (system_prompt, user_prompt)
+            tuple: (system_prompt, static_user_prompt, dynamic_user_prompt)
         """
+        if variant == "compact":
+            system, static = self._single_chest_compact_template(view_type)
+        else:
+            system, static = self._single_chest_template(view_type)
+
+        dynamic = f"""STUDY INFORMATION:
+    - View: {view_type}
+    {"- Age: " + str(self.patient_age) + " years" if self.patient_age else ""}
+    {"- Indication: " + self.clinical_indication if self.clinical_indication else ""}
+    {self._triage_context()}"""
+
+        return (system, static, dynamic)
+
+    def _triage_context(self) -> str:
+        """Triage alerts section for the dynamic part of the prompt"""
+        triage_context = ""
+        if self.triage_alerts and len(self.triage_alerts) > 0:
+            triage_context = f"""
+    ---
+    TRIAGE ALERTS (Require Extra Attention):
+    The automated triage system has flagged the following areas for careful examination:
+    """
+            for i, alert in enumerate(self.triage_alerts, 1):
+                triage_context += f"{i}. {alert}\n"
+            
+            triage_context += """
+    IMPORTANT: These are preliminary alerts only. You must:
+    - Independently examine each flagged area
+    - Confirm or refute based on what you actually see
+    - Describe findings objectively regardless of alert
+    - If alert area appears normal, explicitly state this
+
+    ---
+    """
+        return triage_context
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _single_chest_template(view_type: str) -> tuple:
+        """Static part of the single chest prompt (compiled once per view type)"""
         
         system = """You are an expert radiologist analyzing chest X-rays. Your ONLY task is to document objective findings.
 
@@ -45,34 +93,10 @@ class XrayFindingsPrompts:
     You are NOT writing a report. You are documenting observations.
     Another radiologist will use your findings to draft the final report."""
         
-        # Build triage context section
-        triage_context = ""
-        if self.triage_alerts and len(self.triage_alerts) > 0:
-            triage_context = f"""
-    ---
-    TRIAGE ALERTS (Require Extra Attention):
-    The automated triage system has flagged the following areas for careful examination:
-    """
-            for i, alert in enumerate(self.triage_alerts, 1):
-                triage_context += f"{i}. {alert}\n"
-            
-            triage_context += """
-    IMPORTANT: These are preliminary alerts only. You must:
-    - Independently examine each flagged area
-    - Confirm or refute based on what you actually see
-    - Describe findings objectively regardless of alert
-    - If alert area appears normal, explicitly state this
-
-    ---
-    """
-        
         prompt = f"""Document objective findings from this chest X-ray.
 
-    STUDY INFORMATION:
-    - View: {view_type}
-    {"- Age: " + str(self.patient_age) + " years" if self.patient_age else ""}
-    {"- Indication: " + self.clinical_indication if self.clinical_indication else ""}
-    {triage_context}
+    The STUDY INFORMATION and any TRIAGE ALERTS for this patient are given after the image.
+
     OUTPUT REQUIRED:
     Structured findings organized by anatomical region. Use bullet points. Be precise and objective.
 
@@ -348,19 +372,31 @@ class XrayFindingsPrompts:
 
         return (system, prompt)
 
-    def generate_pa_lateral_chest_prompt(self) -> tuple:
+    def generate_pa_lateral_chest_prompt(self, variant: str = "full") -> tuple:
         """
         Generate prompt for PA and lateral chest X-ray analysis
         
         Args:
-            patient_age: Patient age in years
-            clinical_indication: Clinical reason for the X-ray
+            variant: 'full' or 'compact'
             
         Returns:
-            tuple: (system_prompt, user_prompt)
+            tuple: (system_prompt, static_user_prompt, dynamic_user_prompt)
         """
-        
-        
+        if variant == "compact":
+            system, static = self._pa_lateral_compact_template()
+        else:
+            system, static = self._pa_lateral_template()
+
+        dynamic = f"""PATIENT DETAILS:
+{"- Patient Age: " + str(self.patient_age) + " years" if self.patient_age else "- Patient Age: [Not provided]"}
+{"- Clinical Indication: " + self.clinical_indication if self.clinical_indication else "- Clinical Indication: [Not provided]"}"""
+
+        return (system, static, dynamic)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _pa_lateral_template() -> tuple:
+        """Static part of the PA + lateral chest prompt (compiled once)"""
         system = """You are an expert radiologist AI assistant creating draft chest X-ray reports for Nigerian diagnostic centers.
 
 CRITICAL RULES TO PREVENT ERRORS:
@@ -396,12 +432,11 @@ URGENT FINDINGS TO FLAG:
 
 Use clear Nigerian English and standard radiology terminology. A qualified radiologist will review all reports before finalization."""
         
-        prompt = f"""Analyze this chest X-ray study with PA and lateral views and create a draft radiology report.
+        prompt = """Analyze this chest X-ray study with PA and lateral views and create a draft radiology report.
 
 TECHNIQUE:
 - Two views: PA and Lateral
-{"- Patient Age: " + str(self.patient_age) + " years" if self.patient_age else ""}
-{"- Clinical Indication: " + self.clinical_indication if self.clinical_indication else ""}
+- PATIENT DETAILS are given after the images
 
 Images provided:
 - Image 1: PA view
@@ -535,19 +570,32 @@ IMPORTANT:
 
 
 
-    def generate_limb_prompt(self, view_type: str = "AP and Lateral") -> tuple:
+    def generate_limb_prompt(self, view_type: str = "AP and Lateral", variant: str = "full") -> tuple:
         """
         Generate prompt for limb X-ray analysis
         
         Args:
             view_type: Type of views taken (default: "AP and Lateral")
-            patient_age: Patient age in years
-            clinical_indication: Clinical reason for the X-ray
+            variant: 'full' or 'compact'
             
         Returns:
-            tuple: (system_prompt, user_prompt)
+            tuple: (system_prompt, static_user_prompt, dynamic_user_prompt)
         """
-        
+        if variant == "compact":
+            system, static = self._limb_compact_template(view_type)
+        else:
+            system, static = self._limb_template(view_type)
+
+        dynamic = f"""CLINICAL HISTORY:
+{"- Clinical Indication: " + self.clinical_indication if self.clinical_indication else "- [Not provided]"}
+{"- Patient Age: " + str(self.patient_age) + " years" if self.patient_age else ""}"""
+
+        return (system, static, dynamic)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _limb_template(view_type: str) -> tuple:
+        """Static part of the limb prompt (compiled once per view type)"""
         system = """You are an expert radiologist AI assistant creating draft limb X-ray reports for Nigerian diagnostic centers.
 
 CRITICAL RULES:
@@ -569,9 +617,7 @@ Use clear Nigerian English and standard radiology terminology. A qualified radio
 
         prompt = f"""Analyze this limb X-ray and create a draft radiology report.
 
-CLINICAL HISTORY:
-{"- Clinical Indication: " + self.clinical_indication if self.clinical_indication else "- [Not provided]"}
-{"- Patient Age: " + str(self.patient_age) + " years" if self.patient_age else ""}
+CLINICAL HISTORY is given after the image.
 
 TECHNIQUE:
 {view_type} views of [specify anatomical region from image]
@@ -626,19 +672,121 @@ IMPORTANT:
 
         return (system, prompt)
 
-    def get_findings_prompt(self, image_type: str, view_type: str = None) -> dict:
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _single_chest_compact_template(view_type: str) -> tuple:
+        """Compact static part of the single chest prompt"""
+        projection_note = (
+            "PA view: cardiac size assessment is reliable"
+            if view_type == "PA"
+            else "AP projection may artifactually enlarge the cardiac silhouette"
+        )
+
+        system = """You are an expert radiologist documenting objective chest X-ray findings.
+Rules: describe only what is visible; no diagnoses; state "not well visualized" when unclear; give location, size, density and margins for abnormalities; state normal findings explicitly.
+Triage alerts, if given, are unconfirmed: examine each one and state confirmed / not confirmed.
+You are documenting observations, not writing the report."""
+
+        prompt = f"""Document objective findings from this chest X-ray. STUDY INFORMATION and any TRIAGE ALERTS follow the image.
+
+Return bullet points under these headings, addressing every item (use "Normal"/"Clear"/"Not well visualized"):
+
+## TECHNICAL FACTORS
+- Inspiration (posterior ribs), rotation, penetration, positioning, limitations
+
+## AIRWAYS
+- Trachea position/caliber, carina, major bronchi
+
+## LUNGS AND PLEURA
+- Each zone (right/left upper, mid, lower): parenchyma + pleural space
+- Pneumothorax: side, size (small <2cm / moderate 2-4cm / large >4cm), lung edge location
+- Costophrenic angles, retrocardiac region, lung volumes, vascular markings, interstitial pattern, air bronchograms, cavitation
+- Effusion, pleural thickening or calcification per hemithorax
+
+## HEART AND MEDIASTINUM
+- Cardiac size (visual, relative to thoracic width; {projection_note}), configuration, borders
+- Mediastinal width and contours, aorta, hila
+
+## BONES
+- Ribs, clavicles, scapulae, visible spine, shoulders
+
+## SOFT TISSUES
+- Chest wall, subcutaneous emphysema, breast shadows, axillae
+
+## LINES, TUBES, AND DEVICES
+- Type, tip position, appropriateness; or "None visible"
+
+## ADDITIONAL FINDINGS
+- Hemidiaphragms, gastric bubble, free air under diaphragm, incidental findings
+
+Cross-check: pneumothorax in both lung and pleura sections; subcutaneous emphysema -> look for pneumothorax; blunted angle -> effusion; mediastinal shift -> direction and cause.
+
+Output ONLY the structured bullet-point findings, no preamble."""
+
+        return (system, prompt)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _pa_lateral_compact_template() -> tuple:
+        """Compact static part of the PA + lateral chest prompt"""
+        system = """You are an expert radiologist drafting chest X-ray reports for Nigerian diagnostic centers from PA and lateral views.
+Rules: describe only visible findings; correlate both views and never double-count; say which view shows a finding; state "not clearly visualized" when unclear; use "consistent with"/"suggestive of"; give a differential when uncertain.
+Flag urgent findings (pneumothorax, large effusion, pneumoperitoneum, widened mediastinum >8cm, massive consolidation, foreign body).
+Use Nigerian English and standard terminology; a radiologist reviews every report."""
+
+        prompt = """Analyze this PA (image 1) and lateral (image 2) chest X-ray study and draft a report. PATIENT DETAILS follow the images.
+
+Cover, correlating both views:
+1. Technical quality of each view
+2. Lungs and airways: zones with 3D localisation, retrocardiac region (lateral), interstitial pattern
+3. Pleura: costophrenic angles incl. posterior angle on lateral, effusion size, pneumothorax
+4. Cardiac silhouette: CTR on PA, chambers, silhouette signs
+5. Mediastinum and hila, retrosternal space
+6. Bones and soft tissues
+7. Lines and tubes
+
+IMPRESSION: 2-5 sentences, most significant first, qualified wording; note findings confirmed on both views.
+Start with "**URGENT:**" if urgent findings are present.
+RECOMMENDATIONS: only if indicated."""
+
+        return (system, prompt)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _limb_compact_template(view_type: str) -> tuple:
+        """Compact static part of the limb prompt"""
+        system = """You are an expert radiologist drafting limb X-ray reports for Nigerian diagnostic centers.
+Rules: describe only visible findings; state "not clearly visualized" when unclear; use qualified wording; give a differential when uncertain; never invent findings.
+Structure: Clinical History, Technique, Findings, Impression, Recommendations (if needed)."""
+
+        prompt = f"""Analyze this limb X-ray and draft a report. CLINICAL HISTORY follows the image.
+
+TECHNIQUE: {view_type} views of [anatomical region]
+
+FINDINGS:
+- Bones: alignment, cortex, density, lytic/sclerotic lesions, growth plates
+- Fractures: location, pattern, displacement, angulation, intra-articular extension
+- Joints: spaces, alignment, effusion, degenerative change
+- Soft tissues: swelling, foreign bodies, calcification
+
+IMPRESSION: 2-3 sentences with clinical significance.
+RECOMMENDATIONS: only if indicated."""
+
+        return (system, prompt)
+
+    def get_findings_prompt(self, image_type: str, view_type: str = None, variant: str = "full") -> dict:
         """
         Get appropriate report prompt based on image type by calling the corresponding method
         
         Args:
             image_type: Type of X-ray ('chest_single', 'chest_pa_lateral', 'limb')
             view_type: Specific view type (e.g., 'PA', 'AP', 'AP Portable' for single chest)
-            patient_age: Patient age in years
-            clinical_indication: Clinical reason for the X-ray
-            triage_info: Optional dictionary with urgency and preliminary findings
+            variant: 'full' or 'compact' (shorter instructions, fewer tokens)
             
         Returns:
-            dict: Dictionary with 'system' and 'user' prompts
+            dict: 'system' prompt, 'user_static' instructions (identical
+                across patients, sent before the image), 'user_dynamic'
+                study information (sent after the image) and the combined 'user'
         """
         
         
@@ -646,17 +794,33 @@ IMPORTANT:
         if image_type == "chest_single":
             if not view_type:
                 view_type = "PA"  # Default to PA view
-            system, user = self.generate_single_chest_prompt(view_type)
+            system, static, dynamic = self.generate_single_chest_prompt(view_type, variant)
         elif image_type == "chest_pa_lateral":
-            system, user = self.generate_pa_lateral_chest_prompt()
+            system, static, dynamic = self.generate_pa_lateral_chest_prompt(variant)
         elif image_type == "limb":
-            system, user = self.generate_limb_prompt(view_type or "AP and Lateral")
+            system, static, dynamic = self.generate_limb_prompt(view_type or "AP and Lateral", variant)
         else:
             # Default to single chest view
-            system, user = self.generate_single_chest_prompt("PA")
+            system, static, dynamic = self.generate_single_chest_prompt("PA", variant)
         
 
         return {
             "system": system,
-            "user": user
-        }
\ No newline at end of file
+            "user_static": static,
+            "user_dynamic": dynamic,
+            "user": f"{static}\n\n{dynamic}"
+        }
+
+
+PROMPT_VARIANTS = ("full", "compact")
+SINGLE_CHEST_VIEWS = ("PA", "AP", "AP Portable")
+
+
+def compile_prompts() -> None:
+    """Build the static prompt parts once, at startup"""
+    prompts = XrayFindingsPrompts()
+    for variant in PROMPT_VARIANTS:
+        for view_type in SINGLE_CHEST_VIEWS:
+            prompts.generate_single_chest_prompt(view_type, variant)
+        prompts.generate_pa_lateral_chest_prompt(variant)
+        prompts.generate_limb_prompt("AP and Lateral", variant)
@@ -1,6 +1,7 @@
 class XrayReportPrompts:
     def __init__(self):
-        pass
+        # Report prompts are fully static; build each one once
+        self._compiled = {}
 
     def generate_single_chest_prompt(self) -> tuple:
         system = f"""You are a Radiology Report Drafting Agent for CHEST X-RAYS used in Nigerian diagnostic centres.
@@ -174,32 +175,67 @@ IMPRESSION:
 
         return (system, user)
         
-    def get_report_prompt(self, image_type: str) -> dict:
+    def generate_single_chest_compact_prompt(self) -> tuple:
+        system = """You are a Radiology Report Drafting Agent for CHEST X-RAYS in Nigerian diagnostic centres.
+Convert the structured FINDINGS PAYLOAD into a concise report. Do NOT add findings or diagnose beyond what is stated.
+
+Rules:
+- Reproduce EXAMINATION and PROJECTION / VIEW exactly as provided
+- Output ONLY the report: no explanations, no markdown
+- British English (visualised, favour); short bullet points only
+- Urgent findings (pneumothorax, large effusion, pneumoperitoneum, widened mediastinum >8cm, massive consolidation, malpositioned devices) go FIRST in FINDINGS and IMPRESSION
+- Keep all abnormal details (side, size, location); combine normal statements ("The lungs are clear")
+- No treatment advice; use "?" for differentials; end IMPRESSION with "Clinical correlation is advised." for any abnormality or uncertainty
+
+Format:
+
+EXAMINATION:
+[as provided]
+
+PROJECTION / VIEW:
+[as provided]
+
+FINDINGS:
+- Urgent findings, airways, lungs, pleura, cardiac, mediastinum, bones/soft tissues (if abnormal), lines/tubes
+
+IMPRESSION:
+- Maximum 3 bullet points supported by the findings (e.g. "Normal chest radiograph.")
+"""
+
+        user = "FINDINGS PAYLOAD:\n{findings_payload}"
+
+        return (system, user)
+
+    def get_report_prompt(self, image_type: str, variant: str = "full") -> dict:
         """
         Get appropriate report prompt based on image type by calling the corresponding method
         
         Args:
             image_type: Type of X-ray ('chest_single', 'chest_pa_lateral', 'limb')
-            view_type: Specific view type (e.g., 'PA', 'AP', 'AP Portable' for single chest)
-            patient_age: Patient age in years
-            clinical_indication: Clinical reason for the X-ray
-            triage_info: Optional dictionary with urgency and preliminary findings
+            variant: 'full' or 'compact' (shorter instructions, fewer tokens)
             
         Returns:
             dict: Dictionary with 'system' and 'user' prompts
         """
         
         
+        key = (image_type, variant)
+        if key in self._compiled:
+            return self._compiled[key]
+
         # Route to appropriate method based on image type
-        if image_type == "chest_single":
+        if variant == "compact":
+            system, user = self.generate_single_chest_compact_prompt()
+        elif image_type == "chest_single":
             system, user = self.generate_single_chest_prompt()
         else:
             # Default to single chest view
             system, user = self.generate_single_chest_prompt()
 
-        return {
+        self._compiled[key] = {
             "system": system,
             "user": user}
+        return self._compiled[key]
         
 
 # global instance
@@ -17,9 +17,7 @@ CRITICAL RULES:
 This is a SCREENING tool. Full reports come later."""
 
 
-TRIAGE_USER_PROMPT = """Perform rapid triage assessment of this X-ray image.
-
-TRIAGE CRITERIA:
+TRIAGE_CRITERIA = """TRIAGE CRITERIA:
 
 **URGENT** - Requires immediate radiologist attention:
 - Pneumothorax (any size)
@@ -63,7 +61,27 @@ TRIAGE CRITERIA:
 
 ---
 
-RESPOND IN VALID JSON FORMAT ONLY (no markdown, no code blocks):
+"""
+
+
+TRIAGE_INSTRUCTIONS = """1. Examine image systematically
+2. List ALL visible abnormalities (even if marking as ROUTINE)
+3. If image quality is poor, state this in quality_issues and consider COMPLEX
+4. Confidence score:
+   - 0.90-1.0: Finding is obvious and unambiguous
+   - 0.70-0.89: Finding is visible but requires radiologist confirmation
+   - 0.50-0.69: Subtle finding or moderate uncertainty
+   - <0.50: Very uncertain, poor image quality, or equivocal findings
+5. Be specific in preliminary_findings (e.g., "right mid-zone opacity" not just "opacity")
+6. Empty preliminary_findings array if truly normal
+
+CRITICAL: Only describe findings you can actually see. "Possible" or "cannot exclude" findings should lower confidence, not increase urgency."""
+
+
+TRIAGE_USER_PROMPT = (
+    "Perform rapid triage assessment of this X-ray image.\n\n"
+    + TRIAGE_CRITERIA
+    + """RESPOND IN VALID JSON FORMAT ONLY (no markdown, no code blocks):
 
 {
     "urgency": "urgent" | "routine" | "normal",
@@ -78,24 +96,66 @@ RESPOND IN VALID JSON FORMAT ONLY (no markdown, no code blocks):
     "recommended_action": "immediate radiologist review" | "standard workflow" | "auto-draft report"
 }
 
-INSTRUCTIONS:
-1. Examine image systematically
-2. List ALL visible abnormalities (even if marking as ROUTINE)
-3. If image quality is poor, state this in quality_issues and consider COMPLEX
-4. Confidence score:
-   - 0.90-1.0: Finding is obvious and unambiguous
-   - 0.70-0.89: Finding is visible but requires radiologist confirmation
-   - 0.50-0.69: Subtle finding or moderate uncertainty
-   - <0.50: Very uncertain, poor image quality, or equivocal findings
-5. Be specific in preliminary_findings (e.g., "right mid-zone opacity" not just "opacity")
-6. Empty preliminary_findings array if truly normal
-
-CRITICAL: Only describe findings you can actually see. "Possible" or "cannot exclude" findings should lower confidence, not increase urgency."""
+"""
+    + "INSTRUCTIONS:\n"
+    + TRIAGE_INSTRUCTIONS
+)
 
-def get_triage_prompt(image_type: str = "chest") -> dict:
+def get_triage_prompt(image_type: str = "chest", image_count: int = 1) -> dict:
     """Get triage prompt with image context"""
+    if image_count > 1:
+        image_context = (
+            f"This is a {image_type} X-ray study with {image_count} views of the same patient. "
+            "Assess all views together and return ONE triage result for the study."
+        )
+    else:
+        image_context = f"This is a {image_type} X-ray"
+
     return {
         "system": TRIAGE_SYSTEM_PROMPT,
         "user": TRIAGE_USER_PROMPT,
-        "image_context": f"This is a {image_type} X-ray"
+        "image_context": image_context
+    }
+
+
+# Static like TRIAGE_USER_PROMPT (one cacheable prefix for every batch size);
+# the count and image type go in TRIAGE_BATCH_CONTEXT
+TRIAGE_BATCH_USER_PROMPT = (
+    """Perform rapid triage assessment of each of the X-ray images below, labelled "Image 1", "Image 2", ...
+Each image is a DIFFERENT patient: triage every image independently, never letting one image inform another.
+
+"""
+    + TRIAGE_CRITERIA
+    + """RESPOND WITH ONE JSON OBJECT ONLY (no markdown, no code blocks), with exactly one entry per image, in image order:
+
+{
+    "results": [
+        {
+            "image": 1,
+            "urgency": "urgent" | "routine" | "normal",
+            "complexity": "simple" | "complex",
+            "confidence": 0.75,
+            "preliminary_findings": ["finding 1 description"],
+            "reasoning": "1-2 sentence explanation of triage decision",
+            "quality_issues": "describe any image quality problems" | null,
+            "recommended_action": "immediate radiologist review" | "standard workflow" | "auto-draft report"
+        },
+        {"image": 2, ...}
+    ]
+}
+
+INSTRUCTIONS (for each image):
+"""
+    + TRIAGE_INSTRUCTIONS
+)
+
+
+TRIAGE_BATCH_CONTEXT = """These are {count} separate {image_type} X-ray images ("Image 1" to "Image {count}"). Return exactly {count} entries in "results"."""
+
+def get_batch_triage_prompt(image_type: str = "chest", count: int = 2) -> dict:
+    """Triage prompt for several single-image studies answered in one call"""
+    return {
+        "system": TRIAGE_SYSTEM_PROMPT,
+        "user": TRIAGE_BATCH_USER_PROMPT,
+        "image_context": TRIAGE_BATCH_CONTEXT.format(count=count, image_type=image_type)
     }
\ No newline at end of file
@@ -0,0 +1,190 @@
+"""Latency-aware routing across OpenAI-compatible endpoints"""
+
+import itertools
+import random
+import time
+from collections import deque
+from typing import Callable, Dict, List, Tuple
+
+from app.config import EndpointConfig, Settings
+
+
+class Endpoint:
+    """One upstream endpoint with live latency and error tracking"""
+
+    def __init__(self, config: EndpointConfig, settings: Settings):
+        if not config.api_keys:
+            raise ValueError(f"No API keys configured for endpoint {config.name}")
+
+        self.name = config.name
+        self.base_url = config.base_url.rstrip("/")
+        self.tiers = set(config.tiers)
+        self.models = config.models
+        self.settings = settings
+
+        self.api_keys = list(config.api_keys)
+        self.key_count = len(config.api_keys)
+        self._api_key_cycle = itertools.cycle(config.api_keys)
+
+        self.latency_ewma = None  # seconds, None until first success
+        self.recent = deque(maxlen=settings.llm_health_window)  # True = success
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.in_flight = 0
+
+    def model_for(self, tier: str, default: str) -> str:
+        """Model name for a tier on this endpoint"""
+        return self.models.get(tier, default)
+
+    def next_api_key(self) -> str:
+        """Return the next API key (round-robin)"""
+        return next(self._api_key_cycle)
+
+    def record_success(self, latency: float) -> None:
+        alpha = self.settings.llm_latency_ewma_alpha
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma = alpha * latency + (1 - alpha) * self.latency_ewma
+        self.recent.append(True)
+        self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        self.recent.append(False)
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.settings.llm_failure_threshold:
+            self.cooldown_until = time.monotonic() + self.settings.llm_cooldown_seconds
+
+    @property
+    def error_rate(self) -> float:
+        if not self.recent:
+            return 0.0
+        return self.recent.count(False) / len(self.recent)
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def score(self) -> float:
+        """Lower is better: latency inflated by recent errors"""
+        if self.latency_ewma is None:
+            return 0.0  # untried endpoints get probed first
+        return self.latency_ewma * (1 + self.error_rate)
+
+    def stats(self) -> Dict:
+        return {
+            "name": self.name,
+            "healthy": self.healthy,
+            "latency_ewma": self.latency_ewma,
+            "error_rate": self.error_rate,
+            "consecutive_failures": self.consecutive_failures,
+            "in_flight": self.in_flight,
+        }
+
+
+class TierStats:
+    """
+    Live latency, errors and load of one model tier across all endpoints
+
+    Samples older than ``max_age`` seconds are forgotten (0 = kept until
+    pushed out of the window), so a tier that was unhealthy and then stopped
+    getting traffic reads as "not enough samples" again instead of staying
+    unhealthy forever.
+    """
+
+    def __init__(self, window: int, max_age: float = 0.0, clock: Callable[[], float] = time.monotonic):
+        self.latencies = deque(maxlen=window)  # (time, seconds), successful calls
+        self.outcomes = deque(maxlen=window)  # (time, True = success)
+        self.attempts = deque(maxlen=window)  # (time, True = answered 429), per endpoint attempt
+        self.in_flight = 0
+        self.max_age = max_age
+        self.clock = clock
+
+    def record(self, latency: float, ok: bool) -> None:
+        now = self.clock()
+        self.outcomes.append((now, ok))
+        if ok:
+            self.latencies.append((now, latency))
+
+    def record_attempt(self, rate_limited: bool) -> None:
+        self.attempts.append((self.clock(), rate_limited))
+
+    def _fresh(self, samples: deque) -> List:
+        """Values of ``samples`` recorded within ``max_age``, dropping older ones"""
+        if self.max_age > 0:
+            cutoff = self.clock() - self.max_age
+            while samples and samples[0][0] < cutoff:
+                samples.popleft()
+        return [value for _, value in samples]
+
+    @property
+    def p95_latency(self) -> float:
+        latencies = self._fresh(self.latencies)
+        if not latencies:
+            return 0.0
+        ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        outcomes = self._fresh(self.outcomes)
+        if not outcomes:
+            return 0.0
+        return outcomes.count(False) / len(outcomes)
+
+    @property
+    def rate_limited_rate(self) -> float:
+        attempts = self._fresh(self.attempts)
+        if not attempts:
+            return 0.0
+        return attempts.count(True) / len(attempts)
+
+    def stats(self) -> Dict:
+        return {
+            "p95_latency": self.p95_latency,
+            "error_rate": self.error_rate,
+            "rate_limited_rate": self.rate_limited_rate,
+            "in_flight": self.in_flight,
+            "samples": len(self._fresh(self.outcomes)),
+        }
+
+
+class EndpointPool:
+    """Orders endpoints per tier: fastest healthy first, unhealthy as last resort"""
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+
+        configs = list(settings.llm_endpoints)
+        if settings.openrouter_api_keys:
+            configs.insert(0, EndpointConfig(
+                name="openrouter",
+                base_url="https://openrouter.ai/api/v1",
+                api_keys=settings.openrouter_api_keys,
+            ))
+        if not configs:
+            raise ValueError("No OpenRouter API keys or LLM endpoints configured")
+
+        self.endpoints = [Endpoint(config, settings) for config in configs]
+
+    def candidates(self, tier: str) -> List[Endpoint]:
+        """Endpoints to try for a tier, in order"""
+        serving = [e for e in self.endpoints if tier in e.tiers]
+        healthy = sorted((e for e in serving if e.healthy), key=Endpoint.score)
+        unhealthy = sorted((e for e in serving if not e.healthy), key=lambda e: e.cooldown_until)
+
+        # Occasionally lead with another healthy endpoint so a recovered
+        # primary gets its latency re-measured
+        if len(healthy) > 1 and random.random() < self.settings.llm_probe_ratio:
+            probe = random.choice(healthy[1:])
+            healthy.remove(probe)
+            healthy.insert(0, probe)
+
+        return healthy + unhealthy
+
+    def stats(self) -> List[Dict]:
+        return [endpoint.stats() for endpoint in self.endpoints]
+
+    def configured_keys(self) -> List[Tuple[str, int]]:
+        """(endpoint name, key index) of every configured API key"""
+        return [(endpoint.name, index) for endpoint in self.endpoints for index in range(endpoint.key_count)]
@@ -0,0 +1,218 @@
+"""Idempotency keys for analysis submissions"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Tuple
+
+from app.config import get_settings
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+
+class IdempotencyConflict(Exception):
+    """Same key reused for a different request (422), or original still running (409)"""
+
+    def __init__(self, message: str, status_code: int = 409):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class IdempotencyStore:
+    """
+    Local SQLite record of idempotency keys and their results
+
+    A key is ``pending`` while the first request runs and ``completed``
+    once its result is stored. Completed records expire after the retention
+    window; pending ones after a short lease that the running request keeps
+    renewing (``renew``), so a key held by a worker that crashed mid-run is
+    taken over by the next retry, however long a live run takes.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, lease_seconds: float):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.lease_seconds = lease_seconds
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS idempotency_keys (
+                    key TEXT PRIMARY KEY,
+                    request_hash TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    response TEXT,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_idempotency_expires ON idempotency_keys (expires_at)"
+            )
+
+    def begin(self, key: str, request_hash: str) -> Tuple[str, Dict]:
+        """
+        Claim ``key`` for a new request
+
+        Returns:
+            ("new", None) if the caller should run the request (also when an
+                earlier holder's lease ran out),
+            ("pending", None) if another request holds the key,
+            ("completed", response) with the stored result
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM idempotency_keys WHERE expires_at < ?", (now,))
+                row = self._conn.execute(
+                    "SELECT request_hash, status, response FROM idempotency_keys WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute(
+                        "INSERT INTO idempotency_keys (key, request_hash, status, expires_at) VALUES (?, ?, 'pending', ?)",
+                        (key, request_hash, now + self.lease_seconds),
+                    )
+                    self._conn.execute("COMMIT")
+                    return "new", None
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        stored_hash, status, response = row
+        if stored_hash != request_hash:
+            raise IdempotencyConflict("Idempotency-Key was already used for a different request", 422)
+        if status == "completed":
+            return "completed", json.loads(response)
+        return "pending", None
+
+    def renew(self, key: str) -> None:
+        """Extend the lease of a pending key by ``lease_seconds`` from now"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE idempotency_keys SET expires_at = ? WHERE key = ? AND status = 'pending'",
+                (time.time() + self.lease_seconds, key),
+            )
+
+    def complete(self, key: str, response: Dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE idempotency_keys SET status = 'completed', response = ?, expires_at = ? WHERE key = ?",
+                (json.dumps(response), time.time() + self.ttl_seconds, key),
+            )
+
+    def release(self, key: str) -> None:
+        """Forget a failed attempt so the client can retry it"""
+        with self._lock:
+            self._conn.execute("DELETE FROM idempotency_keys WHERE key = ? AND status = 'pending'", (key,))
+
+    def get_completed(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, response FROM idempotency_keys WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return "missing", None
+        status, response = row
+        return status, json.loads(response) if response else None
+
+
+class IdempotencyManager:
+    """Runs each idempotency key at most once and replays the result to retries"""
+
+    def __init__(self):
+        settings = get_settings()
+        self.store = IdempotencyStore(
+            settings.idempotency_path, settings.idempotency_ttl_seconds, settings.idempotency_lease_seconds
+        )
+        self.wait_seconds = settings.idempotency_wait_seconds
+        self._inflight: Dict[str, Tuple[str, asyncio.Future]] = {}  # key -> (request hash, result)
+
+    async def run(self, key: str, request_hash: str, pipeline: Callable[[], Awaitable[Dict]]) -> Tuple[Dict, bool]:
+        """
+        Run ``pipeline()`` once per key
+
+        Returns:
+            (result, replayed) where ``replayed`` is True for a stored or
+            in-progress result from an earlier request with the same key
+
+        Raises:
+            IdempotencyConflict: key reused for different inputs, or the
+                original request is still running in another worker
+        """
+        # Retry arriving while the original is still running in this worker
+        if key in self._inflight:
+            running_hash, running = self._inflight[key]
+            if running_hash != request_hash:
+                raise IdempotencyConflict("Idempotency-Key was already used for a different request", 422)
+            metrics.increment("idempotency_requests", outcome="joined")
+            return await asyncio.shield(running), True
+
+        state, response = await asyncio.to_thread(self.store.begin, key, request_hash)
+        if state == "completed":
+            metrics.increment("idempotency_requests", outcome="replayed")
+            return response, True
+        if state == "pending":
+            metrics.increment("idempotency_requests", outcome="joined")
+            return await self._wait_for_other_worker(key), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (request_hash, future)
+        heartbeat = asyncio.create_task(self._renew_lease(key))
+        try:
+            result = await pipeline()
+        except asyncio.CancelledError:
+            # Retries that joined this run should retry, not inherit the cancellation
+            future.set_exception(IdempotencyConflict("Original request was cancelled; retry"))
+            future.exception()
+            await asyncio.to_thread(self.store.release, key)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody joined
+            await asyncio.to_thread(self.store.release, key)
+            raise
+        finally:
+            heartbeat.cancel()
+            self._inflight.pop(key, None)
+
+        await asyncio.to_thread(self.store.complete, key, result)
+        future.set_result(result)
+        metrics.increment("idempotency_requests", outcome="executed")
+        return result, False
+
+    async def _renew_lease(self, key: str) -> None:
+        """Keep the pending key leased while this worker is still running it"""
+        interval = self.store.lease_seconds / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.store.renew, key)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not renew idempotency lease for {key}: {e}")
+
+    async def _wait_for_other_worker(self, key: str) -> Dict:
+        """Poll the store until the request holding the key completes"""
+        deadline = time.monotonic() + self.wait_seconds
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+            status, response = await asyncio.to_thread(self.store.get_completed, key)
+            if status == "completed":
+                return response
+            if status == "missing":
+                break  # original attempt failed and released the key
+        logger.info(f"Idempotency key {key} still in progress elsewhere")
+        raise IdempotencyConflict("A request with this Idempotency-Key is still in progress; retry later")
+
+
+@lru_cache(maxsize=1)
+def get_idempotency_manager() -> IdempotencyManager:
+    """Lazily constructed global instance"""
+    return IdempotencyManager()
@@ -0,0 +1,120 @@
+"""Disk-backed cache of LLM responses per pipeline stage"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.config import get_settings
+
+
+def cache_key(stage: str, model: str, params: Dict, messages: List[Dict]) -> str:
+    """
+    Digest of everything that determines a response
+
+    Text and images are hashed separately, so a key reads as
+    stage|model|params|prompt digest|image digest.
+    """
+    prompt, images = hashlib.sha256(), hashlib.sha256()
+    for message in messages:
+        content = message["content"]
+        parts = [{"type": "text", "text": content}] if isinstance(content, str) else content
+        prompt.update(f"<{message['role']}>".encode())
+        for part in parts:
+            if part.get("type") == "image_url":
+                images.update(part["image_url"]["url"].encode())
+                prompt.update(b"<image>")
+            else:
+                prompt.update(part.get("text", "").encode())
+    settings = json.dumps(params, sort_keys=True)
+    return f"{stage}|{model}|{settings}|{prompt.hexdigest()}|{images.hexdigest()}"
+
+
+class LLMCache:
+    """
+    SQLite store of responses, evicting least recently used entries once
+    the stored content exceeds ``max_bytes``
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    stage TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    model TEXT,
+                    usage TEXT,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_lru ON llm_cache (last_used)")
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT content, model, usage FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        content, model, usage = row
+        return {"content": content, "model": model, "usage": json.loads(usage) if usage else {}}
+
+    def put(self, key: str, stage: str, content: str, model: str, usage: Dict) -> None:
+        size = len(content.encode()) + len(key)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, stage, content, model, usage, size, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, stage, content, model, json.dumps(usage), size, time.time()),
+                )
+                self._evict()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until under ``max_bytes``"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        stale = []
+        for key, size in self._conn.execute("SELECT key, size FROM llm_cache ORDER BY last_used"):
+            stale.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", stale)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage, COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache GROUP BY stage"
+            ).fetchall()
+        return {
+            "max_bytes": self.max_bytes,
+            "stages": {stage: {"entries": entries, "bytes": size} for stage, entries, size in rows},
+        }
+
+
+@lru_cache(maxsize=1)
+def get_llm_cache() -> LLMCache:
+    """Lazily constructed global instance"""
+    settings = get_settings()
+    return LLMCache(settings.llm_cache_path, int(settings.llm_cache_max_mb * 1024 * 1024))
@@ -1,69 +1,429 @@
-"""LLM provider integration with OpenRouter"""
+"""LLM provider integration with OpenRouter and other OpenAI-compatible endpoints"""
 
-import itertools
-from typing import Literal
+import asyncio
+import time
+from functools import lru_cache
+from typing import Callable, Dict, List, Literal, Optional
 
-from langchain_openai import ChatOpenAI
+import httpx
 
 from app.config import get_settings
+from app.services.endpoint_pool import EndpointPool, TierStats
+from app.services.llm_cache import cache_key, get_llm_cache
+from app.services.shadow import get_shadow_evaluator
+from app.services.shared_state import get_shared_state
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+from app.utils.tracing import current_span, span
 
-settings = get_settings()
+
+class LLMResponse:
+    """Backend-independent chat completion result"""
+
+    def __init__(self, content: str, model: str, usage: Dict = None, cached: bool = False):
+        self.content = content
+        self.model = model
+        self.usage = usage or {}
+        self.cached = cached  # served from the LLM cache; no tokens spent
+
+    def token_usage(self) -> Dict:
+        """Prompt, completion and cached prompt token counts"""
+        details = self.usage.get("prompt_tokens_details") or {}
+        return {
+            "prompt_tokens": self.usage.get("prompt_tokens", 0),
+            "completion_tokens": self.usage.get("completion_tokens", 0),
+            "cached_tokens": details.get("cached_tokens") or 0,
+        }
+
+
+class LLMBackend:
+    """Sends one OpenAI-compatible chat completion request"""
+
+    async def ainvoke(
+        self,
+        model: str,
+        messages: List[Dict],
+        api_key: str,
+        base_url: str,
+        **params,
+    ) -> LLMResponse:
+        raise NotImplementedError
+
+
+class HTTPXBackend(LLMBackend):
+    """Lean backend: a single POST on the shared connection pool"""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+
+    async def ainvoke(self, model, messages, api_key, base_url, **params) -> LLMResponse:
+        response = await self.client.post(
+            f"{base_url}/chat/completions",
+            json={"model": model, "messages": messages, **params},
+            headers={"Authorization": f"Bearer {api_key}"},
+        )
+        response.raise_for_status()
+        data = response.json()
+
+        return LLMResponse(
+            content=data["choices"][0]["message"].get("content") or "",
+            model=data.get("model", model),
+            usage=data.get("usage"),
+        )
+
+
+class LangChainBackend(LLMBackend):
+    """Backend going through langchain_openai.ChatOpenAI"""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+
+    async def ainvoke(self, model, messages, api_key, base_url, **params) -> LLMResponse:
+        # Deferred: LangChain is the slowest import in the process
+        from langchain_openai import ChatOpenAI
+
+        temperature = params.pop("temperature", None)
+        max_tokens = params.pop("max_tokens", None)
+
+        llm = ChatOpenAI(
+            model=model,
+            openai_api_key=api_key,
+            openai_api_base=base_url,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            model_kwargs=params,
+            http_async_client=self.client,
+        )
+        message = await llm.ainvoke(messages)
+
+        return LLMResponse(
+            content=message.content,
+            model=message.response_metadata.get("model_name", model),
+            usage=message.response_metadata.get("token_usage"),
+        )
+
+
+class FakeBackend(LLMBackend):
+    """
+    Deterministic in-process stand-in for the upstream, for benchmarks and offline runs
+
+    Answers with a canned output for the pipeline stage the call belongs to
+    (the nearest enclosing stage span, "default" outside one), after that
+    stage's fixed latency. FAKE_LLM_OUTPUTS and FAKE_LLM_LATENCY_SECONDS
+    override per stage. Usage counts ~4 characters per token.
+    """
+
+    outputs = {
+        "triage": (
+            '{"urgency": "normal", "complexity": "simple", "confidence": 0.92, '
+            '"preliminary_findings": ["clear lung fields"], "reasoning": "No acute abnormality", '
+            '"quality_issues": null, "recommended_action": null}'
+        ),
+        "findings": "\n".join([
+            "- Trachea: central",
+            "- Lungs: clear, no focal consolidation, effusion or pneumothorax",
+            "- Heart: normal size, CTR < 0.5",
+            "- Mediastinum: not widened",
+            "- Bones: no acute abnormality",
+        ]),
+        "report": "\n".join([
+            "FINDINGS:",
+            "The trachea is central. Both lung fields are clear.",
+            "Cardiac size is within normal limits. No bony abnormality.",
+            "",
+            "IMPRESSION:",
+            "Normal chest radiograph.",
+        ]),
+        "default": "{}",
+    }
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client  # unused; kept for the common constructor
+        settings = get_settings()
+        self.outputs = {**self.outputs, **settings.fake_llm_outputs}
+        self.latency = settings.fake_llm_latency_seconds
+
+    async def ainvoke(self, model, messages, api_key, base_url, **params) -> LLMResponse:
+        stage = "default"
+        current = current_span()
+        while current is not None:
+            if "stage" in current.attributes:
+                stage = current.attributes["stage"]
+                break
+            current = current.parent
+
+        delay = self.latency.get(stage, self.latency.get("default", 0.0))
+        if delay:
+            await asyncio.sleep(delay)
+
+        content = self.outputs.get(stage, self.outputs["default"])
+        prompt_chars = sum(
+            len(message["content"]) if isinstance(message["content"], str)
+            else sum(len(part.get("text", "")) for part in message["content"])
+            for message in messages
+        )
+        return LLMResponse(
+            content=content,
+            model=model,
+            usage={"prompt_tokens": prompt_chars // 4, "completion_tokens": len(content) // 4},
+        )
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """HTTP status of an httpx / OpenAI SDK error, None for transport errors"""
+    return getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+
+
+def _is_endpoint_failure(error: Exception) -> bool:
+    """
+    Whether ``error`` says something about the endpoint (count it, try the next one)
+
+    Transport errors, 5xx, 408 and 429 do. Other 4xx are our request's
+    fault and would fail the same way everywhere.
+    """
+    status = _status_code(error)
+    return status is None or status >= 500 or status in (408, 429)
+
+
+def _rate_limit_retry_after(error: Exception) -> Optional[float]:
+    """Retry-After seconds if ``error`` is an HTTP 429 (0 without the header), else None"""
+    if _status_code(error) != 429:
+        return None
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after", 0))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+
+class ChatModel:
+    """Model handle for one tier, routed to the fastest healthy endpoint"""
+
+    def __init__(self, provider: "LLMProvider", model_type: str, model_name: str, params: Dict):
+        self.provider = provider
+        self.model_type = model_type
+        self.model_name = model_name
+        self.params = params
+
+    async def ainvoke(
+        self,
+        messages: List[Dict],
+        cache_stage: str = None,
+        cache_if: Callable[[str], bool] = None,
+    ) -> LLMResponse:
+        """
+        Run a chat completion, failing over to the next endpoint on error
+
+        Args:
+            messages: OpenAI-style chat messages
+            cache_stage: Pipeline stage, for the disk LLM cache (used when the
+                stage is listed in LLM_CACHE_STAGES)
+            cache_if: Only cache responses whose content passes this check
+        """
+        if cache_stage not in self.provider.settings.llm_cache_stages:
+            return await self._ainvoke_uncached(messages, cache_stage)
+
+        cache = get_llm_cache()
+        key = cache_key(cache_stage, self.model_name, self.params, messages)
+        hit = await asyncio.to_thread(cache.get, key)
+        if hit is not None:
+            metrics.increment("llm_cache", stage=cache_stage, outcome="hit")
+            return LLMResponse(hit["content"], hit["model"], cached=True)
+
+        metrics.increment("llm_cache", stage=cache_stage, outcome="miss")
+        response = await self._ainvoke_uncached(messages, cache_stage)
+        if cache_if is None or cache_if(response.content):
+            await asyncio.to_thread(cache.put, key, cache_stage, response.content, response.model, response.usage)
+        return response
+
+    async def _ainvoke_uncached(self, messages: List[Dict], stage: Optional[str] = None) -> LLMResponse:
+        candidates = self.provider.endpoints.candidates(self.model_type)
+        candidates = candidates[: self.provider.settings.llm_max_attempts]
+        if not candidates:
+            raise ValueError(f"No endpoint serves the {self.model_type} tier")
+
+        tier_stats = self.provider.tier_stats[self.model_type]
+        tier_stats.in_flight += 1
+        call_start = time.perf_counter()
+        try:
+            response = await self._ainvoke(messages, candidates)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if _is_endpoint_failure(e):
+                tier_stats.record(time.perf_counter() - call_start, ok=False)
+            raise
+        finally:
+            tier_stats.in_flight -= 1
+        latency = time.perf_counter() - call_start
+        tier_stats.record(latency, ok=True)
+        if self.provider.settings.shadow_models:
+            get_shadow_evaluator().mirror(self, stage, messages, response, latency)
+        return response
+
+    async def _ainvoke(self, messages: List[Dict], candidates: List) -> LLMResponse:
+        shared = get_shared_state()
+        tier_stats = self.provider.tier_stats[self.model_type]
+        last_error = None
+        with span(f"llm.{self.model_type}", tier=self.model_type) as call_span:
+            for attempt, endpoint in enumerate(candidates, start=1):
+                model = endpoint.model_for(self.model_type, self.model_name)
+                # ✅ least recently used key across all workers; only the last endpoint waits for one
+                max_wait = 0.0 if attempt < len(candidates) else None
+                key_index, wait = await asyncio.to_thread(
+                    shared.acquire_key, endpoint.name, endpoint.key_count, max_wait
+                )
+                if max_wait is not None and wait > max_wait:
+                    metrics.increment("llm_key_waits", endpoint=endpoint.name, outcome="skipped")
+                    continue  # every key here is resting (nothing was leased); try the next endpoint
+                api_key = endpoint.api_keys[key_index]
+                call_span.set_attributes(attempts=attempt, endpoint=endpoint.name, model=model, key_index=key_index)
+                if wait > 0:
+                    metrics.increment("llm_key_waits", endpoint=endpoint.name, outcome="waited")
+                    await asyncio.sleep(wait)
+
+                start = time.perf_counter()
+                endpoint.in_flight += 1
+                try:
+                    with span("llm.attempt", attempt=attempt, endpoint=endpoint.name, model=model, key_index=key_index):
+                        response = await self.provider.backend.ainvoke(
+                            model,
+                            messages,
+                            api_key,
+                            endpoint.base_url,
+                            **self.params,
+                        )
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if not _is_endpoint_failure(e):
+                        metrics.increment("llm_calls", endpoint=endpoint.name, tier=self.model_type, outcome="rejected")
+                        raise  # e.g. 400 bad request: no other endpoint would take it either
+                    retry_after = _rate_limit_retry_after(e)
+                    tier_stats.record_attempt(rate_limited=retry_after is not None)
+                    if retry_after is not None:
+                        cooldown = retry_after or self.provider.settings.llm_key_cooldown_seconds
+                        await asyncio.to_thread(shared.cool_down_key, endpoint.name, key_index, cooldown)
+                        metrics.increment("llm_rate_limited", endpoint=endpoint.name, key_index=key_index)
+                    endpoint.record_failure()
+                    metrics.increment("llm_calls", endpoint=endpoint.name, tier=self.model_type, outcome="error")
+                    logger.warning(f"LLM call to {endpoint.name} failed ({e}), trying next endpoint")
+                    last_error = e
+                    continue
+                finally:
+                    endpoint.in_flight -= 1
+
+                latency = time.perf_counter() - start
+                tier_stats.record_attempt(rate_limited=False)
+                endpoint.record_success(latency)
+                metrics.increment("llm_calls", endpoint=endpoint.name, tier=self.model_type, outcome="ok")
+                metrics.observe("llm_latency_seconds", latency, endpoint=endpoint.name, tier=self.model_type)
+                usage = response.token_usage()
+                call_span.set_attributes(**usage)
+                for kind, count in usage.items():
+                    metrics.increment("llm_tokens", count, tier=self.model_type, kind=kind)
+                return response
+
+            raise last_error
 
 
 class LLMProvider:
     """Manages LLM model access with OpenRouter"""
 
+    backends = {
+        "httpx": HTTPXBackend,
+        "langchain": LangChainBackend,
+        "fake": FakeBackend,
+    }
+
     def __init__(self):
-        self.base_url = "https://openrouter.ai/api/v1"
+        self.settings = get_settings()
 
-        # 🔁 cycle through multiple API keys
-        if not settings.openrouter_api_keys:
-            raise ValueError("No OpenRouter API keys configured")
+        # 🌐 OpenRouter plus any extra endpoints, each rotating its own keys
+        self.endpoints = EndpointPool(self.settings)
+        self.tier_stats = {
+            tier: TierStats(self.settings.routing_window, self.settings.routing_max_sample_age_seconds) for tier in ("medium", "strong", "format")
+        }
 
-        self._api_key_cycle = itertools.cycle(settings.openrouter_api_keys)
+        # 🔌 one connection pool shared by every call
+        self.http_client = httpx.AsyncClient(
+            http2=self.settings.llm_http2,
+            timeout=httpx.Timeout(self.settings.llm_timeout_seconds, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=self.settings.llm_max_connections,
+                max_keepalive_connections=self.settings.llm_max_keepalive_connections,
+                keepalive_expiry=self.settings.llm_keepalive_expiry_seconds,
+            ),
+        )
 
-    def _get_api_key(self) -> str:
-        """Return the next API key (round-robin)"""
-        return next(self._api_key_cycle)
+        if self.settings.llm_backend not in self.backends:
+            raise ValueError(f"Unknown LLM backend: {self.settings.llm_backend}")
+        self.backend = self.backends[self.settings.llm_backend](self.http_client)
 
     def get_model(
         self,
-        model_type: Literal["haiku", "sonnet", "triage"],
-    ) -> ChatOpenAI:
-        """Get LLM model instance"""
+        model_type: Literal["medium", "strong", "format"],
+        json_mode: bool = False,
+    ) -> ChatModel:
+        """
+        Get LLM model handle
 
+        Args:
+            model_type: "medium", "strong" or "format"
+            json_mode: Ask the provider for a JSON object response
+                (OpenAI-compatible ``response_format``)
+        """
         model_map = {
-            "medium": settings.medium_model,
-            "strong": settings.strong_model,
-            "format": settings.format_model,
+            "medium": self.settings.medium_model,
+            "strong": self.settings.strong_model,
+            "format": self.settings.format_model,
         }
 
-        model_name = model_map[model_type]
+        params = {"temperature": 0.1, "max_tokens": 2000}
+        if json_mode:
+            params["response_format"] = {"type": "json_object"}
 
-        return ChatOpenAI(
-            model=model_name,
-            openai_api_key=self._get_api_key(),  # ✅ rotated key
-            openai_api_base=self.base_url,
-            temperature=0.1,
-            max_tokens=2000,
-        )
-    
+        return ChatModel(self, model_type, model_map[model_type], params)
+
+    async def warm_up(self) -> None:
+        """Pre-open pooled connections so the first study skips the TLS handshake"""
+        if self.settings.llm_backend == "fake":
+            return
+        for endpoint in self.endpoints.endpoints:
+            try:
+                await self.http_client.get(
+                    f"{endpoint.base_url}/models",
+                    headers={"Authorization": f"Bearer {endpoint.next_api_key()}"},
+                )
+                logger.info(f"LLM connection pool warmed up for {endpoint.name}")
+            except httpx.HTTPError as e:
+                logger.warning(f"LLM warm-up failed for {endpoint.name}: {e}")
+
+    async def aclose(self) -> None:
+        """Close pooled connections"""
+        await self.http_client.aclose()
+
+    def tier_health(self) -> Dict[str, Dict]:
+        """Live p95 latency, error and 429 rates and in-flight calls per tier"""
+        return {tier: stats.stats() for tier, stats in self.tier_stats.items()}
 
     @property
-    def medium(self) -> ChatOpenAI:
+    def medium(self) -> ChatModel:
         """Haiku model"""
         return self.get_model("medium")
 
     @property
-    def strong(self) -> ChatOpenAI:
+    def strong(self) -> ChatModel:
         """Sonnet model"""
         return self.get_model("strong")
 
     @property
-    def format(self) -> ChatOpenAI:
+    def format(self) -> ChatModel:
         """Triage model"""
         return self.get_model("format")
 
 
-# 🌍 Global singleton
-llm_provider = LLMProvider()
+@lru_cache(maxsize=1)
+def get_llm_provider() -> LLMProvider:
+    """🌍 Lazily constructed singleton"""
+    return LLMProvider()
@@ -0,0 +1,63 @@
+"""Readiness: can this worker take more studies right now?"""
+
+from typing import Dict, List, Tuple
+
+from app.config import Settings
+
+
+def check_readiness(
+    settings: Settings,
+    tiers: Dict[str, Dict],
+    keys: List[Dict],
+    scheduler: Dict,
+    configured_keys: List[Tuple[str, int]],
+) -> Dict:
+    """
+    Judge live upstream capacity and queue health against the READY_* thresholds
+
+    Args:
+        tiers: ``LLMProvider.tier_health()``
+        keys: ``SharedState.key_stats()``
+        scheduler: ``TenantManager.stats()``
+        configured_keys: ``EndpointPool.configured_keys()``; keys never used
+            yet are available, keys no longer configured do not count
+
+    Returns:
+        {"ready": bool, "reasons": [...], "thresholds": {...}}
+    """
+    reasons = []
+
+    if scheduler["queue_depth"] > settings.ready_max_queue_depth:
+        reasons.append(f"queue depth {scheduler['queue_depth']} > {settings.ready_max_queue_depth}")
+
+    for tier, health in tiers.items():
+        if health["samples"] < settings.routing_min_samples:
+            continue  # too few recent calls to judge (stale ones have aged out)
+        if health["error_rate"] > settings.ready_max_error_rate:
+            reasons.append(f"{tier} error rate {health['error_rate']:.0%} > {settings.ready_max_error_rate:.0%}")
+        if health["rate_limited_rate"] > settings.ready_max_rate_limited_rate:
+            reasons.append(
+                f"{tier} 429 rate {health['rate_limited_rate']:.0%} > {settings.ready_max_rate_limited_rate:.0%}"
+            )
+        if settings.ready_max_p95_latency_seconds and health["p95_latency"] > settings.ready_max_p95_latency_seconds:
+            reasons.append(
+                f"{tier} p95 latency {health['p95_latency']:.1f}s > {settings.ready_max_p95_latency_seconds:.1f}s"
+            )
+
+    cooldowns = {(key["endpoint"], key["key_index"]): key["cooldown_seconds"] for key in keys}
+    if settings.ready_require_available_key and configured_keys and all(
+        cooldowns.get(key, 0.0) > 0 for key in configured_keys
+    ):
+        reasons.append(f"all {len(configured_keys)} API keys are cooling down after 429s")
+
+    return {
+        "ready": not reasons,
+        "reasons": reasons,
+        "thresholds": {
+            "max_queue_depth": settings.ready_max_queue_depth,
+            "max_error_rate": settings.ready_max_error_rate,
+            "max_rate_limited_rate": settings.ready_max_rate_limited_rate,
+            "max_p95_latency_seconds": settings.ready_max_p95_latency_seconds,
+            "min_samples": settings.routing_min_samples,
+        },
+    }
@@ -0,0 +1,207 @@
+"""Shadow evaluation of candidate models
+
+A sample (SHADOW_SAMPLE_RATE) of successful LLM calls on tiers listed in
+SHADOW_MODELS is replayed against the candidate model in the background.
+Inside /api/v1/analyze-xray, replays are held back until the response has
+been sent. They run on their own connection pool under SHADOW_CONCURRENCY
+and their own SHADOW_RPM budget, and are dropped (never queued behind) when
+keys are resting, the budget is spent or the queue is full. A replay still
+spends a real key: its use and any 429 cooldown are recorded in the shared
+key state like production calls, but it never touches tier/endpoint health.
+
+Each comparison is appended to SHADOW_RESULTS_PATH (JSON lines): latency,
+token usage and an output diff of primary vs candidate.
+"""
+
+import asyncio
+import difflib
+import json
+import random
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.config import get_settings
+from app.services.shared_state import get_shared_state
+from app.services.tenancy import TokenBucket
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+DIFF_LINES = 40
+
+_deferred: ContextVar[Optional[List[Dict]]] = ContextVar("shadow_deferred", default=None)
+
+
+def defer_shadow_jobs() -> Optional[List[Dict]]:
+    """
+    Hold back replays started in this context (e.g. one request)
+
+    Returns the list they collect in, to hand to ``ShadowEvaluator.submit_all``
+    once the response is out, or None when shadowing is off.
+    """
+    if not get_settings().shadow_models:
+        return None
+    jobs = []
+    _deferred.set(jobs)
+    return jobs
+
+
+class ShadowEvaluator:
+    """Bounded background queue of candidate-model replays"""
+
+    def __init__(
+        self, models: Dict[str, str], sample_rate: float, concurrency: int, max_queue: int, path: str, rpm: float
+    ):
+        self.models = models
+        self.sample_rate = sample_rate
+        self.concurrency = concurrency
+        self._budget = TokenBucket(rpm / 60, max(1.0, rpm / 60 * concurrency))
+        self.path = Path(path)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._workers: List[asyncio.Task] = []
+        self._client = None
+        self._backend = None
+
+    def mirror(self, chat_model, stage: Optional[str], messages: List[Dict], response, latency: float) -> None:
+        """Maybe replay a finished primary call against the tier's candidate model"""
+        candidate = self.models.get(chat_model.model_type)
+        if candidate is None or random.random() >= self.sample_rate:
+            return
+        job = {
+            "provider": chat_model.provider,
+            "tier": chat_model.model_type,
+            "stage": stage,
+            "params": chat_model.params,
+            "messages": messages,
+            "candidate": candidate,
+            "primary": {
+                "model": response.model,
+                "latency": latency,
+                "usage": response.token_usage(),
+                "content": response.content,
+            },
+        }
+        deferred = _deferred.get()
+        if deferred is not None:
+            deferred.append(job)
+        else:
+            self.submit(job)
+
+    async def submit_all(self, jobs: List[Dict]) -> None:
+        """Async so Starlette runs it as a background task on the loop, not in a thread"""
+        for job in jobs:
+            self.submit(job)
+
+    def submit(self, job: Dict) -> None:
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            metrics.increment("shadow_calls", tier=job["tier"], outcome="dropped")
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._evaluate(job)
+            except Exception as e:
+                logger.warning(f"Shadow evaluation failed: {e}")
+
+    async def _evaluate(self, job: Dict) -> None:
+        provider = job["provider"]
+        endpoint = provider.endpoints.candidates(job["tier"])[0]
+        if not self._budget.try_acquire():
+            metrics.increment("shadow_calls", tier=job["tier"], outcome="dropped")
+            return
+        shared = get_shared_state()
+        # Lease only a key that is free now, so the key's per-minute count includes this replay
+        key_index, wait = await asyncio.to_thread(shared.acquire_key, endpoint.name, endpoint.key_count, 0.0)
+        if wait > 0:
+            metrics.increment("shadow_calls", tier=job["tier"], outcome="dropped")
+            return  # keys are resting; production traffic comes first
+
+        if self._backend is None:
+            # Own pool: replays never wait for, or hold, production connections
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(provider.settings.llm_timeout_seconds, connect=10.0),
+                limits=httpx.Limits(max_connections=self.concurrency),
+            )
+            self._backend = provider.backends[provider.settings.llm_backend](self._client)
+
+        candidate = {"model": job["candidate"], "latency": None, "usage": {}, "content": None, "error": None}
+        start = time.perf_counter()
+        try:
+            response = await self._backend.ainvoke(
+                job["candidate"], job["messages"], endpoint.api_keys[key_index], endpoint.base_url, **job["params"]
+            )
+            candidate.update(latency=time.perf_counter() - start, usage=response.token_usage(), content=response.content)
+            metrics.increment("shadow_calls", tier=job["tier"], outcome="ok")
+            metrics.observe("shadow_latency_seconds", candidate["latency"], tier=job["tier"], role="candidate")
+            metrics.observe("shadow_latency_seconds", job["primary"]["latency"], tier=job["tier"], role="primary")
+        except Exception as e:
+            from app.services.llm_provider import _rate_limit_retry_after
+
+            candidate["error"] = f"{type(e).__name__}: {e}"
+            metrics.increment("shadow_calls", tier=job["tier"], outcome="error")
+            retry_after = _rate_limit_retry_after(e)
+            if retry_after is not None:
+                # Production calls must stay off the key too
+                cooldown = retry_after or provider.settings.llm_key_cooldown_seconds
+                await asyncio.to_thread(shared.cool_down_key, endpoint.name, key_index, cooldown)
+                metrics.increment("llm_rate_limited", endpoint=endpoint.name, key_index=key_index)
+
+        await asyncio.to_thread(self._record, job, candidate)
+
+    def _record(self, job: Dict, candidate: Dict) -> None:
+        """Diff the outputs and append the comparison (off the event loop)"""
+        primary = job["primary"]
+        record = {
+            "timestamp": time.time(),
+            "tier": job["tier"],
+            "stage": job["stage"],
+            "primary": {k: v for k, v in primary.items() if k != "content"},
+            "candidate": {k: v for k, v in candidate.items() if k != "content"},
+        }
+        if candidate["content"] is not None:
+            a, b = primary["content"].splitlines(), candidate["content"].splitlines()
+            record["diff"] = {
+                "identical": primary["content"] == candidate["content"],
+                "similarity": difflib.SequenceMatcher(None, primary["content"], candidate["content"]).ratio(),
+                "unified": list(difflib.unified_diff(a, b, "primary", "candidate", lineterm=""))[:DIFF_LINES],
+            }
+            metrics.observe("shadow_similarity", record["diff"]["similarity"], tier=job["tier"])
+        record["primary"]["content"] = primary["content"]
+        record["candidate"]["content"] = candidate["content"]
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    async def aclose(self) -> None:
+        """Stop the workers, dropping queued replays"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = self._backend = None
+
+
+@lru_cache(maxsize=1)
+def get_shadow_evaluator() -> ShadowEvaluator:
+    """Lazily constructed global instance"""
+    settings = get_settings()
+    return ShadowEvaluator(
+        settings.shadow_models,
+        settings.shadow_sample_rate,
+        settings.shadow_concurrency,
+        settings.shadow_max_queue,
+        settings.shadow_results_path,
+        settings.shadow_rpm,
+    )
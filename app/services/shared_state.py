@@ -0,0 +1,295 @@
+"""State shared by all worker processes on a host
+
+API key usage, per-key rate limits and 429 cooldowns, in-flight
+de-duplication and a result cache live in one SQLite file (WAL mode), so
+``uvicorn --workers N`` behaves like one process towards the providers.
+With SHARED_STATE_PATH="" the same store runs in memory, per process.
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.config import get_settings
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS key_usage (
+        endpoint TEXT NOT NULL,
+        key_index INTEGER NOT NULL,
+        uses INTEGER NOT NULL DEFAULT 0,
+        last_used REAL NOT NULL DEFAULT 0,
+        cooldown_until REAL NOT NULL DEFAULT 0,
+        rate_limited INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (endpoint, key_index)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS key_uses (
+        endpoint TEXT NOT NULL,
+        key_index INTEGER NOT NULL,
+        at REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_key_uses ON key_uses (endpoint, key_index, at)",
+    """
+    CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS inflight (
+        key TEXT PRIMARY KEY,
+        expires_at REAL NOT NULL,
+        owner TEXT NOT NULL DEFAULT ''
+    )
+    """,
+]
+
+
+class SharedState:
+    """Cross-process key leases, cooldowns, in-flight claims and cache"""
+
+    def __init__(self, path: str, key_rpm: float = 0):
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.key_rpm = key_rpm
+        self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False, isolation_level=None, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            if path:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+            # Files created before claims carried an owner
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(inflight)")}
+            if "owner" not in columns:
+                self._conn.execute("ALTER TABLE inflight ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+
+    def _transaction(self, work):
+        """Run ``work(conn)`` in an IMMEDIATE transaction (serialised across processes)"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # 🔑 API keys
+
+    def _best_key(self, conn, endpoint: str, key_count: int, now: float) -> Tuple[int, float]:
+        """
+        (key_index, available_at) of the least recently used key that frees
+        up first
+
+        Per-key limits use a sliding log: a key is available once fewer than
+        ``key_rpm`` of its uses (including ones already reserved for later)
+        fall in the 60 seconds before that moment.
+        """
+        rows = conn.execute(
+            "SELECT key_index, cooldown_until FROM key_usage WHERE endpoint = ? AND key_index < ? ORDER BY last_used",
+            (endpoint, key_count),
+        ).fetchall()
+        known = {key_index for key_index, _ in rows}
+        rows = [(i, 0.0) for i in range(key_count) if i not in known] + rows  # never used yet first
+
+        best = None
+        for key_index, cooldown_until in rows:
+            available_at = max(now, cooldown_until)
+            if self.key_rpm:
+                recent = conn.execute(
+                    "SELECT at FROM key_uses WHERE endpoint = ? AND key_index = ? AND at > ? ORDER BY at DESC LIMIT ?",
+                    (endpoint, key_index, now - 60, int(self.key_rpm)),
+                ).fetchall()
+                if len(recent) >= self.key_rpm:
+                    available_at = max(available_at, recent[-1][0] + 60)
+            if best is None or available_at < best[1]:
+                best = (key_index, available_at)
+            if available_at <= now:
+                break  # rows are least recently used first
+        return best
+
+    def acquire_key(self, endpoint: str, key_count: int, max_wait: Optional[float] = None) -> Tuple[int, float]:
+        """
+        Lease the least recently used available key of ``endpoint``
+
+        Returns:
+            (key_index, wait_seconds): wait is 0 unless every key is cooling
+            down after a 429 or at its per-minute limit, in which case the
+            key that frees up first is reserved for when it frees up. If
+            that wait exceeds ``max_wait`` nothing is leased or recorded.
+        """
+        def work(conn):
+            now = time.time()
+            key_index, available_at = self._best_key(conn, endpoint, key_count, now)
+            if max_wait is not None and available_at - now > max_wait:
+                return key_index, available_at - now
+            conn.execute(
+                "INSERT OR IGNORE INTO key_usage (endpoint, key_index) VALUES (?, ?)", (endpoint, key_index)
+            )
+            conn.execute(
+                "UPDATE key_usage SET uses = uses + 1, last_used = ? WHERE endpoint = ? AND key_index = ?",
+                (available_at, endpoint, key_index),
+            )
+            if self.key_rpm:
+                conn.execute("DELETE FROM key_uses WHERE at < ?", (now - 60,))
+                conn.execute(
+                    "INSERT INTO key_uses (endpoint, key_index, at) VALUES (?, ?, ?)",
+                    (endpoint, key_index, available_at),
+                )
+            return key_index, available_at - now
+
+        return self._transaction(work)
+
+    def cool_down_key(self, endpoint: str, key_index: int, seconds: float) -> None:
+        """Keep every worker off a key that was rate limited"""
+        def work(conn):
+            conn.execute(
+                "UPDATE key_usage SET cooldown_until = MAX(cooldown_until, ?), rate_limited = rate_limited + 1 "
+                "WHERE endpoint = ? AND key_index = ?",
+                (time.time() + seconds, endpoint, key_index),
+            )
+
+        self._transaction(work)
+
+    def key_stats(self) -> List[Dict]:
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT endpoint, key_index, uses, cooldown_until, rate_limited "
+                "FROM key_usage ORDER BY endpoint, key_index"
+            ).fetchall()
+            recent = dict(((endpoint, key_index), count) for endpoint, key_index, count in self._conn.execute(
+                "SELECT endpoint, key_index, COUNT(*) FROM key_uses WHERE at > ? AND at <= ? GROUP BY endpoint, key_index",
+                (now - 60, now),
+            ))
+        return [
+            {
+                "endpoint": endpoint,
+                "key_index": key_index,
+                "uses": uses,
+                "uses_last_minute": recent.get((endpoint, key_index), 0),
+                "cooldown_seconds": max(0.0, cooldown_until - now),
+                "rate_limited": rate_limited,
+            }
+            for endpoint, key_index, uses, cooldown_until, rate_limited in rows
+        ]
+
+    # 🔁 In-flight de-duplication
+
+    def claim(self, key: str, ttl_seconds: float) -> Optional[str]:
+        """
+        Owner token if this caller should do the work for ``key``; None if
+        another worker is on it
+        """
+        def work(conn):
+            now = time.time()
+            owner = uuid.uuid4().hex
+            conn.execute("DELETE FROM inflight WHERE expires_at < ?", (now,))
+            try:
+                conn.execute(
+                    "INSERT INTO inflight (key, expires_at, owner) VALUES (?, ?, ?)", (key, now + ttl_seconds, owner)
+                )
+                return owner
+            except sqlite3.IntegrityError:
+                return None
+
+        return self._transaction(work)
+
+    def release(self, key: str, owner: str) -> None:
+        """Drop ``owner``'s claim; a claim taken over by someone else stays"""
+        with self._lock:
+            self._conn.execute("DELETE FROM inflight WHERE key = ? AND owner = ?", (key, owner))
+
+    def is_claimed(self, key: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM inflight WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+        return row is not None
+
+    # 📦 Result cache
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, value: Dict, ttl_seconds: float) -> None:
+        def work(conn):
+            now = time.time()
+            conn.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now + ttl_seconds),
+            )
+
+        self._transaction(work)
+
+    async def run_once(
+        self,
+        key: str,
+        work,
+        ttl_seconds: float,
+        wait_seconds: float,
+        poll_seconds: float = 0.5,
+        should_cache=None,
+    ):
+        """
+        Return the cached result for ``key``, join a run in another worker,
+        or run ``work()`` and cache its result for ``ttl_seconds``
+
+        If the other worker does not finish within ``wait_seconds`` the work
+        runs here as well, without taking over its claim (so a third worker
+        still waits for it). Results rejected by ``should_cache`` are not
+        shared.
+
+        Returns:
+            (result, "cached" | "joined" | "executed")
+        """
+        cached = await asyncio.to_thread(self.get, key)
+        if cached is not None:
+            return cached, "cached"
+
+        owner = await asyncio.to_thread(self.claim, key, wait_seconds)
+        if owner is None:
+            deadline = time.monotonic() + wait_seconds
+            while time.monotonic() < deadline:
+                await asyncio.sleep(poll_seconds)
+                cached = await asyncio.to_thread(self.get, key)
+                if cached is not None:
+                    return cached, "joined"
+                if not await asyncio.to_thread(self.is_claimed, key):
+                    break  # the other run failed or was cancelled
+            # Take the claim over if it is free; otherwise run unclaimed
+            owner = await asyncio.to_thread(self.claim, key, wait_seconds)
+
+        try:
+            result = await work()
+            if should_cache is None or should_cache(result):
+                # Kept briefly even with caching off, for workers polling above
+                await asyncio.to_thread(self.put, key, result, max(ttl_seconds, 4 * poll_seconds))
+            return result, "executed"
+        finally:
+            if owner is not None:
+                await asyncio.to_thread(self.release, key, owner)
+
+
+@lru_cache(maxsize=1)
+def get_shared_state() -> SharedState:
+    """Lazily constructed global instance"""
+    settings = get_settings()
+    return SharedState(settings.shared_state_path, settings.llm_key_rpm)
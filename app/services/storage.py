@@ -0,0 +1,398 @@
+"""Persistent analysis store with asynchronous batched writes"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.config import get_settings
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+# Columns holding nested JSON (jsonb on Postgres/Supabase, TEXT on SQLite)
+JSON_COLUMNS = ("triage", "usage", "timings", "stages")
+
+COLUMNS = (
+    "study_id",
+    "created_at",
+    "centre_id",
+    "image_type",
+    "image_count",
+    "inputs_digest",
+    "urgency",
+    "model_used",
+    "total_cost",
+    "triage",
+    "findings",
+    "report",
+    "usage",
+    "timings",
+    "stages",
+)
+
+
+# Plain SQL that runs on SQLite and Postgres; {json} is the JSON column type
+_SCHEMA_TEMPLATE = [
+    """
+    CREATE TABLE IF NOT EXISTS analyses (
+        study_id TEXT PRIMARY KEY,
+        created_at TEXT NOT NULL,
+        centre_id TEXT,
+        image_type TEXT,
+        image_count INTEGER,
+        inputs_digest TEXT NOT NULL,
+        urgency TEXT,
+        model_used TEXT,
+        total_cost REAL,
+        triage {json},
+        findings TEXT,
+        report TEXT,
+        usage {json},
+        timings {json},
+        stages {json}
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_analyses_created_at ON analyses (created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_analyses_urgency ON analyses (urgency, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_analyses_centre ON analyses (centre_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_analyses_digest ON analyses (inputs_digest)",
+]
+
+
+def schema(json_type: str) -> List[str]:
+    """
+    DDL for the analyses table
+
+    ``json_type`` is the type of the JSON_COLUMNS: TEXT on SQLite (the
+    repository encodes them), jsonb on Postgres/Supabase (PostgREST takes
+    and returns them as JSON).
+    """
+    return [statement.replace("{json}", json_type) for statement in _SCHEMA_TEMPLATE]
+
+
+SCHEMA = schema("TEXT")  # SQLite
+POSTGRES_SCHEMA = schema("jsonb")  # Supabase: run once in the SQL editor
+
+
+def to_utc_iso(value: datetime) -> str:
+    """ISO 8601 in UTC, the format created_at is stored in (naive = UTC)"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+
+class AnalysisRepository:
+    """Storage interface for analysis records"""
+
+    async def save_many(self, records: List[Dict]) -> None:
+        """Insert or update records (keyed by study_id)"""
+        raise NotImplementedError
+
+    async def get(self, study_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def query(
+        self,
+        start: datetime = None,
+        end: datetime = None,
+        urgency: str = None,
+        centre_id: str = None,
+        limit: int = 100,
+    ) -> List[Dict]:
+        """Newest first, filtered by date range, urgency and centre"""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class SQLiteAnalysisRepository(AnalysisRepository):
+    """Local single-file store"""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                self._conn.execute(statement)
+            # Columns added after a store was first created
+            existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(analyses)")}
+            for column in COLUMNS:
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE analyses ADD COLUMN {column} TEXT")
+
+    def _save_many(self, records: List[Dict]) -> None:
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in COLUMNS if c != "study_id")
+        sql = (
+            f"INSERT INTO analyses ({', '.join(COLUMNS)}) VALUES ({placeholders}) "
+            f"ON CONFLICT (study_id) DO UPDATE SET {updates}"
+        )
+        rows = [
+            tuple(
+                json.dumps(record.get(c)) if c in JSON_COLUMNS else record.get(c)
+                for c in COLUMNS
+            )
+            for record in records
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(sql, rows)
+
+    def _select(self, where: str, params: list, limit: int) -> List[Dict]:
+        sql = f"SELECT * FROM analyses {where} ORDER BY created_at DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(sql, [*params, limit]).fetchall()
+        return [self._decode(row) for row in rows]
+
+    @staticmethod
+    def _decode(row: sqlite3.Row) -> Dict:
+        record = dict(row)
+        for column in JSON_COLUMNS:
+            if record.get(column) is not None:
+                record[column] = json.loads(record[column])
+        return record
+
+    async def save_many(self, records: List[Dict]) -> None:
+        await asyncio.to_thread(self._save_many, records)
+
+    async def get(self, study_id: str) -> Optional[Dict]:
+        rows = await asyncio.to_thread(self._select, "WHERE study_id = ?", [study_id], 1)
+        return rows[0] if rows else None
+
+    async def query(self, start=None, end=None, urgency=None, centre_id=None, limit=100) -> List[Dict]:
+        clauses, params = [], []
+        if start:
+            clauses.append("created_at >= ?")
+            params.append(to_utc_iso(start))
+        if end:
+            clauses.append("created_at < ?")
+            params.append(to_utc_iso(end))
+        if urgency:
+            clauses.append("urgency = ?")
+            params.append(urgency)
+        if centre_id:
+            clauses.append("centre_id = ?")
+            params.append(centre_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return await asyncio.to_thread(self._select, where, params, limit)
+
+    async def close(self) -> None:
+        self._conn.close()
+
+
+class SupabaseAnalysisRepository(AnalysisRepository):
+    """Supabase (PostgREST) adapter; expects the POSTGRES_SCHEMA table (jsonb JSON columns)"""
+
+    def __init__(self, url: str, key: str):
+        self._client = httpx.AsyncClient(
+            base_url=f"{url.rstrip('/')}/rest/v1",
+            headers={"apikey": key, "Authorization": f"Bearer {key}"},
+            timeout=30.0,
+        )
+
+    async def save_many(self, records: List[Dict]) -> None:
+        response = await self._client.post(
+            "/analyses",
+            json=[{c: record.get(c) for c in COLUMNS} for record in records],
+            headers={"Prefer": "resolution=merge-duplicates,return=minimal"},
+        )
+        response.raise_for_status()
+
+    async def get(self, study_id: str) -> Optional[Dict]:
+        response = await self._client.get("/analyses", params={"study_id": f"eq.{study_id}", "limit": 1})
+        response.raise_for_status()
+        rows = response.json()
+        return rows[0] if rows else None
+
+    async def query(self, start=None, end=None, urgency=None, centre_id=None, limit=100) -> List[Dict]:
+        params = [("order", "created_at.desc"), ("limit", str(limit))]
+        if start:
+            params.append(("created_at", f"gte.{to_utc_iso(start)}"))
+        if end:
+            params.append(("created_at", f"lt.{to_utc_iso(end)}"))
+        if urgency:
+            params.append(("urgency", f"eq.{urgency}"))
+        if centre_id:
+            params.append(("centre_id", f"eq.{centre_id}"))
+        response = await self._client.get("/analyses", params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+class AnalysisWriter:
+    """
+    Buffers records and writes them in batches from a background task
+
+    ``submit`` never awaits I/O, so persisting a study adds no latency to
+    the request that produced it.
+    """
+
+    def __init__(self, repository: AnalysisRepository, batch_size: int, flush_interval: float, max_queue: int):
+        self.repository = repository
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+
+    def submit(self, record: Dict) -> None:
+        """Queue a record for writing"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            metrics.increment("storage_records", outcome="dropped")
+            logger.warning(f"Analysis store queue full, dropping {record.get('study_id')}")
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            deadline = asyncio.get_running_loop().time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._write(batch)
+
+    async def _write(self, batch: List[Dict]) -> None:
+        try:
+            await self.repository.save_many(batch)
+            metrics.increment("storage_records", len(batch), outcome="written")
+        except Exception as e:
+            metrics.increment("storage_records", len(batch), outcome="failed")
+            logger.error(f"Failed to persist {len(batch)} analyses: {e}")
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    async def flush(self) -> None:
+        """Write everything queued so far"""
+        batch = []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if batch:
+            await self._write(batch)
+        await self._queue.join()  # batches already taken by the background task
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+        await self.repository.close()
+
+
+class StudyBlobStore:
+    """
+    Images and patient inputs of partial studies, kept so the missing
+    stages can be resumed without a new upload
+
+    One JSON file per study at ``<root>/<id[:2]>/<id>.json``, found by path
+    alone. Files older than ``ttl_seconds`` read as gone; a sweep deletes
+    them at most once per ``sweep_interval`` seconds, not on every save.
+    """
+
+    def __init__(self, root: str, ttl_seconds: float, sweep_interval: float = 3600.0):
+        self.root = Path(root)
+        self.ttl_seconds = ttl_seconds
+        self.sweep_interval = sweep_interval
+        self._swept_at = 0.0
+
+    def _path(self, study_id: str) -> Path:
+        return self.root / study_id[:2] / f"{study_id}.json"
+
+    def _save(self, study_id: str, images: List[str], inputs: Dict) -> None:
+        path = self._path(study_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({**inputs, "images": images}))
+        if time.time() - self._swept_at >= self.sweep_interval:
+            self._sweep()
+
+    def _sweep(self) -> None:
+        """Delete expired files"""
+        self._swept_at = time.time()
+        expired = self._swept_at - self.ttl_seconds
+        for path in self.root.glob("*/*.json"):
+            if path.stat().st_mtime < expired:
+                path.unlink(missing_ok=True)
+
+    def _load(self, study_id: str) -> Optional[Dict]:
+        path = self._path(study_id)
+        try:
+            if path.stat().st_mtime < time.time() - self.ttl_seconds:
+                return None  # expired, not swept yet
+            return json.loads(path.read_text())
+        except FileNotFoundError:
+            return None
+
+    async def save(self, study_id: str, images: List[str], inputs: Dict) -> None:
+        await asyncio.to_thread(self._save, study_id, images, inputs)
+
+    async def load(self, study_id: str) -> Optional[Dict]:
+        """Stored inputs plus ``images``, or None if gone"""
+        return await asyncio.to_thread(self._load, study_id)
+
+    async def delete(self, study_id: str) -> None:
+        await asyncio.to_thread(self._path(study_id).unlink, missing_ok=True)
+
+
+class NullAnalysisWriter:
+    """Used when storage is disabled"""
+
+    repository = None
+
+    def submit(self, record: Dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+@lru_cache(maxsize=1)
+def get_analysis_writer():
+    """Lazily constructed global writer for the configured backend"""
+    settings = get_settings()
+
+    if settings.storage_backend == "none":
+        return NullAnalysisWriter()
+    if settings.storage_backend == "sqlite":
+        repository = SQLiteAnalysisRepository(settings.storage_path)
+    elif settings.storage_backend == "supabase":
+        if not settings.supabase_url or not settings.supabase_key:
+            raise ValueError("SUPABASE_URL and SUPABASE_KEY are required for the supabase store")
+        repository = SupabaseAnalysisRepository(settings.supabase_url, settings.supabase_key)
+    else:
+        raise ValueError(f"Unknown storage backend: {settings.storage_backend}")
+
+    return AnalysisWriter(
+        repository,
+        batch_size=settings.storage_batch_size,
+        flush_interval=settings.storage_flush_interval_seconds,
+        max_queue=settings.storage_max_queue,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_study_blob_store() -> StudyBlobStore:
+    """Lazily constructed global instance"""
+    settings = get_settings()
+    return StudyBlobStore(settings.study_blob_path, settings.study_blob_ttl_seconds)
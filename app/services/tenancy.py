@@ -0,0 +1,230 @@
+"""Per-tenant rate limits, spend quotas and weighted fair scheduling"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, Optional
+
+from app.config import get_settings
+from app.utils.metrics import metrics
+from app.utils.tracing import span
+
+
+class QuotaExceeded(Exception):
+    """Raised when a tenant is over its rate limit or spend quota"""
+
+    def __init__(self, message: str, retry_after: Optional[float]):
+        super().__init__(message)
+        self.retry_after = retry_after  # None: retrying will not help
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """Retry-After for the 429, when a retry can succeed"""
+        if self.retry_after is None or not math.isfinite(self.retry_after):
+            return {}
+        return {"Retry-After": str(int(self.retry_after) + 1)}
+
+
+class TokenBucket:
+    """Classic token bucket: ``rate`` tokens per second, up to ``capacity``"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, amount: float = 1) -> bool:
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def retry_after(self, amount: float = 1) -> float:
+        """Seconds until ``amount`` tokens are available"""
+        self._refill()
+        return max(0.0, (amount - self.tokens) / self.rate) if self.rate > 0 else float("inf")
+
+
+class Tenant:
+    """Limits and running spend for one tenant (diagnostic centre)"""
+
+    def __init__(self, tenant_id: str, rate_per_minute: float, burst: float, daily_spend_limit: float, weight: float):
+        self.tenant_id = tenant_id
+        self.bucket = TokenBucket(rate_per_minute / 60, burst)
+        self.daily_spend_limit = daily_spend_limit
+        self.weight = weight
+        self.spend_day = None
+        self.spend_today = 0.0
+        self.last_finish_tag = 0.0  # weighted fair queuing state
+        self.queued = 0
+
+    def _roll_day(self) -> None:
+        today = datetime.now(timezone.utc).date()
+        if today != self.spend_day:
+            self.spend_day = today
+            self.spend_today = 0.0
+
+    def check(self) -> None:
+        """Consume one request from the bucket or raise QuotaExceeded"""
+        self._roll_day()
+        if self.bucket.rate <= 0:
+            raise QuotaExceeded(f"Tenant {self.tenant_id} is disabled (rate_per_minute 0)", retry_after=None)
+        if self.daily_spend_limit and self.spend_today >= self.daily_spend_limit:
+            now = datetime.now(timezone.utc)
+            midnight = datetime.combine(now.date(), datetime.min.time(), tzinfo=timezone.utc).timestamp() + 86400
+            raise QuotaExceeded(
+                f"Daily spend quota of ${self.daily_spend_limit:.2f} reached for tenant {self.tenant_id}",
+                retry_after=midnight - now.timestamp(),
+            )
+        if not self.bucket.try_acquire():
+            raise QuotaExceeded(
+                f"Rate limit exceeded for tenant {self.tenant_id}",
+                retry_after=self.bucket.retry_after(),
+            )
+
+    def record_spend(self, cost: float) -> None:
+        self._roll_day()
+        self.spend_today += cost
+
+
+class FairScheduler:
+    """
+    Weighted fair queuing in front of the pipeline
+
+    At most ``concurrency`` studies run at once. When studies have to wait,
+    each gets a virtual finish tag of ``max(virtual time, tenant's previous
+    tag) + cost / weight`` and the smallest tag runs next, so a tenant
+    uploading in bulk cannot starve the others.
+    """
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.active = 0
+        self.virtual_time = 0.0
+        self._waiting = []  # heap of (finish_tag, seq, start_tag, tenant, future)
+        self._seq = itertools.count()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiting)
+
+    async def acquire(self, tenant: Tenant, cost: float = 1) -> None:
+        """Wait for a pipeline slot"""
+        if self.active < self.concurrency and not self._waiting:
+            self.active += 1
+            return
+
+        start_tag = max(self.virtual_time, tenant.last_finish_tag)
+        finish_tag = start_tag + cost / tenant.weight
+        tenant.last_finish_tag = finish_tag
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (finish_tag, next(self._seq), start_tag, tenant, future)
+        heapq.heappush(self._waiting, entry)
+        tenant.queued += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # slot was handed over just as we were cancelled
+            elif entry in self._waiting:  # release() may have dropped it already
+                # Gone now, not when release() reaches it: queue_depth feeds /ready and routing
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+            raise
+        finally:
+            tenant.queued -= 1
+
+    def release(self) -> None:
+        """Hand the slot to the waiting study with the smallest finish tag"""
+        while self._waiting:
+            _, _, start_tag, _, future = heapq.heappop(self._waiting)
+            if future.cancelled():
+                continue
+            self.virtual_time = max(self.virtual_time, start_tag)
+            future.set_result(None)
+            return
+        self.active -= 1
+
+
+class TenantManager:
+    """Tracks tenants and fronts the pipeline with quotas and fair scheduling"""
+
+    def __init__(self):
+        self.settings = get_settings()
+        self.tenants: Dict[str, Tenant] = {}
+        self.scheduler = FairScheduler(self.settings.pipeline_concurrency)
+
+    def get_tenant(self, tenant_id: str) -> Tenant:
+        tenant = self.tenants.get(tenant_id)
+        if tenant is None:
+            overrides = self.settings.tenant_overrides.get(tenant_id, {})
+            tenant = Tenant(
+                tenant_id,
+                rate_per_minute=overrides.get("rate_per_minute", self.settings.tenant_rate_per_minute),
+                burst=overrides.get("burst", self.settings.tenant_burst),
+                daily_spend_limit=overrides.get("daily_spend_limit", self.settings.tenant_daily_spend_limit),
+                weight=overrides.get("weight", 1.0),
+            )
+            self.tenants[tenant_id] = tenant
+        return tenant
+
+    async def run(self, tenant_id: str, pipeline, cost: float = 1) -> Dict:
+        """
+        Run ``pipeline()`` for a tenant
+
+        Raises:
+            QuotaExceeded: tenant is over its rate limit or daily spend
+        """
+        tenant = self.get_tenant(tenant_id)
+        tenant.check()
+
+        queued_at = time.perf_counter()
+        with span("queue", tenant=tenant_id, queue_depth=self.scheduler.queue_depth):
+            await self.scheduler.acquire(tenant, cost)
+        started_at = time.perf_counter()
+        metrics.observe("tenant_queue_seconds", started_at - queued_at, tenant=tenant_id)
+
+        try:
+            result = await pipeline()
+        finally:
+            self.scheduler.release()
+            metrics.observe("tenant_latency_seconds", time.perf_counter() - queued_at, tenant=tenant_id)
+
+        spend = result.get("total_cost", 0.0)
+        tenant.record_spend(spend)
+        metrics.increment("tenant_spend_usd", spend, tenant=tenant_id)
+        metrics.increment("tenant_studies", tenant=tenant_id)
+        return result
+
+    def stats(self) -> Dict:
+        return {
+            "active": self.scheduler.active,
+            "queue_depth": self.scheduler.queue_depth,
+            "tenants": {
+                tenant_id: {
+                    "queued": tenant.queued,
+                    "spend_today": tenant.spend_today,
+                    "daily_spend_limit": tenant.daily_spend_limit,
+                    "weight": tenant.weight,
+                }
+                for tenant_id, tenant in self.tenants.items()
+            },
+        }
+
+
+@lru_cache(maxsize=1)
+def get_tenant_manager() -> TenantManager:
+    """Lazily constructed global instance"""
+    return TenantManager()
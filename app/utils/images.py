@@ -0,0 +1,26 @@
+"""Image encoding helpers"""
+import asyncio
+import base64
+import hashlib
+from typing import List
+
+ALLOWED_CONTENT_TYPES = ["image/jpeg", "image/png"]
+
+
+def to_data_url(contents: bytes, content_type: str = "image/jpeg") -> str:
+    """Encode raw image bytes as a base64 data URL"""
+    return f"data:{content_type};base64,{base64.b64encode(contents).decode()}"
+
+
+async def to_data_url_async(contents: bytes, content_type: str = "image/jpeg") -> str:
+    """Encode off the event loop; films are several MB"""
+    return await asyncio.to_thread(to_data_url, contents, content_type)
+
+
+def study_digest(images: List[str], image_type: str, patient_age: int = None, clinical_indications: str = None) -> str:
+    """SHA-256 over everything that determines the pipeline output"""
+    digest = hashlib.sha256()
+    for image in images:
+        digest.update(image.encode())
+    digest.update(f"|{image_type}|{patient_age}|{clinical_indications}".encode())
+    return digest.hexdigest()
@@ -1,9 +1,6 @@
 """Logging configuration"""
 import logging
 import sys
-from app.config import get_settings
-
-settings = get_settings()
 
 def setup_logger():
     logger = logging.getLogger("radiology_ai")
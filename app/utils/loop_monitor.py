@@ -0,0 +1,94 @@
+"""Event-loop lag monitor and blocking-call detector
+
+A heartbeat task on the loop measures how late each of its wake-ups is and
+records that as the ``event_loop_lag_seconds`` histogram. A watchdog thread
+watches the heartbeat: when the loop has not come back for longer than
+LOOP_BLOCK_THRESHOLD_SECONDS, it logs the loop thread's current stack, i.e.
+the code that is blocking it. One stack is logged per stall.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from functools import lru_cache
+from typing import Optional
+
+from app.config import get_settings
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class LoopMonitor:
+    """Heartbeat on the event loop plus a watchdog thread that dumps stalls"""
+
+    def __init__(self, interval: float, block_threshold: float):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.blocked = 0  # stalls detected
+        self._last_beat = time.monotonic()
+        self._loop_thread_id = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        """Start monitoring the running loop"""
+        if self._heartbeat is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._heartbeat = asyncio.create_task(self._beat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        if self._heartbeat is None:
+            return
+        self._stop.set()
+        self._heartbeat.cancel()
+        await asyncio.gather(self._heartbeat, return_exceptions=True)
+        await asyncio.to_thread(self._watchdog.join)
+        self._heartbeat = self._watchdog = None
+
+    async def _beat(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - scheduled - self.interval)
+            self._last_beat = time.monotonic()
+            metrics.histogram("event_loop_lag_seconds", lag, LAG_BUCKETS)
+
+    def _watch(self) -> None:
+        reported_beat = None
+        while not self._stop.wait(self.block_threshold / 2):
+            last_beat = self._last_beat
+            stalled = time.monotonic() - last_beat - self.interval
+            if stalled < self.block_threshold or last_beat == reported_beat:
+                continue
+            reported_beat = last_beat  # one report per stall
+            self.blocked += 1
+            metrics.increment("event_loop_blocked")
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "(no frame)"
+            logger.warning(f"Event loop blocked for {stalled:.3f}s+, loop thread stack:\n{stack}")
+
+    def stats(self) -> dict:
+        return {
+            "running": self._heartbeat is not None,
+            "interval": self.interval,
+            "block_threshold": self.block_threshold,
+            "blocked": self.blocked,
+        }
+
+
+@lru_cache(maxsize=1)
+def get_loop_monitor() -> LoopMonitor:
+    """Lazily constructed global instance"""
+    settings = get_settings()
+    return LoopMonitor(settings.loop_monitor_interval_seconds, settings.loop_block_threshold_seconds)
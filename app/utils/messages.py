@@ -0,0 +1,30 @@
+"""Builders for OpenAI-style multimodal message content"""
+from typing import Dict, List
+
+from app.config import get_settings
+
+
+def text_part(text: str, cacheable: bool = False) -> Dict:
+    """
+    Text content part
+
+    Args:
+        text: Part text
+        cacheable: Mark the end of a static prefix with a ``cache_control``
+            breakpoint, for providers without automatic prefix caching
+    """
+    part = {"type": "text", "text": text}
+    if cacheable and get_settings().prompt_cache_control:
+        part["cache_control"] = {"type": "ephemeral"}
+    return part
+
+
+def image_parts(images: List[str]) -> List[Dict]:
+    """``image_url`` content parts, one per view"""
+    return [
+        {
+            "type": "image_url",
+            "image_url": {"url": image}
+        }
+        for image in images
+    ]
@@ -0,0 +1,70 @@
+"""In-process metrics registry"""
+import threading
+from collections import defaultdict
+from typing import Dict
+
+
+class Metrics:
+    """Thread-safe counters and value summaries, exposed via /metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._summaries = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict) -> str:
+        """Render a metric name with its labels, Prometheus style"""
+        if not labels:
+            return name
+        rendered = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+        return f"{name}{{{rendered}}}"
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        """Increase a counter"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] += value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Record a value (latency, tokens, ...) into a running summary"""
+        key = self._key(name, labels)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = {"count": 0, "sum": 0.0, "max": value}
+                self._summaries[key] = summary
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["max"] = max(summary["max"], value)
+
+    def histogram(self, name: str, value: float, buckets, **labels) -> None:
+        """Record a value into cumulative ``<name>_bucket{le=...}`` counters and a summary"""
+        with self._lock:
+            for bound in buckets:
+                if value <= bound:
+                    self._counters[self._key(f"{name}_bucket", {**labels, "le": bound})] += 1
+            self._counters[self._key(f"{name}_bucket", {**labels, "le": "+Inf"})] += 1
+        self.observe(name, value, **labels)
+
+    def average(self, name: str, **labels) -> float:
+        """Mean of an observed summary, 0 if nothing recorded yet"""
+        key = self._key(name, labels)
+        with self._lock:
+            summary = self._summaries.get(key)
+            return summary["sum"] / summary["count"] if summary else 0.0
+
+    def snapshot(self) -> Dict:
+        """Return a copy of all metrics"""
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "summaries": {
+                    key: {**summary, "avg": summary["sum"] / summary["count"]}
+                    for key, summary in self._summaries.items()
+                },
+            }
+
+
+# Global instance
+metrics = Metrics()
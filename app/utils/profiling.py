@@ -0,0 +1,121 @@
+"""On-demand profiling of single requests
+
+A request is profiled when it carries ``X-Profile: <PROFILING_TOKEN>`` or is
+picked by PROFILING_SAMPLE_RATE. With neither configured nothing here runs.
+
+cProfile hooks the whole event-loop thread, so a profile also contains any
+other requests interleaved with the profiled one; only one profile runs at a
+time. Each profile is written to PROFILING_DIR as ``<trace id>.prof``
+(pstats format, e.g. for snakeviz) and ``<trace id>.json`` with event-loop
+lag samples and the top functions by cumulative time.
+"""
+
+import asyncio
+import cProfile
+import hmac
+import json
+import pstats
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.config import get_settings
+from app.utils.logger import logger
+from app.utils.metrics import metrics
+
+TOP_FUNCTIONS = 30
+
+# cProfile allows one active profiler per process
+_profiling = threading.Lock()
+
+
+def profiling_requested(token: Optional[str]) -> bool:
+    """Whether this request should be profiled (cheap when profiling is off)"""
+    settings = get_settings()
+    if token and settings.profiling_token:
+        return hmac.compare_digest(token, settings.profiling_token)
+    return settings.profiling_sample_rate > 0 and random.random() < settings.profiling_sample_rate
+
+
+class RequestProfile:
+    """cProfile plus event-loop lag samples for one request"""
+
+    def __init__(self, name: str):
+        settings = get_settings()
+        self.name = name
+        self.directory = Path(settings.profiling_dir)
+        self.lag_interval = settings.profiling_lag_interval_seconds
+        self.lags: List[float] = []
+        self._profiler = cProfile.Profile()
+        self._lag_task = None
+        self._start = None
+
+    def start(self) -> bool:
+        """Begin profiling; False if another profile is already running"""
+        if not _profiling.acquire(blocking=False):
+            metrics.increment("profiles", outcome="busy")
+            return False
+        self._start = time.perf_counter()
+        self._lag_task = asyncio.create_task(self._sample_lag())
+        self._profiler.enable()
+        return True
+
+    async def _sample_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time()
+            await asyncio.sleep(self.lag_interval)
+            self.lags.append(max(0.0, loop.time() - scheduled - self.lag_interval))
+
+    async def stop(self) -> str:
+        """Stop profiling and write the dumps; returns the .prof path"""
+        try:
+            self._profiler.disable()
+            self._lag_task.cancel()
+            duration = time.perf_counter() - self._start
+        finally:
+            _profiling.release()
+
+        path = await asyncio.to_thread(self._write, duration)
+        metrics.increment("profiles", outcome="written")
+        logger.info(f"Profile written to {path}")
+        return str(path)
+
+    def _write(self, duration: float) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        prof_path = self.directory / f"{self.name}.prof"
+        self._profiler.dump_stats(prof_path)
+
+        profile = pstats.Stats(self._profiler).sort_stats("cumulative").get_stats_profile()
+        top = sorted(profile.func_profiles.items(), key=lambda item: item[1].cumtime, reverse=True)
+        summary = {
+            "name": self.name,
+            "duration": duration,
+            "loop_lag": self._lag_summary(),
+            "top_functions": [
+                {
+                    "function": f"{stats.file_name}:{stats.line_number}({function})",
+                    "ncalls": stats.ncalls,
+                    "tottime": stats.tottime,
+                    "cumtime": stats.cumtime,
+                }
+                for function, stats in top[:TOP_FUNCTIONS]
+            ],
+        }
+        with open(self.directory / f"{self.name}.json", "w") as f:
+            json.dump(summary, f, indent=2)
+        return prof_path
+
+    def _lag_summary(self) -> Dict:
+        if not self.lags:
+            return {"samples": 0}
+        ordered = sorted(self.lags)
+        return {
+            "samples": len(ordered),
+            "interval": self.lag_interval,
+            "mean": sum(ordered) / len(ordered),
+            "p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+            "max": ordered[-1],
+        }
@@ -0,0 +1,35 @@
+"""Approximate token counting for prompt budgeting"""
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # optional dependency
+    tiktoken = None
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:  # encoding files are downloaded on first use
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count tokens in ``text``
+
+    Uses tiktoken's o200k_base encoding when available. Otherwise falls back
+    to ~4 characters per token, which is close enough for comparing prompt
+    variants but not for billing.
+    """
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+
+def tokenizer_name() -> str:
+    return "tiktoken/o200k_base" if _encoding() else "chars/4 estimate"
@@ -0,0 +1,211 @@
+"""Lightweight span tracing, exported as OTLP/JSON
+
+Spans nest through a context variable, so stages started inside a request
+(including tasks it spawns) become children of the request span. When the
+root span ends, the whole trace is handed to a background exporter that
+appends it to a JSON-lines file and/or POSTs it to an OTLP/HTTP collector
+(``/v1/traces``).
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.config import get_settings
+from app.utils.logger import logger
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class _Trace:
+    """Spans sharing one trace id"""
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List["Span"] = []
+
+
+class Span:
+    """One timed operation with attributes"""
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, attributes: Dict = None):
+        self.name = name
+        self.parent = parent
+        self.trace = parent.trace if parent else _Trace()
+        self.span_id = os.urandom(8).hex()
+        self.attributes = dict(attributes or {})
+        self.error = None
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self._end = None
+        self.trace.spans.append(self)
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    @property
+    def duration(self) -> float:
+        """Seconds, up to now if the span is still open"""
+        return (self._end or time.perf_counter()) - self._start
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def end(self) -> None:
+        self._end = time.perf_counter()
+
+    def timings(self) -> Dict[str, float]:
+        """Seconds per span name under this span (repeated names are summed)"""
+        breakdown = defaultdict(float)
+        for span in self.trace.spans:
+            ancestor = span.parent
+            while ancestor is not None and ancestor is not self:
+                ancestor = ancestor.parent
+            if ancestor is self:
+                breakdown[span.name] += span.duration
+        breakdown["total"] = self.duration
+        return {name: round(seconds, 4) for name, seconds in breakdown.items()}
+
+    def to_otlp(self) -> Dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.start_ns + int(self.duration * 1e9)),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items() if v is not None],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent:
+            span["parentSpanId"] = self.parent.span_id
+        return span
+
+
+def _otlp_attribute(key: str, value) -> Dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time a block as a child of the current span
+
+    Usage:
+        with span("triage", image_type=image_type) as s:
+            ...
+            s.set_attribute("urgency", urgency)
+    """
+    parent = _current_span.get()
+    current = Span(name, parent, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end()
+        _current_span.reset(token)
+        if parent is None:
+            get_exporter().export(current.trace)
+
+
+class SpanExporter:
+    """Ships finished traces from a background thread, off the event loop"""
+
+    def __init__(self, path: str = None, endpoint: str = None, service_name: str = "xray-api"):
+        self.path = path
+        self.endpoint = endpoint
+        self.resource = {"attributes": [_otlp_attribute("service.name", service_name)]}
+        self.enabled = bool(path or endpoint)
+        self._queue = queue.Queue(maxsize=10000)
+        self._thread = None
+
+    def export(self, trace: _Trace) -> None:
+        if not self.enabled:
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+            self._thread.start()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            logger.warning("Span export queue full, dropping trace")
+
+    def _payload(self, traces: List[_Trace]) -> Dict:
+        return {
+            "resourceSpans": [{
+                "resource": self.resource,
+                "scopeSpans": [{
+                    "scope": {"name": "app"},
+                    "spans": [s.to_otlp() for trace in traces for s in trace.spans],
+                }],
+            }]
+        }
+
+    def _run(self) -> None:
+        client = httpx.Client(timeout=10.0) if self.endpoint else None
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        while True:
+            items = [self._queue.get()]
+            while len(items) < 100:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            traces = [t for t in items if t is not None]
+            if traces:
+                self._write(client, self._payload(traces))
+            if None in items:
+                break
+        if client:
+            client.close()
+
+    def _write(self, client, payload: Dict) -> None:
+        try:
+            if self.path:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(payload) + "\n")
+            if client:
+                client.post(self.endpoint, json=payload).raise_for_status()
+        except Exception as e:
+            logger.warning(f"Span export failed: {e}")
+
+    def shutdown(self) -> None:
+        """Flush queued traces and stop the thread"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=10)
+            self._thread = None
+
+
+@lru_cache(maxsize=1)
+def get_exporter() -> SpanExporter:
+    """Lazily constructed global instance"""
+    settings = get_settings()
+    return SpanExporter(settings.tracing_export_path, settings.tracing_otlp_endpoint, settings.tracing_service_name)
@@ -0,0 +1,265 @@
+"""Re-process an archive of films through the full pipeline
+
+Usage:
+    python -m scripts.backfill (--dir archive/ [--group-by-dir] | --manifest studies.jsonl)
+        --output results.jsonl [--format jsonl|parquet] [--concurrency 8]
+        [--rpm-per-key 20] [--image-type chest]
+
+--dir treats every JPEG/PNG as a study. With --group-by-dir, each directory's
+films form one multi-view study. A manifest is JSONL or CSV with ``id``,
+``paths`` (";"-separated), and optionally ``image_type``, ``patient_age``,
+``clinical_indications`` and ``centre_id``.
+
+Ids of complete studies are appended to ``<output>.checkpoint``. Rerunning
+the same command skips them, so an interrupted backfill resumes where it
+stopped. Failures, and partial studies (a stage after triage failed), go to
+``<output>.errors.jsonl`` instead and are retried on the next run. Parquet
+output (requires pyarrow) is a directory of part files, one per
+``--flush-every`` studies.
+
+--rpm-per-key caps LLM requests per minute for each configured API key
+(default: LLM_KEY_RPM). It is enforced per call by the shared key limiter,
+so with the service's SHARED_STATE_PATH a backfill and live traffic share
+each key's budget.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import sys
+import time
+from pathlib import Path
+
+from app.core.router import get_xray_router
+from app.services.llm_provider import get_llm_provider
+from app.services.shared_state import get_shared_state
+from app.services.storage import get_analysis_writer
+from app.utils.images import to_data_url_async
+
+IMAGE_SUFFIXES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png"}
+
+
+def scan_directory(root: Path, group_by_dir: bool, image_type: str) -> list:
+    films = sorted(p for p in root.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not group_by_dir:
+        return [{"id": str(p.relative_to(root)), "paths": [str(p)], "image_type": image_type} for p in films]
+
+    studies = {}
+    for p in films:
+        studies.setdefault(p.parent, []).append(str(p))
+    return [
+        {"id": str(directory.relative_to(root)), "paths": paths, "image_type": image_type}
+        for directory, paths in studies.items()
+    ]
+
+
+def read_manifest(path: Path, image_type: str) -> list:
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f)) if path.suffix.lower() == ".csv" else [json.loads(line) for line in f if line.strip()]
+
+    studies = []
+    for row in rows:
+        paths = row["paths"]
+        studies.append({
+            "id": str(row.get("id") or paths),
+            "paths": paths.split(";") if isinstance(paths, str) else paths,
+            "image_type": row.get("image_type") or image_type,
+            "patient_age": int(row["patient_age"]) if row.get("patient_age") not in (None, "") else None,
+            "clinical_indications": row.get("clinical_indications") or None,
+            "centre_id": row.get("centre_id") or None,
+        })
+    return studies
+
+
+def flatten(study: dict, result: dict) -> dict:
+    """One output row per study, flat enough for columnar formats"""
+    triage = result.get("triage") or {}
+    usage = result.get("usage") or {}
+    return {
+        "id": study["id"],
+        "paths": ";".join(study["paths"]),
+        "image_type": study["image_type"],
+        "study_id": result["study_id"],
+        "status": result.get("status", "complete"),
+        "stages": json.dumps(result.get("stages") or {}),
+        "urgency": triage.get("urgency"),
+        "complexity": triage.get("complexity"),
+        "confidence": triage.get("confidence"),
+        "model_used": result.get("model_used"),
+        "total_cost": result.get("total_cost"),
+        "processing_time": result.get("processing_time"),
+        "prompt_tokens": sum(u.get("prompt_tokens", 0) for u in usage.values()),
+        "completion_tokens": sum(u.get("completion_tokens", 0) for u in usage.values()),
+        "findings": result.get("findings"),
+        "report": result.get("report"),
+    }
+
+
+class JSONLSink:
+    def __init__(self, output: Path):
+        self._file = open(output, "a")
+
+    def write(self, rows: list) -> None:
+        for row in rows:
+            self._file.write(json.dumps(row) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetSink:
+    """Directory of part files; each write is a new part, so resumed runs never rewrite old ones"""
+
+    def __init__(self, output: Path):
+        try:
+            import pyarrow  # noqa: F401
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise SystemExit("Parquet output requires pyarrow (pip install pyarrow)")
+        self.output = output
+        self.output.mkdir(parents=True, exist_ok=True)
+        self._part = len(list(self.output.glob("part-*.parquet")))
+
+    def write(self, rows: list) -> None:
+        import pyarrow
+        import pyarrow.parquet
+
+        table = pyarrow.Table.from_pylist(rows)
+        pyarrow.parquet.write_table(table, self.output / f"part-{self._part:05d}.parquet")
+        self._part += 1
+
+    def close(self) -> None:
+        pass
+
+
+class Progress:
+    """Live throughput and ETA on stderr"""
+
+    def __init__(self, total: int, skipped: int):
+        self.total = total
+        self.skipped = skipped
+        self.done = 0
+        self.failed = 0
+        self.cost = 0.0
+        self.started = time.monotonic()
+
+    def line(self) -> str:
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed else 0.0
+        remaining = self.total - self.skipped - self.done - self.failed
+        eta = remaining / rate if rate else float("inf")
+        eta_text = time.strftime("%H:%M:%S", time.gmtime(eta)) if eta != float("inf") else "--:--:--"
+        return (
+            f"{self.skipped + self.done}/{self.total} done, {self.failed} failed | "
+            f"{rate * 60:.1f} studies/min | ${self.cost:.2f} | ETA {eta_text}"
+        )
+
+    async def report(self, interval: float = 2.0) -> None:
+        while True:
+            print(f"\r{self.line()}", end="", file=sys.stderr, flush=True)
+            await asyncio.sleep(interval)
+
+
+async def run(args) -> None:
+    studies = read_manifest(Path(args.manifest), args.image_type) if args.manifest else \
+        scan_directory(Path(args.dir), args.group_by_dir, args.image_type)
+
+    output = Path(args.output)
+    checkpoint_path = Path(f"{args.output}.checkpoint")
+    completed = set(checkpoint_path.read_text().split("\n")) if checkpoint_path.exists() else set()
+    todo = [s for s in studies if s["id"] not in completed]
+
+    sink = ParquetSink(output) if args.format == "parquet" else JSONLSink(output)
+    checkpoint = open(checkpoint_path, "a")
+    errors = open(f"{args.output}.errors.jsonl", "a")
+    progress = Progress(len(studies), len(studies) - len(todo))
+
+    if args.rpm_per_key is not None:
+        get_shared_state().key_rpm = args.rpm_per_key
+
+    buffer = []
+    queue = asyncio.Queue()
+    for study in todo:
+        queue.put_nowait(study)
+
+    def commit(rows: list) -> None:
+        """Only complete studies are buffered, so every written row is checkpointed"""
+        sink.write(rows)
+        checkpoint.write("".join(f"{row['id']}\n" for row in rows))
+        checkpoint.flush()
+
+    def fail(study: dict, error: dict) -> None:
+        progress.failed += 1
+        errors.write(json.dumps({"id": study["id"], **error}) + "\n")
+        errors.flush()
+
+    async def worker() -> None:
+        router = get_xray_router()
+        while not queue.empty():
+            study = queue.get_nowait()
+            try:
+                images = []
+                for path in study["paths"]:
+                    contents = await asyncio.to_thread(Path(path).read_bytes)
+                    images.append(await to_data_url_async(contents, IMAGE_SUFFIXES[Path(path).suffix.lower()]))
+                result = await router.analyze_xray(
+                    images,
+                    image_type=study["image_type"],
+                    patient_age=study.get("patient_age"),
+                    clinical_indications=study.get("clinical_indications"),
+                    centre_id=study.get("centre_id"),
+                )
+            except Exception as e:
+                fail(study, {"error": f"{type(e).__name__}: {e}"})
+                continue
+
+            progress.cost += result.get("total_cost", 0.0)
+            if result.get("status", "complete") != "complete":
+                # Not checkpointed: the next run processes the study again
+                fail(study, {"study_id": result["study_id"], "error": "partial", "stages": result.get("stages")})
+                continue
+            progress.done += 1
+            buffer.append(flatten(study, result))
+            if len(buffer) >= args.flush_every:
+                commit(buffer[:])
+                buffer.clear()
+
+    reporter = asyncio.create_task(progress.report())
+    try:
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    finally:
+        if buffer:
+            commit(buffer)
+        reporter.cancel()
+        print(f"\r{progress.line()}", file=sys.stderr)
+        sink.close()
+        checkpoint.close()
+        errors.close()
+        await get_analysis_writer().close()
+        await get_llm_provider().aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dir", help="archive directory to walk")
+    source.add_argument("--manifest", help="JSONL or CSV list of studies")
+    parser.add_argument("--group-by-dir", action="store_true", help="one multi-view study per directory")
+    parser.add_argument("--image-type", default="chest")
+    parser.add_argument("--output", required=True, help="JSONL file, or directory for parquet")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    parser.add_argument("--concurrency", type=int, default=8, help="studies in flight")
+    parser.add_argument(
+        "--rpm-per-key", type=float, default=None, help="LLM requests/min per API key (default LLM_KEY_RPM, 0 = unlimited)"
+    )
+    parser.add_argument("--flush-every", type=int, default=None, help="studies per write (default: 1 jsonl, 50 parquet)")
+    args = parser.parse_args()
+    if args.flush_every is None:
+        args.flush_every = 50 if args.format == "parquet" else 1
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Compare per-call overhead of the LLM backends
+
+Usage:
+    python -m scripts.benchmark_backends [--calls 500] [--concurrency 10]
+
+The upstream API is replaced by an in-process httpx.MockTransport that
+answers instantly, so the numbers are purely our own client-side overhead
+(request building, serialisation, response parsing).
+"""
+import argparse
+import asyncio
+import base64
+import json
+import statistics
+import time
+
+import httpx
+
+from app.services.llm_provider import HTTPXBackend, LangChainBackend
+
+COMPLETION = {
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "bench-model",
+    "choices": [{
+        "index": 0,
+        "message": {"role": "assistant", "content": "- Trachea: midline\n" * 40},
+        "finish_reason": "stop",
+    }],
+    "usage": {"prompt_tokens": 1500, "completion_tokens": 400, "total_tokens": 1900},
+}
+
+# ~100 KB image, roughly the size of a downscaled chest film
+MESSAGES = [
+    {"role": "system", "content": "You are an expert radiologist. " * 200},
+    {
+        "role": "user",
+        "content": [
+            {"type": "text", "text": "Document objective findings. " * 100},
+            {
+                "type": "image_url",
+                "image_url": {"url": "data:image/jpeg;base64," + base64.b64encode(b"\0" * 100_000).decode()},
+            },
+        ],
+    },
+]
+
+
+def handler(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, json=COMPLETION)
+
+
+async def run_backend(backend_cls, calls: int, concurrency: int) -> list:
+    """Return per-call latencies in seconds"""
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+        backend = backend_cls(client)
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def one_call():
+            async with semaphore:
+                start = time.perf_counter()
+                await backend.ainvoke(
+                    "bench-model", MESSAGES, "sk-bench", "https://bench.invalid/api/v1",
+                    temperature=0.1, max_tokens=2000,
+                )
+                latencies.append(time.perf_counter() - start)
+
+        await one_call()  # warm-up (imports, client setup)
+        latencies.clear()
+        await asyncio.gather(*(one_call() for _ in range(calls)))
+        return latencies
+
+
+def summarise(name: str, latencies: list) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "backend": name,
+        "calls": len(ordered),
+        "mean_ms": statistics.mean(ordered) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p95_ms": ordered[int(len(ordered) * 0.95) - 1] * 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    results = []
+    for name, backend_cls in (("httpx", HTTPXBackend), ("langchain", LangChainBackend)):
+        latencies = await run_backend(backend_cls, args.calls, args.concurrency)
+        results.append(summarise(name, latencies))
+
+    for row in results:
+        print(f"{row['backend']:>10}: mean {row['mean_ms']:.2f} ms, "
+              f"p50 {row['p50_ms']:.2f} ms, p95 {row['p95_ms']:.2f} ms")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+"""Measure cold-start import time of the API process
+
+Usage:
+    python -m scripts.benchmark_import_time [--runs 10] [--history benchmarks/import_time.jsonl]
+
+Each run imports ``app.main`` in a fresh interpreter. Results are appended to
+a JSONL history file so cold-start regressions show up over time.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+TARGET = "app.main"
+
+
+def time_import(module: str) -> float:
+    """Wall time of ``import module`` in a fresh interpreter"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+    return time.perf_counter() - start
+
+
+def slowest_imports(module: str, top: int = 10) -> list:
+    """Top cumulative entries from ``python -X importtime``"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        rows.append({"module": name.strip(), "cumulative_ms": int(cumulative_us) / 1000})
+    return sorted(rows, key=lambda r: r["cumulative_ms"], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--history", default="benchmarks/import_time.jsonl")
+    args = parser.parse_args()
+
+    time_import(TARGET)  # populate bytecode caches
+    samples = [time_import(TARGET) for _ in range(args.runs)]
+
+    result = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "module": TARGET,
+        "runs": args.runs,
+        "median_s": statistics.median(samples),
+        "min_s": min(samples),
+        "max_s": max(samples),
+        "slowest_imports": slowest_imports(TARGET),
+    }
+
+    print(f"import {TARGET}: median {result['median_s'] * 1000:.1f} ms "
+          f"(min {result['min_s'] * 1000:.1f}, max {result['max_s'] * 1000:.1f})")
+    for row in result["slowest_imports"]:
+        print(f"  {row['cumulative_ms']:8.1f} ms  {row['module']}")
+
+    history = Path(args.history)
+    history.parent.mkdir(parents=True, exist_ok=True)
+    with history.open("a") as f:
+        f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
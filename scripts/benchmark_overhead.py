@@ -0,0 +1,222 @@
+"""Micro-benchmarks of the service's own per-request CPU cost
+
+Usage:
+    python -m scripts.benchmark_overhead [--filter prompt] [--scale 1.0]
+        [--baseline benchmarks/baseline.json] [--save-baseline] [--tolerance 0.25]
+
+Every LLM call goes to the in-process fake backend (LLM_BACKEND=fake, zero
+latency), so timings are only our code: prompt construction, triage
+parsing, routing, upload encoding, the router end to end, and a full HTTP
+request through the FastAPI app.
+
+Each run is appended to ``benchmarks/history.jsonl`` with the git
+revision. With a baseline present, benchmarks whose median is more than
+``--tolerance`` slower are reported and the script exits 1, so it can gate
+CI. ``--save-baseline`` records the current run as the new baseline. Both
+files are committed, so history survives across checkouts; keep the
+baseline from the machine that runs the gate (absolute numbers do not
+transfer).
+"""
+import os
+
+# Before any app import: settings are read once
+os.environ["LLM_BACKEND"] = "fake"
+os.environ.setdefault("LLM_ENDPOINTS", '[{"name": "fake", "base_url": "http://fake.invalid/v1", "api_keys": ["fake"]}]')
+os.environ["STORAGE_BACKEND"] = "none"
+os.environ["SHARED_STATE_PATH"] = ""
+os.environ["TRACING_EXPORT_PATH"] = ""
+os.environ["TRACING_OTLP_ENDPOINT"] = ""
+os.environ["LLM_CACHE_STAGES"] = "[]"
+os.environ["STAGE_CACHE_TTL_SECONDS"] = "0"
+os.environ["SHADOW_MODELS"] = "{}"
+os.environ["LOOP_MONITOR_ENABLED"] = "false"
+os.environ["TENANT_RATE_PER_MINUTE"] = "1000000"
+os.environ["TENANT_BURST"] = "1000000"
+
+import argparse
+import asyncio
+import io
+import json
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from starlette.datastructures import Headers, UploadFile
+
+from app.core.router import get_xray_router
+from app.core.routing_policy import get_routing_policy
+from app.core.triage import get_triage_engine
+from app.main import _read_image
+from app.prompts.findings_prompt import XrayFindingsPrompts
+from app.prompts.report_prompts import XrayReportPrompts
+from app.services.llm_provider import FakeBackend, get_llm_provider
+from app.utils.images import study_digest
+
+HISTORY_PATH = Path("benchmarks/history.jsonl")
+
+# ~300 KB upload, a downscaled film
+IMAGE_BYTES = b"\xff\xd8\xff\xe0" + bytes(range(256)) * 1200
+TRIAGE = json.loads(FakeBackend.outputs["triage"])
+TRIAGE_FENCED = f"Here is the triage:\n```json\n{FakeBackend.outputs['triage'][:-1]},}}\n```"
+HEALTH = {"strong": {"p95_latency": 12.0, "error_rate": 0.02, "rate_limited_rate": 0.0, "in_flight": 3, "samples": 50}}
+
+
+def findings_prompt(image_type: str):
+    prompts = XrayFindingsPrompts(patient_age="54", clinical_indication="cough, fever", triage_info=TRIAGE)
+    return lambda: prompts.get_findings_prompt(image_type)
+
+
+def benchmarks(client) -> dict:
+    """name -> (callable or coroutine function, iterations at scale 1)"""
+    triage_engine = get_triage_engine()
+    routing_policy = get_routing_policy()
+    report_prompts = XrayReportPrompts()
+    router = get_xray_router()
+    image = asyncio.run(_read_image(_upload()))
+    counter = iter(range(10**9))
+
+    async def read_image():
+        await _read_image(_upload())
+
+    async def analyze():
+        await router.analyze_xray([image], image_type="chest")
+
+    def http_request():
+        # Distinct indications: identical studies would be served from the dedup cache
+        response = client.post(
+            f"/api/v1/analyze-xray?clinical_indications=bench-{next(counter)}",
+            files=[("files", ("film.jpg", IMAGE_BYTES, "image/jpeg"))],
+        )
+        response.raise_for_status()
+
+    return {
+        "prompt.findings.chest_single": (findings_prompt("chest_single"), 5000),
+        "prompt.findings.chest_pa_lateral": (findings_prompt("chest_pa_lateral"), 5000),
+        "prompt.findings.limb": (findings_prompt("limb"), 5000),
+        "prompt.report": (lambda: report_prompts.get_report_prompt("chest_single"), 5000),
+        "triage.parse": (lambda: triage_engine._parse_triage_response(FakeBackend.outputs["triage"]), 5000),
+        "triage.parse_repaired": (lambda: triage_engine._parse_triage_response(TRIAGE_FENCED), 5000),
+        "routing.decide": (lambda: routing_policy.decide(TRIAGE, HEALTH), 20000),
+        "main.read_image": (read_image, 500),
+        "main.study_digest": (lambda: study_digest([image], "chest", 54, "cough"), 2000),
+        "router.analyze_xray": (analyze, 500),
+        "http.analyze_xray": (http_request, 200),
+    }
+
+
+def _upload() -> UploadFile:
+    return UploadFile(io.BytesIO(IMAGE_BYTES), filename="film.jpg", headers=Headers({"content-type": "image/jpeg"}))
+
+
+def measure(work, iterations: int) -> dict:
+    """Per-call wall-clock times (µs) and CPU time per call"""
+    is_async = asyncio.iscoroutinefunction(work)
+
+    async def run_async(n: int) -> list:
+        times = []
+        for _ in range(n):
+            start = time.perf_counter()
+            await work()
+            times.append(time.perf_counter() - start)
+        return times
+
+    def run(n: int) -> list:
+        if is_async:
+            return asyncio.run(run_async(n))
+        times = []
+        for _ in range(n):
+            start = time.perf_counter()
+            work()
+            times.append(time.perf_counter() - start)
+        return times
+
+    run(max(1, iterations // 10))  # warm-up
+    cpu_start = time.process_time()
+    times = sorted(run(iterations))
+    cpu = time.process_time() - cpu_start
+    return {
+        "iterations": iterations,
+        "mean_us": statistics.mean(times) * 1e6,
+        "p50_us": times[len(times) // 2] * 1e6,
+        "p95_us": times[min(len(times) - 1, int(0.95 * len(times)))] * 1e6,
+        "cpu_us": cpu / iterations * 1e6,
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Benchmarks whose median regressed by more than ``tolerance``"""
+    regressions = []
+    for name, row in results.items():
+        before = baseline.get(name)
+        if before and row["p50_us"] > before["p50_us"] * (1 + tolerance):
+            regressions.append((name, before["p50_us"], row["p50_us"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", default="", help="only benchmarks whose name contains this")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply iteration counts")
+    parser.add_argument("--baseline", default="benchmarks/baseline.json")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed median slowdown vs baseline")
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    results = {}
+    with TestClient(app) as client:
+        for name, (work, iterations) in benchmarks(client).items():
+            if args.filter not in name:
+                continue
+            results[name] = measure(work, max(1, int(iterations * args.scale)))
+            row = results[name]
+            print(f"{name:<34}{row['p50_us']:>12.1f} µs p50{row['p95_us']:>12.1f} µs p95{row['cpu_us']:>12.1f} µs cpu")
+    asyncio.run(get_llm_provider().aclose())
+
+    HISTORY_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(HISTORY_PATH, "a") as f:
+        f.write(json.dumps({
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "python": sys.version.split()[0],
+            "results": results,
+        }) + "\n")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+        baseline_path.write_text(json.dumps({**baseline, **results}, indent=2))
+        print(f"\nBaseline saved to {baseline_path}")
+        return
+
+    if not baseline_path.exists():
+        print(f"\nNo baseline at {baseline_path}; run with --save-baseline to create one")
+        return
+
+    regressions = compare(results, json.loads(baseline_path.read_text()), args.tolerance)
+    if not regressions:
+        print(f"\nNo regressions beyond {args.tolerance:.0%} vs {baseline_path}")
+        return
+    print(f"\nRegressions beyond {args.tolerance:.0%} vs {baseline_path}:")
+    for name, before, after in regressions:
+        print(f"  {name}: {before:.1f} -> {after:.1f} µs p50 ({after / before - 1:+.0%})")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
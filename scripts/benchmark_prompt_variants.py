@@ -0,0 +1,103 @@
+"""Compare full vs compact prompts on the evaluation set
+
+Usage:
+    python -m scripts.benchmark_prompt_variants [--variants full compact] [--output results.json]
+
+Every case in scripts.test_accuracy.TEST_CASES is run through the complete
+pipeline once per variant (applied to all tiers), recording latency, token
+usage and accuracy so a prompt level can be picked per routing tier via
+PROMPT_VARIANTS.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from collections import defaultdict
+
+from app.config import get_settings
+from app.core.router import get_xray_router
+from app.prompts.findings_prompt import PROMPT_VARIANTS
+from app.utils.images import to_data_url
+from scripts.test_accuracy import TEST_CASES, is_correct
+
+TIERS = ("medium", "strong", "format")
+
+
+async def run_variant(variant: str) -> list:
+    """Run every evaluation case with ``variant`` prompts on all tiers"""
+    get_settings().prompt_variants = {tier: variant for tier in TIERS}
+    router = get_xray_router()
+
+    rows = []
+    for case in TEST_CASES:
+        with open(case["path"], "rb") as f:
+            image = to_data_url(f.read())
+
+        start = time.perf_counter()
+        result = await router.analyze_xray([image])
+        latency = time.perf_counter() - start
+
+        rows.append({
+            "variant": variant,
+            "case": case["path"],
+            "tier": result["model_used"],
+            "latency_s": latency,
+            "prompt_tokens": sum(u.get("prompt_tokens", 0) for u in result["usage"].values()),
+            "completion_tokens": sum(u.get("completion_tokens", 0) for u in result["usage"].values()),
+            "cached_tokens": sum(u.get("cached_tokens", 0) for u in result["usage"].values()),
+            "correct": is_correct(result["report"], case["diagnosis"]),
+        })
+    return rows
+
+
+def summarise(rows: list) -> dict:
+    """Aggregate per variant and per findings tier"""
+    groups = defaultdict(list)
+    for row in rows:
+        groups[(row["variant"], "all")].append(row)
+        groups[(row["variant"], row["tier"])].append(row)
+
+    summary = []
+    for (variant, tier), group in sorted(groups.items()):
+        latencies = sorted(r["latency_s"] for r in group)
+        summary.append({
+            "variant": variant,
+            "tier": tier,
+            "cases": len(group),
+            "accuracy": sum(r["correct"] for r in group) / len(group),
+            "latency_p50_s": statistics.median(latencies),
+            "latency_max_s": latencies[-1],
+            "avg_prompt_tokens": statistics.mean(r["prompt_tokens"] for r in group),
+            "avg_completion_tokens": statistics.mean(r["completion_tokens"] for r in group),
+            "avg_cached_tokens": statistics.mean(r["cached_tokens"] for r in group),
+        })
+    return summary
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--variants", nargs="+", default=list(PROMPT_VARIANTS), choices=PROMPT_VARIANTS)
+    parser.add_argument("--output", help="write raw rows and summary as JSON")
+    args = parser.parse_args()
+
+    rows = []
+    for variant in args.variants:
+        rows += await run_variant(variant)
+    summary = summarise(rows)
+
+    print(f"{'variant':<9}{'tier':<8}{'cases':>6}{'acc':>7}{'p50 s':>8}{'max s':>8}{'prompt':>9}{'compl':>8}{'cached':>8}")
+    for s in summary:
+        print(
+            f"{s['variant']:<9}{s['tier']:<8}{s['cases']:>6}{s['accuracy']:>7.1%}"
+            f"{s['latency_p50_s']:>8.2f}{s['latency_max_s']:>8.2f}"
+            f"{s['avg_prompt_tokens']:>9.0f}{s['avg_completion_tokens']:>8.0f}{s['avg_cached_tokens']:>8.0f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"rows": rows, "summary": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
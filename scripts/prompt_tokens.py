@@ -0,0 +1,107 @@
+"""Report prompt size per stage, image type, view and variant
+
+Usage:
+    python -m scripts.prompt_tokens [--json]
+
+Counts cover the text parts only (system + static + dynamic, with a
+typical patient); image tokens depend on the provider and are not included.
+"""
+import argparse
+import json
+
+from app.prompts.findings_prompt import (
+    PROMPT_VARIANTS,
+    SINGLE_CHEST_VIEWS,
+    XrayFindingsPrompts,
+)
+from app.prompts.report_prompts import report_prompts
+from app.prompts.triage_prompt import get_triage_prompt
+from app.utils.tokens import count_tokens, tokenizer_name
+
+SAMPLE_TRIAGE = {"preliminary_findings": ["right mid-zone opacity", "blunted right costophrenic angle"]}
+
+
+def findings_rows() -> list:
+    prompts = XrayFindingsPrompts(45, "Cough and fever for 2 weeks", triage_info=SAMPLE_TRIAGE)
+    cases = [("chest_single", view) for view in SINGLE_CHEST_VIEWS]
+    cases += [("chest_pa_lateral", None), ("limb", "AP and Lateral")]
+
+    rows = []
+    for image_type, view_type in cases:
+        for variant in PROMPT_VARIANTS:
+            prompt = prompts.get_findings_prompt(image_type, view_type, variant=variant)
+            system = count_tokens(prompt["system"])
+            static = count_tokens(prompt["user_static"])
+            dynamic = count_tokens(prompt["user_dynamic"])
+            rows.append({
+                "stage": "findings",
+                "image_type": image_type,
+                "view": view_type or "PA + lateral",
+                "variant": variant,
+                "system": system,
+                "static": static,
+                "dynamic": dynamic,
+                "total": system + static + dynamic,
+            })
+    return rows
+
+
+def report_rows() -> list:
+    rows = []
+    for variant in PROMPT_VARIANTS:
+        prompt = report_prompts.get_report_prompt("chest_single", variant=variant)
+        system = count_tokens(prompt["system"])
+        rows.append({
+            "stage": "report",
+            "image_type": "chest_single",
+            "view": "-",
+            "variant": variant,
+            "system": system,
+            "static": 0,
+            "dynamic": 0,  # findings payload, varies per study
+            "total": system,
+        })
+    return rows
+
+
+def triage_rows() -> list:
+    prompt = get_triage_prompt("chest")
+    system = count_tokens(prompt["system"])
+    static = count_tokens(prompt["user"])
+    dynamic = count_tokens(prompt["image_context"])
+    return [{
+        "stage": "triage",
+        "image_type": "chest",
+        "view": "-",
+        "variant": "full",
+        "system": system,
+        "static": static,
+        "dynamic": dynamic,
+        "total": system + static + dynamic,
+    }]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    args = parser.parse_args()
+
+    rows = triage_rows() + findings_rows() + report_rows()
+
+    if args.json:
+        print(json.dumps({"tokenizer": tokenizer_name(), "prompts": rows}, indent=2))
+        return
+
+    print(f"Tokenizer: {tokenizer_name()}\n")
+    header = f"{'stage':<9}{'image_type':<18}{'view':<15}{'variant':<9}{'system':>8}{'static':>8}{'dynamic':>9}{'total':>8}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['stage']:<9}{row['image_type']:<18}{row['view']:<15}{row['variant']:<9}"
+            f"{row['system']:>8}{row['static']:>8}{row['dynamic']:>9}{row['total']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
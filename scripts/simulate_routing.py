@@ -0,0 +1,235 @@
+"""Replay stored analyses through candidate findings-routing policies
+
+Usage:
+    python -m scripts.simulate_routing [--db data/analyses.db | --input analyses.json]
+        [--policy static] [--policy "slo:strong_latency_slo_seconds=20,routing_breach_action=defer"]
+        [--labels labels.json] [--speedup 1.0] [--output results.json]
+
+Each stored study keeps its recorded triage output, arrival time and stage
+timings. A candidate policy (a routing policy name plus Settings overrides)
+re-decides the findings tier with live tier health rebuilt from the replay
+itself. When the simulated tier matches the recorded one, the recorded
+findings latency and tokens are reused. Otherwise they are sampled from
+studies that did run on that tier.
+
+Labels (JSON: study_id -> diagnosis) give accuracy on studies whose
+simulated tier matches the recorded one; the other studies have no report
+to score. Failed calls are not recorded, so error-rate triggers never fire.
+Deferral is modelled as waiting the full ``routing_defer_seconds``.
+``--speedup`` compresses arrival times to project load at higher throughput.
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import random
+import statistics
+from datetime import datetime
+
+from app.config import get_settings
+from app.core.findings_generator import FINDINGS_COST
+from app.core.routing_policy import MODEL_NAMES, make_routing_policy
+from app.services.endpoint_pool import TierStats
+from app.services.storage import SQLiteAnalysisRepository
+from scripts.test_accuracy import is_correct
+
+TIER_FOR_MODEL = {name: tier for tier, name in MODEL_NAMES.items()}
+
+
+async def load_records(args) -> list:
+    """Stored analyses with the fields a replay needs, oldest first"""
+    if args.input:
+        with open(args.input) as f:
+            data = json.load(f)
+        records = data["data"] if isinstance(data, dict) else data
+    else:
+        repository = SQLiteAnalysisRepository(args.db or get_settings().storage_path)
+        records = await repository.query(limit=args.limit)
+        await repository.close()
+
+    usable = [
+        r for r in records
+        if r.get("triage") and r.get("timings") and r.get("model_used") in TIER_FOR_MODEL
+    ]
+    return sorted(usable, key=lambda r: r["created_at"])
+
+
+def parse_policy(spec: str):
+    """ "slo:key=value,key=value" -> (label, policy) """
+    name, _, overrides = spec.partition(":")
+    settings = get_settings()
+    update = {"routing_policy": name}
+    for item in filter(None, overrides.split(",")):
+        key, _, value = item.partition("=")
+        current = getattr(settings, key)
+        update[key] = value.lower() in ("1", "true", "yes") if isinstance(current, bool) else type(current)(value)
+    return spec, make_routing_policy(settings.model_copy(update=update))
+
+
+def tier_profiles(records: list) -> dict:
+    """Recorded (findings latency, findings usage) samples per tier"""
+    profiles = {tier: [] for tier in MODEL_NAMES}
+    for r in records:
+        usage = (r.get("usage") or {}).get("findings", {})
+        profiles[TIER_FOR_MODEL[r["model_used"]]].append((r["timings"]["findings"], usage))
+    return profiles
+
+
+def simulate(records: list, policy, labels: dict, speedup: float, seed: int) -> list:
+    """Replay ``records`` in arrival order under ``policy``"""
+    rng = random.Random(seed)
+    if hasattr(policy, "rng"):
+        policy.rng.seed(seed)
+    profiles = tier_profiles(records)
+    settings = policy.settings
+    clock = [0.0]  # simulated seconds since the first arrival
+    tier_stats = {
+        tier: TierStats(settings.routing_window, settings.routing_max_sample_age_seconds, lambda: clock[0])
+        for tier in MODEL_NAMES
+    }
+    running = []  # heap of (end_time, tier, latency)
+    first_arrival = datetime.fromisoformat(records[0]["created_at"]).timestamp() if records else 0.0
+
+    def retire(now: float) -> None:
+        while running and running[0][0] <= now:
+            end, tier, latency = heapq.heappop(running)
+            clock[0] = end
+            tier_stats[tier].in_flight -= 1
+            tier_stats[tier].record(latency, ok=True)
+
+    def health() -> dict:
+        return {tier: stats.stats() for tier, stats in tier_stats.items()}
+
+    rows = []
+    for r in records:
+        arrival = (datetime.fromisoformat(r["created_at"]).timestamp() - first_arrival) / speedup
+        start = arrival + r["timings"].get("triage", 0.0)
+        retire(start)
+        clock[0] = start
+
+        decision = policy.decide(r["triage"], health())
+        wait = 0.0
+        if decision["action"] == "defer":
+            wait = settings.routing_defer_seconds
+            retire(start + wait)
+            clock[0] = start + wait
+            decision = policy.decide(r["triage"], health(), deferred_for=wait)
+
+        tier = decision["tier"]
+        recorded_tier = TIER_FOR_MODEL[r["model_used"]]
+        if tier == recorded_tier or not profiles[tier]:
+            latency, usage = r["timings"]["findings"], (r.get("usage") or {}).get("findings", {})
+        else:
+            latency, usage = rng.choice(profiles[tier])
+
+        tier_stats[tier].in_flight += 1
+        heapq.heappush(running, (start + wait + latency, tier, latency))
+
+        label = labels.get(r["study_id"])
+        rows.append({
+            "study_id": r["study_id"],
+            "tier": tier,
+            "action": decision["action"],
+            "reason": decision["reason"],
+            "deferred_s": wait,
+            "cost": r["total_cost"] - FINDINGS_COST[r["model_used"]] + FINDINGS_COST[MODEL_NAMES[tier]],
+            "latency_s": r["timings"]["total"] - r["timings"]["findings"] + wait + latency,
+            "findings_tokens": usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0),
+            "strong_in_flight": tier_stats["strong"].in_flight,
+            "correct": is_correct(r["report"] or "", label) if label and tier == recorded_tier else None,
+        })
+    return rows
+
+
+def recorded_rows(records: list, labels: dict) -> list:
+    """What actually happened, as a reference row"""
+    rows = []
+    for r in records:
+        label = labels.get(r["study_id"])
+        usage = (r.get("usage") or {}).get("findings", {})
+        rows.append({
+            "study_id": r["study_id"],
+            "tier": TIER_FOR_MODEL[r["model_used"]],
+            "action": "route",
+            "reason": "recorded",
+            "deferred_s": 0.0,
+            "cost": r["total_cost"],
+            "latency_s": r["timings"]["total"],
+            "findings_tokens": usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0),
+            "strong_in_flight": None,
+            "correct": is_correct(r["report"] or "", label) if label else None,
+        })
+    return rows
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarise(label: str, rows: list) -> dict:
+    latencies = [r["latency_s"] for r in rows]
+    scored = [r["correct"] for r in rows if r["correct"] is not None]
+    in_flight = [r["strong_in_flight"] for r in rows if r["strong_in_flight"] is not None]
+    return {
+        "policy": label,
+        "cases": len(rows),
+        "strong_share": sum(r["tier"] == "strong" for r in rows) / len(rows),
+        "downgraded": sum(r["action"] == "downgrade" for r in rows),
+        "deferred": sum(r["deferred_s"] > 0 for r in rows),
+        "total_cost": sum(r["cost"] for r in rows),
+        "avg_cost": statistics.mean(r["cost"] for r in rows),
+        "latency_p50_s": percentile(latencies, 0.50),
+        "latency_p95_s": percentile(latencies, 0.95),
+        "latency_p99_s": percentile(latencies, 0.99),
+        "avg_findings_tokens": statistics.mean(r["findings_tokens"] for r in rows),
+        "peak_strong_in_flight": max(in_flight) if in_flight else None,
+        "accuracy": sum(scored) / len(scored) if scored else None,
+        "scored_cases": len(scored),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", help="SQLite analysis store (default: STORAGE_PATH)")
+    parser.add_argument("--input", help="JSON export of /api/v1/analyses instead of --db")
+    parser.add_argument("--limit", type=int, default=100000, help="newest studies to load from --db")
+    parser.add_argument("--policy", action="append", help="name[:setting=value,...]; repeatable")
+    parser.add_argument("--labels", help="JSON mapping study_id -> diagnosis")
+    parser.add_argument("--speedup", type=float, default=1.0, help="divide inter-arrival times by this")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write per-study rows and summary as JSON")
+    args = parser.parse_args()
+
+    records = await load_records(args)
+    if not records:
+        raise SystemExit("No stored analyses with triage and timings to replay")
+    labels = {}
+    if args.labels:
+        with open(args.labels) as f:
+            labels = json.load(f)
+
+    results = {"recorded": recorded_rows(records, labels)}
+    for spec in args.policy or ["static", "slo"]:
+        label, policy = parse_policy(spec)
+        results[label] = simulate(records, policy, labels, args.speedup, args.seed)
+    summary = [summarise(label, rows) for label, rows in results.items()]
+
+    print(f"{len(records)} studies, speedup x{args.speedup:g}\n")
+    print(f"{'policy':<40}{'strong':>8}{'down':>6}{'defer':>6}{'$/study':>9}{'p50 s':>8}{'p95 s':>8}{'p99 s':>8}{'peak':>6}{'acc':>7}")
+    for s in summary:
+        accuracy = f"{s['accuracy']:.1%}" if s["accuracy"] is not None else "-"
+        peak = s["peak_strong_in_flight"] if s["peak_strong_in_flight"] is not None else "-"
+        print(
+            f"{s['policy'][:39]:<40}{s['strong_share']:>8.1%}{s['downgraded']:>6}{s['deferred']:>6}"
+            f"{s['avg_cost']:>9.4f}{s['latency_p50_s']:>8.2f}{s['latency_p95_s']:>8.2f}{s['latency_p99_s']:>8.2f}"
+            f"{peak:>6}{accuracy:>7}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"rows": results, "summary": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+"""Local stand-in for an OpenAI-compatible chat completions server
+
+Usage:
+    python -m scripts.stub_llm_server --port 9001 --delay 0.5 --error-rate 0.1
+
+Point an endpoint at it to exercise routing and failover locally:
+    LLM_ENDPOINTS='[{"name": "stub", "base_url": "http://127.0.0.1:9001/v1", "api_keys": ["x"]}]'
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from fastapi import FastAPI, HTTPException, Request
+
+app = FastAPI(title="Stub LLM server")
+app.state.delay = 0.0
+app.state.error_rate = 0.0
+app.state.content = "{}"
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "stub-model", "object": "model"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await asyncio.sleep(app.state.delay)
+
+    if random.random() < app.state.error_rate:
+        raise HTTPException(503, "stub failure")
+
+    return {
+        "id": f"chatcmpl-stub-{time.time_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub-model"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": app.state.content},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 503 responses")
+    parser.add_argument("--content", default="{}", help="assistant message content")
+    args = parser.parse_args()
+
+    app.state.delay = args.delay
+    app.state.error_rate = args.error_rate
+    app.state.content = args.content
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,39 @@
 """Test accuracy on 20 X-ray samples"""
 import asyncio
-import base64
 from pathlib import Path
-from app.core.router import xray_router
+from app.core.router import get_xray_router
+from app.utils.images import to_data_url
+
+# Load test images (you'll add these)
+TEST_CASES = [
+    {"path": "tests/fixtures/sample_xrays/normal_1.jpg", "diagnosis": "Normal"},
+    {"path": "tests/fixtures/sample_xrays/cardiomegaly_1.jpg", "diagnosis": "Cardiomegaly"},
+    # Add 18 more...
+]
+
+
+def is_correct(report: str, diagnosis: str) -> bool:
+    """Check if diagnosis matches the report"""
+    report = (report or "").lower()  # None when the pipeline only partly completed
+    diagnosis = diagnosis.lower()
+    return diagnosis in report if diagnosis != "normal" else "no acute" in report
+
 
 async def test_accuracy():
     """Run accuracy test on sample X-rays"""
     
-    # Load test images (you'll add these)
-    test_cases = [
-        {"path": "tests/fixtures/sample_xrays/normal_1.jpg", "diagnosis": "Normal"},
-        {"path": "tests/fixtures/sample_xrays/cardiomegaly_1.jpg", "diagnosis": "Cardiomegaly"},
-        # Add 18 more...
-    ]
-    
     results = []
     
-    for case in test_cases:
+    for case in TEST_CASES:
         # Read image
         with open(case["path"], "rb") as f:
-            image_base64 = base64.b64encode(f.read()).decode()
+            image = to_data_url(f.read())
         
         # Analyze
-        result = await xray_router.analyze_xray(image_base64)
+        result = await get_xray_router().analyze_xray([image])
         
         # Check if diagnosis matches
-        report = result["report"].lower()
-        diagnosis = case["diagnosis"].lower()
-        
-        correct = diagnosis in report if diagnosis != "normal" else "no acute" in report
+        correct = is_correct(result["report"], case["diagnosis"])
         
         results.append({
             "case": case["diagnosis"],
@@ -0,0 +1,39 @@
+"""Shared fixtures: every test gets fresh settings, singletons and on-disk state"""
+import sys
+
+import pytest
+
+
+def clear_singletons() -> None:
+    """Drop every lazily constructed ``get_*`` instance (and cached settings)"""
+    for name, module in list(sys.modules.items()):
+        if not name.startswith("app."):
+            continue
+        for attribute in dir(module):
+            getter = getattr(module, attribute)
+            if attribute.startswith("get_") and hasattr(getter, "cache_clear"):
+                getter.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def isolated_settings(tmp_path, monkeypatch):
+    """Fake LLM backend, no external storage, state files under tmp_path"""
+    env = {
+        "LLM_BACKEND": "fake",
+        "LLM_ENDPOINTS": '[{"name": "fake", "base_url": "http://fake.invalid/v1", "api_keys": ["k0", "k1"]}]',
+        "OPENROUTER_API_KEYS": "[]",
+        "STORAGE_BACKEND": "none",
+        "STORAGE_PATH": str(tmp_path / "analyses.db"),
+        "SHARED_STATE_PATH": "",
+        "IDEMPOTENCY_PATH": str(tmp_path / "idempotency.db"),
+        "LLM_CACHE_PATH": str(tmp_path / "llm_cache.db"),
+        "STUDY_BLOB_PATH": str(tmp_path / "studies"),
+        "TRACING_EXPORT_PATH": "",
+        "TRACING_OTLP_ENDPOINT": "",
+        "LOOP_MONITOR_ENABLED": "false",
+    }
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    clear_singletons()
+    yield
+    clear_singletons()
@@ -0,0 +1,26 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+JPEG = b"\xff\xd8\xff\xe0" + bytes(range(256)) * 4
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.mark.parametrize("field", ["files", "file"])
+def test_analyze_accepts_both_upload_field_names(client, field):
+    response = client.post("/api/v1/analyze-xray", files=[(field, ("film.jpg", JPEG, "image/jpeg"))])
+
+    assert response.status_code == 200
+    assert response.json()["data"]["status"] == "complete"
+
+
+def test_analyze_without_image_is_rejected(client):
+    response = client.post("/api/v1/analyze-xray", data={"image_type": "chest"})
+
+    assert response.status_code == 422
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from app.main import ClientDisconnected, _until_disconnected
+from app.services.idempotency import get_idempotency_manager
+
+
+class GoneRequest:
+    async def is_disconnected(self):
+        return True
+
+
+def _run_with_disconnect(shield: bool):
+    finished = []
+
+    async def pipeline():
+        await asyncio.sleep(0.3)
+        finished.append(True)
+        return {"status": "complete"}
+
+    async def scenario():
+        manager = get_idempotency_manager()
+        with pytest.raises(ClientDisconnected) as disconnected:
+            await _until_disconnected(GoneRequest(), manager.run("t:k", "hashA", pipeline), shield=shield)
+        await asyncio.sleep(0.5)
+        return disconnected.value, await manager.run("t:k", "hashA", pipeline)
+
+    return asyncio.run(scenario()), finished
+
+
+def test_disconnect_with_idempotency_key_finishes_and_stores_result(monkeypatch):
+    monkeypatch.setenv("DISCONNECT_POLL_SECONDS", "0.05")
+
+    (disconnected, retry), finished = _run_with_disconnect(shield=True)
+
+    assert not disconnected.cancelled
+    assert retry == ({"status": "complete"}, True)  # the retry is a replay
+    assert finished == [True]
+
+
+def test_disconnect_without_shield_cancels(monkeypatch):
+    monkeypatch.setenv("DISCONNECT_POLL_SECONDS", "0.05")
+
+    (disconnected, retry), finished = _run_with_disconnect(shield=False)
+
+    assert disconnected.cancelled
+    assert retry == ({"status": "complete"}, False)  # the retry ran the pipeline again
+    assert finished == [True]
@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.idempotency import IdempotencyConflict, IdempotencyStore, get_idempotency_manager
+
+
+def test_completed_key_replays_and_rejects_other_inputs():
+    async def scenario():
+        manager = get_idempotency_manager()
+        calls = []
+
+        async def pipeline():
+            calls.append(1)
+            return {"status": "complete"}
+
+        first = await manager.run("k", "hashA", pipeline)
+        second = await manager.run("k", "hashA", pipeline)
+        with pytest.raises(IdempotencyConflict) as conflict:
+            await manager.run("k", "hashB", pipeline)
+        return first, second, conflict.value, calls
+
+    first, second, conflict, calls = asyncio.run(scenario())
+    assert first == ({"status": "complete"}, False)
+    assert second == ({"status": "complete"}, True)
+    assert conflict.status_code == 422
+    assert len(calls) == 1
+
+
+def test_join_of_running_request_checks_request_hash():
+    async def scenario():
+        manager = get_idempotency_manager()
+        release = asyncio.Event()
+
+        async def pipeline():
+            await release.wait()
+            return {"status": "complete"}
+
+        original = asyncio.create_task(manager.run("k", "hashA", pipeline))
+        await asyncio.sleep(0.05)  # original now holds the key in this worker
+
+        with pytest.raises(IdempotencyConflict) as conflict:
+            await manager.run("k", "hashB", pipeline)
+        joined = asyncio.create_task(manager.run("k", "hashA", pipeline))
+        await asyncio.sleep(0.05)
+        release.set()
+        return await original, await joined, conflict.value
+
+    original, joined, conflict = asyncio.run(scenario())
+    assert conflict.status_code == 422
+    assert original == ({"status": "complete"}, False)
+    assert joined == ({"status": "complete"}, True)
+
+
+def test_pending_key_of_crashed_worker_is_taken_over_after_lease(tmp_path):
+    store = IdempotencyStore(str(tmp_path / "keys.db"), ttl_seconds=3600, lease_seconds=0.1)
+
+    assert store.begin("k", "hashA") == ("new", None)
+    assert store.begin("k", "hashA") == ("pending", None)  # holder still within its lease
+
+    time.sleep(0.15)  # holder died without completing or releasing
+    assert store.begin("k", "hashA") == ("new", None)
+
+    store.complete("k", {"status": "complete"})
+    time.sleep(0.15)  # completed results keep the full retention window
+    assert store.begin("k", "hashA") == ("completed", {"status": "complete"})
+
+
+def test_lease_is_renewed_while_a_long_request_runs(monkeypatch, tmp_path):
+    monkeypatch.setenv("IDEMPOTENCY_LEASE_SECONDS", "0.3")
+
+    async def scenario():
+        manager = get_idempotency_manager()
+        other_worker = IdempotencyStore(str(tmp_path / "idempotency.db"), ttl_seconds=3600, lease_seconds=0.3)
+
+        async def pipeline():
+            await asyncio.sleep(1.0)  # several leases long
+            return {"status": "complete"}
+
+        original = asyncio.create_task(manager.run("k", "hashA", pipeline))
+        await asyncio.sleep(0.8)
+        retry = await asyncio.to_thread(other_worker.begin, "k", "hashA")
+        await original
+        return retry, await asyncio.to_thread(other_worker.begin, "k", "hashA")
+
+    during, after = asyncio.run(scenario())
+
+    assert during == ("pending", None)  # not taken over: no second run, no second charge
+    assert after == ("completed", {"status": "complete"})
@@ -0,0 +1,60 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services.llm_provider import get_llm_provider
+
+TWO_ENDPOINTS = (
+    '[{"name": "a", "base_url": "http://a.invalid/v1", "api_keys": ["ka"]},'
+    ' {"name": "b", "base_url": "http://b.invalid/v1", "api_keys": ["kb"]}]'
+)
+
+
+class FailingBackend:
+    """Answers every call with one HTTP status"""
+
+    def __init__(self, status: int):
+        self.status = status
+        self.calls = []
+
+    async def ainvoke(self, model, messages, api_key, base_url, **params):
+        self.calls.append(base_url)
+        request = httpx.Request("POST", f"{base_url}/chat/completions")
+        raise httpx.HTTPStatusError("boom", request=request, response=httpx.Response(self.status, request=request))
+
+
+def _call(status: int):
+    async def scenario():
+        provider = get_llm_provider()
+        provider.backend = FailingBackend(status)
+        try:
+            with pytest.raises(httpx.HTTPStatusError):
+                await provider.get_model("medium").ainvoke([{"role": "user", "content": "hi"}])
+        finally:
+            await provider.aclose()
+        return provider
+
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("status", [500, 503, 408, 429])
+def test_endpoint_failures_fail_over(monkeypatch, status):
+    monkeypatch.setenv("LLM_ENDPOINTS", TWO_ENDPOINTS)
+
+    provider = _call(status)
+
+    assert len(provider.backend.calls) == 2
+    assert all(e.consecutive_failures == 1 for e in provider.endpoints.endpoints)
+    assert provider.tier_stats["medium"].error_rate == 1.0
+
+
+@pytest.mark.parametrize("status", [400, 401, 404, 422])
+def test_client_errors_are_raised_without_failover(monkeypatch, status):
+    monkeypatch.setenv("LLM_ENDPOINTS", TWO_ENDPOINTS)
+
+    provider = _call(status)
+
+    assert len(provider.backend.calls) == 1
+    assert all(e.consecutive_failures == 0 for e in provider.endpoints.endpoints)
+    assert provider.tier_stats["medium"].stats()["samples"] == 0
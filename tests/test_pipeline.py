@@ -0,0 +1,90 @@
+import asyncio
+
+from app.core.router import get_xray_router
+from app.services.storage import get_analysis_writer
+
+IMAGE = "data:image/jpeg;base64,/9j/4AAQSkZJRgABAQ=="
+
+
+def test_failed_stage_gives_partial_result_that_resumes(monkeypatch):
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+
+    async def scenario():
+        router = get_xray_router()
+        generate_report = router.report_engine.generate_report
+
+        async def unavailable(**kwargs):
+            raise RuntimeError("report model unavailable")
+
+        router.report_engine.generate_report = unavailable
+        partial = await router.analyze_xray([IMAGE], image_type="chest", patient_age=54)
+
+        router.report_engine.generate_report = generate_report
+        resumed = await router.resume(partial["study_id"])
+        await router.analysis_writer.flush()
+        stored = await router.analysis_writer.repository.get(partial["study_id"])
+        await get_analysis_writer().close()
+        return partial, resumed, stored
+
+    partial, resumed, stored = asyncio.run(scenario())
+
+    assert partial["status"] == "partial"
+    assert partial["stages"] == {"triage": "ok", "findings": "ok", "report": "failed"}
+    assert partial["findings"] and partial["report"] is None
+
+    assert resumed["status"] == "complete"
+    assert resumed["stages"] == {"triage": "ok", "findings": "ok", "report": "ok"}
+    assert resumed["findings"] == partial["findings"]  # not generated again
+    assert resumed["report"].startswith("FINDINGS:")
+    assert stored["stages"]["report"] == "ok"
+    assert stored["report"] == resumed["report"]
+
+
+def test_failed_required_stage_aborts(monkeypatch):
+    async def scenario():
+        router = get_xray_router()
+
+        async def unavailable(*args, **kwargs):
+            raise RuntimeError("triage timed out")
+
+        router.triage_engine.triage_xray = unavailable
+        try:
+            await router.analyze_xray([IMAGE], image_type="chest")
+        except Exception as e:
+            return e
+
+    error = asyncio.run(scenario())
+
+    assert type(error).__name__ == "RequiredStageFailed"
+
+
+def test_router_reuses_the_callers_digest(monkeypatch):
+    import app.core.router as router_module
+    hashed = []
+    monkeypatch.setattr(router_module, "study_digest", lambda *args: hashed.append(args) or "computed")
+
+    async def scenario():
+        router = get_xray_router()
+        given = await router.analyze_xray([IMAGE], image_type="chest", inputs_digest="from-api")
+        await router.analyze_xray([IMAGE], image_type="chest")
+        return given
+
+    asyncio.run(scenario())
+
+    assert len(hashed) == 1  # only the call without a digest hashed the images
+
+
+def test_stage_cache_hit_reports_no_cost_or_usage(monkeypatch):
+    monkeypatch.setenv("STAGE_CACHE_TTL_SECONDS", "60")
+
+    async def scenario():
+        router = get_xray_router()
+        first = await router.analyze_xray([IMAGE], image_type="chest", patient_age=40)
+        second = await router.analyze_xray([IMAGE], image_type="chest", patient_age=40)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert first["usage"]["findings"] and first["usage"]["report"]
+    assert second["usage"]["findings"] == {} and second["usage"]["report"] == {}
+    assert second["total_cost"] == second["triage"]["cost"]
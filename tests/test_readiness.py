@@ -0,0 +1,51 @@
+from app.config import get_settings
+from app.services.endpoint_pool import TierStats
+from app.services.readiness import check_readiness
+
+IDLE_SCHEDULER = {"queue_depth": 0}
+
+
+def test_failing_tier_recovers_once_its_samples_age_out():
+    clock = [0.0]
+    stats = TierStats(window=50, max_age=60, clock=lambda: clock[0])
+    for _ in range(20):
+        stats.record(1.0, ok=False)
+
+    settings = get_settings()
+    assert not check_readiness(settings, {"strong": stats.stats()}, [], IDLE_SCHEDULER, [])["ready"]
+
+    clock[0] = 61.0  # no traffic since; nothing refreshes the window
+    assert stats.stats()["samples"] == 0
+    assert check_readiness(settings, {"strong": stats.stats()}, [], IDLE_SCHEDULER, [])["ready"]
+
+
+def test_samples_are_kept_without_max_age():
+    clock = [0.0]
+    stats = TierStats(window=50, clock=lambda: clock[0])
+    stats.record(1.0, ok=False)
+    stats.record_attempt(rate_limited=True)
+
+    clock[0] = 10_000.0
+    assert stats.error_rate == 1.0
+    assert stats.rate_limited_rate == 1.0
+
+
+def _key(endpoint: str, key_index: int, cooldown: float) -> dict:
+    return {"endpoint": endpoint, "key_index": key_index, "uses": 1, "uses_last_minute": 1,
+            "cooldown_seconds": cooldown, "rate_limited": 1}
+
+
+def test_unused_configured_key_keeps_worker_ready():
+    keys = [_key("a", 0, 30.0)]  # key ("a", 1) has never been used
+
+    report = check_readiness(get_settings(), {}, keys, IDLE_SCHEDULER, [("a", 0), ("a", 1)])
+
+    assert report["ready"]
+
+
+def test_keys_no_longer_configured_are_ignored():
+    keys = [_key("a", 0, 30.0), _key("retired", 0, 0.0)]
+
+    report = check_readiness(get_settings(), {}, keys, IDLE_SCHEDULER, [("a", 0)])
+
+    assert report["reasons"] == ["all 1 API keys are cooling down after 429s"]
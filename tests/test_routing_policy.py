@@ -0,0 +1,36 @@
+from app.config import get_settings
+from app.core.routing_policy import SLORoutingPolicy
+from app.services.endpoint_pool import TierStats
+
+COMPLEX = {"urgency": "normal", "complexity": "complex", "confidence": 0.9}
+URGENT = {"urgency": "urgent", "complexity": "complex", "confidence": 0.9}
+
+
+def _slow_strong_tier(clock):
+    stats = TierStats(window=50, max_age=60, clock=lambda: clock[0])
+    for _ in range(20):
+        stats.record(120.0, ok=True)
+    return stats
+
+
+def test_breach_sheds_non_urgent_cases_and_keeps_probing():
+    policy = SLORoutingPolicy(get_settings().model_copy(update={"routing_probe_ratio": 0.1}))
+    policy.rng.seed(0)
+    health = {"strong": _slow_strong_tier([0.0]).stats()}
+
+    decisions = [policy.decide(COMPLEX, health) for _ in range(1000)]
+
+    probes = sum(d["reason"] == "probe" for d in decisions)
+    assert all(d["tier"] == "medium" for d in decisions if d["reason"] != "probe")
+    assert 50 < probes < 150
+    assert policy.decide(URGENT, health)["tier"] == "strong"
+
+
+def test_breach_ends_once_the_slow_calls_age_out():
+    policy = SLORoutingPolicy(get_settings().model_copy(update={"routing_probe_ratio": 0.0}))
+    clock = [0.0]
+    stats = _slow_strong_tier(clock)
+
+    assert policy.decide(COMPLEX, {"strong": stats.stats()})["action"] == "downgrade"
+    clock[0] = 61.0
+    assert policy.decide(COMPLEX, {"strong": stats.stats()}) == {"tier": "strong", "action": "route", "reason": "complex"}
@@ -0,0 +1,82 @@
+import asyncio
+
+import httpx
+
+from app.services.llm_provider import get_llm_provider
+from app.services.shadow import get_shadow_evaluator
+from app.services.shared_state import get_shared_state
+
+
+def _job(provider):
+    return {
+        "provider": provider,
+        "tier": "medium",
+        "stage": "triage",
+        "params": {},
+        "messages": [{"role": "user", "content": "hello"}],
+        "candidate": "candidate-model",
+        "primary": {"model": "primary-model", "latency": 0.1, "usage": {}, "content": "hello"},
+    }
+
+
+def test_replays_record_their_key_use(monkeypatch, tmp_path):
+    monkeypatch.setenv("SHADOW_MODELS", '{"medium": "candidate-model"}')
+    monkeypatch.setenv("SHADOW_RESULTS_PATH", str(tmp_path / "shadow.jsonl"))
+    monkeypatch.setenv("LLM_KEY_RPM", "1")
+
+    async def scenario():
+        provider = get_llm_provider()
+        evaluator = get_shadow_evaluator()
+        await evaluator._evaluate(_job(provider))
+        await evaluator.aclose()
+        await provider.aclose()
+
+    asyncio.run(scenario())
+
+    [stats] = get_shared_state().key_stats()
+    assert stats["uses"] == 1 and stats["uses_last_minute"] == 1  # counts against LLM_KEY_RPM
+    assert (tmp_path / "shadow.jsonl").read_text().count("\n") == 1
+
+
+def test_replays_beyond_their_budget_are_dropped(monkeypatch, tmp_path):
+    monkeypatch.setenv("SHADOW_MODELS", '{"medium": "candidate-model"}')
+    monkeypatch.setenv("SHADOW_RESULTS_PATH", str(tmp_path / "shadow.jsonl"))
+    monkeypatch.setenv("SHADOW_RPM", "1")
+
+    async def scenario():
+        provider = get_llm_provider()
+        evaluator = get_shadow_evaluator()
+        for _ in range(3):
+            await evaluator._evaluate(_job(provider))
+        await evaluator.aclose()
+        await provider.aclose()
+
+    asyncio.run(scenario())
+
+    assert (tmp_path / "shadow.jsonl").read_text().count("\n") == 1
+
+
+class RateLimitedBackend:
+    async def ainvoke(self, model, messages, api_key, base_url, **params):
+        request = httpx.Request("POST", f"{base_url}/chat/completions")
+        response = httpx.Response(429, headers={"retry-after": "20"}, request=request)
+        raise httpx.HTTPStatusError("slow down", request=request, response=response)
+
+
+def test_rate_limited_replay_cools_the_key_down(monkeypatch, tmp_path):
+    monkeypatch.setenv("SHADOW_MODELS", '{"medium": "candidate-model"}')
+    monkeypatch.setenv("SHADOW_RESULTS_PATH", str(tmp_path / "shadow.jsonl"))
+
+    async def scenario():
+        provider = get_llm_provider()
+        evaluator = get_shadow_evaluator()
+        evaluator._backend = RateLimitedBackend()
+        await evaluator._evaluate(_job(provider))
+        await evaluator.aclose()
+        await provider.aclose()
+
+    asyncio.run(scenario())
+
+    [stats] = get_shared_state().key_stats()
+    assert stats["rate_limited"] == 1
+    assert 15 < stats["cooldown_seconds"] <= 20
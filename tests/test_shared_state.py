@@ -0,0 +1,85 @@
+import asyncio
+
+from app.services.shared_state import SharedState
+
+
+def test_key_rpm_is_never_exceeded():
+    state = SharedState("", key_rpm=2)
+
+    waits = [round(state.acquire_key("ep", 1)[1]) for _ in range(6)]
+
+    assert waits == [0, 0, 60, 60, 120, 120]
+
+
+def test_least_recently_used_key_first():
+    state = SharedState("", key_rpm=1)
+
+    keys = [state.acquire_key("ep", 2) for _ in range(3)]
+
+    assert [key for key, _ in keys] == [0, 1, 0]
+    assert [round(wait) for _, wait in keys] == [0, 0, 60]
+
+
+def test_acquire_beyond_max_wait_records_nothing():
+    state = SharedState("", key_rpm=1)
+    state.acquire_key("ep", 1)
+
+    assert round(state.acquire_key("ep", 1, max_wait=0)[1]) == 60
+    assert round(state.acquire_key("ep", 1, max_wait=0)[1]) == 60
+    assert state.key_stats()[0]["uses"] == 1
+    assert state.key_stats()[0]["uses_last_minute"] == 1
+
+
+def test_cooling_key_is_skipped():
+    state = SharedState("", key_rpm=0)
+    state.acquire_key("ep", 2)
+    state.acquire_key("ep", 2)
+    state.cool_down_key("ep", 0, 30)
+
+    assert state.acquire_key("ep", 2) == (1, 0)
+
+
+def test_claim_is_released_only_by_its_owner():
+    state = SharedState("")
+    owner = state.claim("study", 60)
+
+    assert owner is not None
+    assert state.claim("study", 60) is None
+    state.release("study", "someone-else")
+    assert state.is_claimed("study")
+    state.release("study", owner)
+    assert not state.is_claimed("study")
+
+
+def test_joiner_that_gives_up_keeps_the_original_claim():
+    state = SharedState("")
+    finish = None
+    runs = []
+
+    async def work():
+        runs.append(1)
+        await finish.wait()
+        return {"status": "complete"}
+
+    async def quick():
+        runs.append(1)
+        return {"status": "complete"}
+
+    async def scenario():
+        nonlocal finish
+        finish = asyncio.Event()
+        original = asyncio.create_task(state.run_once("study", work, 60, wait_seconds=5, poll_seconds=0.01))
+        await asyncio.sleep(0.02)
+        # Waits less than the original takes, then runs unclaimed
+        impatient = await state.run_once("study", quick, 60, wait_seconds=0.05, poll_seconds=0.01)
+        claimed_after = state.is_claimed("study")
+        finish.set()
+        return impatient, await original, claimed_after
+
+    impatient, original, claimed_after = asyncio.run(scenario())
+
+    assert impatient == ({"status": "complete"}, "executed")
+    assert original == ({"status": "complete"}, "executed")
+    assert claimed_after  # the original's claim survived the impatient run
+    assert len(runs) == 2
+    assert not state.is_claimed("study")
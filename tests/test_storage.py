@@ -0,0 +1,42 @@
+import asyncio
+import os
+import time
+
+from app.services.storage import POSTGRES_SCHEMA, SCHEMA, StudyBlobStore
+
+
+def test_json_columns_are_jsonb_on_postgres_and_text_on_sqlite():
+    for column in ("triage", "usage", "timings", "stages"):
+        assert f"{column} jsonb" in POSTGRES_SCHEMA[0]
+        assert f"{column} TEXT" in SCHEMA[0]
+
+
+def test_blob_store_round_trip_and_expiry(tmp_path):
+    store = StudyBlobStore(str(tmp_path), ttl_seconds=60)
+
+    async def scenario():
+        await store.save("abc123", ["data:image/jpeg;base64,xx"], {"patient_age": 54})
+        loaded = await store.load("abc123")
+        old = time.time() - 120
+        os.utime(tmp_path / "ab" / "abc123.json", (old, old))
+        return loaded, await store.load("abc123"), await store.load("missing")
+
+    loaded, expired, missing = asyncio.run(scenario())
+
+    assert loaded == {"patient_age": 54, "images": ["data:image/jpeg;base64,xx"]}
+    assert expired is None and missing is None
+
+
+def test_blob_store_sweeps_expired_files_at_most_once_per_interval(tmp_path):
+    store = StudyBlobStore(str(tmp_path), ttl_seconds=60, sweep_interval=3600)
+    store._save("aa1", [], {})
+    old = time.time() - 120
+    os.utime(tmp_path / "aa" / "aa1.json", (old, old))
+
+    store._save("bb1", [], {})  # within the interval: no scan
+    assert (tmp_path / "aa" / "aa1.json").exists()
+
+    store._swept_at = 0.0
+    store._save("cc1", [], {})
+    assert not (tmp_path / "aa" / "aa1.json").exists()
+    assert (tmp_path / "bb" / "bb1.json").exists()
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from app.services.tenancy import FairScheduler, QuotaExceeded, Tenant
+
+
+def _tenant(tenant_id: str, weight: float = 1.0) -> Tenant:
+    return Tenant(tenant_id, rate_per_minute=1000, burst=1000, daily_spend_limit=0, weight=weight)
+
+
+def _service_order(submissions):
+    """Tenants in the order one slot serves them, all queued behind a running study"""
+    async def scenario():
+        scheduler = FairScheduler(concurrency=1)
+        await scheduler.acquire(_tenant("running"))
+        order = []
+
+        async def study(tenant):
+            await scheduler.acquire(tenant)
+            order.append(tenant.tenant_id)
+            scheduler.release()
+
+        tasks = []
+        for tenant, count in submissions:
+            for _ in range(count):
+                tasks.append(asyncio.create_task(study(tenant)))
+                await asyncio.sleep(0)  # queue in submission order
+        assert scheduler.queue_depth == len(tasks)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    return asyncio.run(scenario())
+
+
+def test_bulk_tenant_does_not_starve_others():
+    order = _service_order([(_tenant("bulk"), 6), (_tenant("clinic"), 2)])
+
+    assert order[:4] == ["bulk", "clinic", "bulk", "clinic"]
+    assert order[4:] == ["bulk"] * 4
+
+
+def test_weights_share_slots_proportionally():
+    order = _service_order([(_tenant("heavy", weight=2.0), 6), (_tenant("light"), 3)])
+
+    assert order[:6].count("heavy") == 4
+    assert order[:6].count("light") == 2
+
+
+def test_zero_rate_tenant_is_rejected_without_retry_after(monkeypatch):
+    monkeypatch.setenv("TENANT_OVERRIDES", '{"blocked": {"rate_per_minute": 0}}')
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/v1/analyze-xray",
+            files=[("files", ("film.jpg", b"\xff\xd8\xff\xe0" + bytes(64), "image/jpeg"))],
+            headers={"X-Tenant-Id": "blocked"},
+        )
+
+    assert response.status_code == 429
+    assert "retry-after" not in response.headers
+
+
+def test_rate_limited_tenant_gets_finite_retry_after():
+    tenant = Tenant("t", rate_per_minute=1, burst=1, daily_spend_limit=0, weight=1)
+    tenant.check()
+
+    with pytest.raises(QuotaExceeded) as exceeded:
+        tenant.check()
+
+    assert 1 <= int(exceeded.value.headers["Retry-After"]) <= 61
+
+
+def test_cancelled_waiters_leave_the_queue_at_once():
+    async def scenario():
+        scheduler = FairScheduler(concurrency=1)
+        await scheduler.acquire(_tenant("running"))
+        waiters = [asyncio.create_task(scheduler.acquire(_tenant(f"t{i}"))) for i in range(3)]
+        await asyncio.sleep(0)
+        depth_before = scheduler.queue_depth
+        waiters[1].cancel()
+        await asyncio.gather(waiters[1], return_exceptions=True)
+        depth_after = scheduler.queue_depth
+        scheduler.release()
+        await waiters[0]
+        return depth_before, depth_after, scheduler.queue_depth
+
+    assert asyncio.run(scenario()) == (3, 2, 1)
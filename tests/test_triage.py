@@ -0,0 +1,156 @@
+import asyncio
+import json
+
+import pytest
+
+from app.core.triage import TRIAGE_FALLBACK, get_triage_engine
+from app.prompts.triage_prompt import get_batch_triage_prompt
+from app.services.llm_provider import FakeBackend
+from app.utils.metrics import metrics
+
+VALID = FakeBackend.outputs["triage"]
+
+
+def test_valid_json_is_parsed():
+    result = get_triage_engine()._parse_triage_response(VALID)
+
+    assert result == {**json.loads(VALID), "preliminary_findings": ["clear lung fields"]}
+
+
+@pytest.mark.parametrize("response", [
+    f"Here is the triage:\n```json\n{VALID}\n```",
+    VALID[:-1] + ",}",
+    VALID.replace('"urgency"', "“urgency”"),
+    VALID.replace("null", "None"),
+])
+def test_near_valid_json_is_repaired(response):
+    result = get_triage_engine()._parse_triage_response(response)
+
+    assert result["urgency"] == "normal"
+    assert result["confidence"] == 0.92
+
+
+def test_labels_and_percentages_are_normalised():
+    response = json.dumps({"urgency": " URGENT ", "complexity": "Complex", "confidence": "85%"})
+
+    result = get_triage_engine()._parse_triage_response(response)
+
+    assert (result["urgency"], result["complexity"], result["confidence"]) == ("urgent", "complex", 0.85)
+    assert result["preliminary_findings"] == []
+
+
+@pytest.mark.parametrize("response", [
+    "I cannot assess this image.",
+    json.dumps({"urgency": "whenever", "complexity": "simple", "confidence": 0.9}),
+    json.dumps({"urgency": "normal", "complexity": "simple"}),
+])
+def test_unusable_output_falls_back_to_safe_triage(response):
+    assert get_triage_engine()._parse_triage_response(response) == TRIAGE_FALLBACK
+
+
+def test_batch_response_by_image_index():
+    entries = [
+        {**json.loads(VALID), "image": 2},
+        {"image": 1, "urgency": "bogus"},
+    ]
+
+    results = get_triage_engine()._parse_batch_response(json.dumps({"results": entries}), count=3)
+
+    assert results[0] is None and results[2] is None
+    assert results[1]["urgency"] == "normal"
+
+
+@pytest.mark.parametrize("response, outcome", [
+    (VALID, "valid"),
+    (VALID[:-1] + ",}", "repaired"),
+    (json.dumps({"urgency": "whenever", "complexity": "simple", "confidence": 0.9}), "fallback"),
+    ("```json\n{\"urgency\": \"whenever\"}\n```", "fallback"),
+])
+def test_each_response_counts_one_parse_outcome(response, outcome):
+    before = _parse_events()
+
+    get_triage_engine()._parse_triage_response(response)
+
+    after = _parse_events()
+    assert {k: after[k] - before.get(k, 0) for k in after if after[k] != before.get(k, 0)} == {outcome: 1}
+
+
+def _parse_events() -> dict:
+    counters = metrics.snapshot()["counters"]
+    return {
+        outcome: counters.get(f'triage_parse_events{{outcome="{outcome}"}}', 0)
+        for outcome in ("valid", "repaired", "fallback")
+    }
+
+
+def test_batch_prompt_is_static_and_plural():
+    two, eight = get_batch_triage_prompt("chest", count=2), get_batch_triage_prompt("chest", count=8)
+
+    assert two["user"] == eight["user"]  # one cacheable prefix for every batch size
+    assert "this X-ray image" not in two["user"]
+    assert '"results"' in two["user"]
+    assert "8 separate chest X-ray images" in eight["image_context"]
+
+
+def test_batch_parse_outcomes_are_counted_apart_from_single_images():
+    entry = {**json.loads(VALID), "image": 1}
+    before, counters = _parse_events(), metrics.snapshot()["counters"]
+
+    get_triage_engine()._parse_batch_response(json.dumps({"results": [entry]}), count=2)
+
+    after = metrics.snapshot()["counters"]
+    assert _parse_events() == before
+    key = 'triage_batch_parse_events{outcome="incomplete"}'
+    assert after[key] - counters.get(key, 0) == 1
+
+
+@pytest.mark.parametrize("confidence", [None, [0.9], {"value": 0.9}, True, "high"])
+def test_null_or_non_numeric_confidence_falls_back(confidence):
+    response = json.dumps({"urgency": "normal", "complexity": "simple", "confidence": confidence})
+    before = _parse_events()
+
+    assert get_triage_engine()._parse_triage_response(response) == TRIAGE_FALLBACK
+    assert get_triage_engine()._parses(response) is False
+    assert _parse_events()["fallback"] == before["fallback"] + 1
+
+
+def test_bad_batch_entry_only_falls_back_for_its_image(monkeypatch):
+    good = {**json.loads(VALID), "image": 2}
+    bad = {**json.loads(VALID), "image": 1, "confidence": None}
+    monkeypatch.setenv("FAKE_LLM_OUTPUTS", json.dumps({"default": json.dumps({"results": [bad, good]})}))
+    engine = get_triage_engine()
+    singles = []
+
+    async def triage_xray(images, image_type):
+        singles.append(images)
+        return dict(TRIAGE_FALLBACK)
+
+    engine.triage_xray = triage_xray
+    results = asyncio.run(engine.triage_batch(["img-1", "img-2"], "chest"))
+
+    assert singles == [["img-1"]]
+    assert results[0] == TRIAGE_FALLBACK
+    assert results[1]["urgency"] == "normal" and results[1]["batch_size"] == 2
+
+
+def test_triage_requests_json_mode():
+    assert get_triage_engine().llm.params["response_format"] == {"type": "json_object"}
+
+
+def test_schema_invalid_model_output_takes_the_parse_fallback_and_is_not_cached(monkeypatch):
+    invalid = json.dumps({"urgency": "normal", "complexity": "simple", "confidence": None})
+    monkeypatch.setenv("FAKE_LLM_OUTPUTS", json.dumps({"default": invalid}))
+    monkeypatch.setenv("LLM_CACHE_STAGES", '["triage"]')
+    before = _parse_events()
+    errors_before = metrics.snapshot()["counters"].get("triage_errors", 0)
+
+    async def scenario():
+        engine = get_triage_engine()
+        return [await engine.triage_xray(["img"], "chest") for _ in range(2)]
+
+    first, second = asyncio.run(scenario())
+
+    assert first["confidence"] == TRIAGE_FALLBACK["confidence"]  # parse fallback, not the 0.0 error path
+    assert first["reasoning"] == TRIAGE_FALLBACK["reasoning"]
+    assert _parse_events()["fallback"] == before["fallback"] + 2  # rejected by cache_if: asked again
+    assert metrics.snapshot()["counters"].get("triage_errors", 0) == errors_before